@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MercorTimetracker.settings')
 
 application = get_asgi_application()
+
+# Periodic maintenance jobs in a background thread, when SCHEDULER_AUTOSTART=True
+from Timetracker.scheduler import autostart  # noqa: E402
+
+autostart()
@@ -0,0 +1,10 @@
+"""
+The MySQL backend with pooled connections (see MercorTimetracker/db/pool.py)
+"""
+from django.db.backends.mysql import base
+
+from ..pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
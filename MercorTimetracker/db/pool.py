@@ -0,0 +1,191 @@
+"""
+Process-wide database connection pool.
+
+Django keeps one connection per thread, opened on the first query of a request and (with
+CONN_MAX_AGE=0) closed at its end, so every request of every worker pays the MySQL handshake.
+PooledDatabaseWrapperMixin makes "open" take an idle connection from a pool shared by all the
+threads of the process, and "close" hand it back. That works the same for WSGI worker threads
+and for the threads sync_to_async runs queries in under ASGI, where persistent per-thread
+connections (CONN_MAX_AGE > 0) are not an option.
+
+Enable it with the MercorTimetracker.db.mysql engine (DB_POOL_SIZE > 0 in settings), sized
+through OPTIONS["pool"]: {"max_size": 10, "timeout": 10, "max_lifetime": 3600}.
+"""
+import threading
+import time
+
+from django.db import DatabaseError
+
+
+class PoolTimeout(DatabaseError):
+    pass
+
+
+class ConnectionPool:
+    """
+    LIFO pool of DB-API connections made by connect(). At most max_size are open at once; get()
+    waits up to `timeout` seconds for one to be returned. Connections older than max_lifetime
+    seconds are closed instead of being reused.
+    """
+
+    def __init__(self, connect, max_size=10, timeout=10, max_lifetime=3600):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+
+        self._idle = []     # (connection, created at), most recently returned last
+        self._created = {}  # id(connection) -> created at, for every open connection
+        self._connecting = 0
+        self._condition = threading.Condition()
+
+        self.opened = 0
+        self.reused = 0
+        self.timeouts = 0
+
+    def expired(self, created):
+        return bool(self.max_lifetime) and time.monotonic() - created >= self.max_lifetime
+
+    def get(self, check=None):
+        """
+        Return (connection, reused): an idle connection passing check(connection), else a new one
+        while the pool has room
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._condition:
+                while not self._idle and len(self._created) + self._connecting >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f"No database connection available within {self.timeout}s "
+                                          f"({self.max_size} in use)")
+                    self._condition.wait(remaining)
+                if self._idle:
+                    connection, created = self._idle.pop()
+                else:
+                    connection = None
+                    self._connecting += 1  # Holds the slot while connecting outside the lock
+
+            if connection is None:
+                try:
+                    connection = self.connect()
+                except Exception:
+                    with self._condition:
+                        self._connecting -= 1
+                        self._condition.notify()
+                    raise
+                with self._condition:
+                    self._connecting -= 1
+                    self._created[id(connection)] = time.monotonic()
+                    self.opened += 1
+                return connection, False
+
+            if self.expired(created) or (check is not None and not check(connection)):
+                self.discard(connection)
+                continue
+            with self._condition:
+                self.reused += 1
+            return connection, True
+
+    def put(self, connection):
+        """ Give a connection back, closing it if it is too old or the pool no longer knows it """
+        with self._condition:
+            created = self._created.get(id(connection))
+            if created is not None and not self.expired(created):
+                self._idle.append((connection, created))
+                self._condition.notify()
+                return
+        self.discard(connection)
+
+    def discard(self, connection):
+        """ Close a connection taken from the pool and free its slot """
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._condition:
+            self._created.pop(id(connection), None)
+            self._condition.notify()
+
+    def close_all(self):
+        """ Close the idle connections (connections in use are closed when given back) """
+        with self._condition:
+            idle, self._idle = self._idle, []
+            for connection, _ in idle:
+                self._created.pop(id(connection), None)
+            self._condition.notify_all()
+        for connection, _ in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._condition:
+            return {
+                "size": len(self._created),
+                "idle": len(self._idle),
+                "opened": self.opened,
+                "reused": self.reused,
+                "timeouts": self.timeouts,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, connect, options):
+    """ The pool of a database alias in this process, created on first use """
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = ConnectionPool(connect, **options)
+        return _pools[alias]
+
+
+def close_pool(alias):
+    """ Close the idle connections of an alias' pool and forget it """
+    with _pools_lock:
+        pool = _pools.pop(alias, None)
+    if pool is not None:
+        pool.close_all()
+
+
+class PooledDatabaseWrapperMixin:
+    """ Makes a Django DatabaseWrapper take its connections from a ConnectionPool """
+
+    pooled_connection_reused = False
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop("pool", None)  # Not a driver argument
+        return params
+
+    def get_new_connection(self, conn_params):
+        def connect():
+            return super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params)
+
+        self.pool = get_pool(self.alias, connect, self.settings_dict["OPTIONS"].get("pool") or {})
+        check = self.pooled_connection_is_usable if self.settings_dict["CONN_HEALTH_CHECKS"] else None
+        connection, self.pooled_connection_reused = self.pool.get(check)
+        return connection
+
+    def pooled_connection_is_usable(self, connection):
+        current, self.connection = self.connection, connection
+        try:
+            return self.is_usable()
+        finally:
+            self.connection = current
+
+    def init_connection_state(self):
+        # Session settings (isolation level...) stay set on a connection that comes back
+        if not self.pooled_connection_reused:
+            super().init_connection_state()
+
+    def _close(self):
+        """ Return the connection to the pool, unless its state can't be trusted """
+        if self.in_atomic_block or self.errors_occurred or self.autocommit != self.settings_dict["AUTOCOMMIT"]:
+            self.pool.discard(self.connection)
+        else:
+            self.pool.put(self.connection)
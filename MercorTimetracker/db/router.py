@@ -0,0 +1,134 @@
+"""
+Read replica routing.
+
+Views decorated with @read_from_replica (listings, reports, dashboards) read Timetracker models
+from one of settings.DATABASE_REPLICAS; every other query, and every write, goes to "default".
+Auth and session tables always stay on the primary, so a fresh login is never missing.
+
+Replicas lag behind the primary, by at most REPLICA_STICKY_SECONDS we assume. So that a client
+sees its own changes, a successful write request (clock-in, clock-out, upload...) pins the
+client, identified by its API token or logged-in user, to the primary for that long
+(PinPrimaryAfterWriteMiddleware). Pins live in the shared cache, so settings refuse replicas
+without REDIS_URL. A request reads from a single replica, so it never sees two replication lags.
+"""
+import contextvars
+import hashlib
+import random
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_KEY_PREFIX = "replica:pin:"
+REPLICA_APP_LABELS = {"Timetracker"}
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_replica = contextvars.ContextVar("replica", default=None)  # Alias read from by the current request
+
+
+def replicas_enabled():
+    return bool(settings.DATABASE_REPLICAS)
+
+
+def client_key(request):
+    """ Who made the request: its API token, else the logged-in user (None when anonymous) """
+    from api.middleware import get_bearer_token  # Not at the top: routers load before the apps
+
+    token = get_bearer_token(request)
+    if token:
+        return "token:" + hashlib.sha256(token.encode()).hexdigest()[:32]
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return None
+
+
+def pin_cache():
+    return caches[settings.SHARED_CACHE_ALIAS or "default"]
+
+
+def pin_to_primary(request):
+    key = client_key(request)
+    if key:
+        pin_cache().set(PIN_KEY_PREFIX + key, True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_pinned(request):
+    key = client_key(request)
+    return bool(key) and bool(pin_cache().get(PIN_KEY_PREFIX + key))
+
+
+def reading_from_replica():
+    return _replica.get() is not None
+
+
+@contextmanager
+def replica_reads():
+    token = _replica.set(random.choice(settings.DATABASE_REPLICAS))
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def read_from_replica(view):
+    """ Run a read-only view against a replica, unless its client has just written """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not replicas_enabled() or is_pinned(request):
+            return view(request, *args, **kwargs)
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replica = _replica.get()
+        if replica and model._meta.app_label in REPLICA_APP_LABELS:
+            return replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Even for objects read from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        return db not in settings.DATABASE_REPLICAS
+
+
+class PinPrimaryAfterWriteMiddleware:
+    """ Pin a client to the primary after each successful write request it makes (see module docstring) """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self.pin(request, response)
+        return response
+
+    def pin(self, request, response):
+        if replicas_enabled() and request.method not in SAFE_METHODS and response.status_code < 400:
+            pin_to_primary(request)
@@ -20,6 +20,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()  # Load environment variables
@@ -52,9 +53,216 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Caches: per-process by default, plus an optional shared cache (Redis) so
+# several gunicorn workers can agree on things like token revocations
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+}
+
+if os.getenv("REDIS_URL"):
+    CACHES["shared"] = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL"),
+    }
+
+SHARED_CACHE_ALIAS = "shared" if "shared" in CACHES else None
+
+# API token verification cache (see api/cache.py)
+API_TOKEN_CACHE = {
+    "MAX_SIZE": int(os.getenv("API_TOKEN_CACHE_MAX_SIZE", 10000)),
+    "TTL": int(os.getenv("API_TOKEN_CACHE_TTL", 300)),  # Seconds a valid token is trusted
+    "NEGATIVE_MAX_SIZE": int(os.getenv("API_TOKEN_CACHE_NEGATIVE_MAX_SIZE", 10000)),
+    "NEGATIVE_TTL": int(os.getenv("API_TOKEN_CACHE_NEGATIVE_TTL", 30)),  # Seconds a bad token is remembered
+    "SHARED_CACHE": SHARED_CACHE_ALIAS,
+}
+
+# Rendered responses of the employee and project lists (see api/cache.py)
+API_RESPONSE_CACHE = {
+    "MAX_SIZE": int(os.getenv("API_RESPONSE_CACHE_MAX_SIZE", 256)),  # Pages kept per worker
+    "TTL": int(os.getenv("API_RESPONSE_CACHE_TTL", 300)),  # Upper bound on staleness after bulk writes
+    "SHARED_CACHE": SHARED_CACHE_ALIAS,
+}
+
+# Per-token rate limit of the API: an in-memory token bucket per worker refilled with RATE
+# requests per second and holding up to BURST. Requests over the limit get 429 with Retry-After.
+# 0 disables it.
+API_RATE_LIMIT = {
+    "RATE": float(os.getenv("API_RATE_LIMIT_RATE", 0)),
+    "BURST": int(os.getenv("API_RATE_LIMIT_BURST", 100)),
+}
+
+# Cursor pagination of API listings
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", 100))
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", 500))
+
+# Serve clock-in/clock-out/screenshot upload with native async views; enable when running
+# under ASGI (uvicorn/daphne), leave off under WSGI (gunicorn)
+ASYNC_API = os.getenv("ASYNC_API", "False") == "True"
+
+# Per-endpoint request metrics, served at /api/metrics (see api/metrics.py)
+API_METRICS = {
+    "ENABLED": os.getenv("API_METRICS_ENABLED", "True") == "True",
+    # Fraction of requests whose queries are counted, timed and kept for the slow log
+    "SAMPLE_RATE": float(os.getenv("API_METRICS_SAMPLE_RATE", 0.1)),
+    "SLOW_REQUEST_MS": int(os.getenv("API_METRICS_SLOW_REQUEST_MS", 1000)),
+    "SLOW_REQUEST_SQL_LIMIT": int(os.getenv("API_METRICS_SLOW_REQUEST_SQL_LIMIT", 20)),  # Statements logged
+}
+
+# Maximum number of events accepted by the batch clock-in/clock-out endpoint
+CLOCK_BATCH_MAX_SIZE = int(os.getenv("CLOCK_BATCH_MAX_SIZE", 1000))
+
+# Event log sync of offline desktop clients (see Timetracker/sync.py)
+CLIENT_SYNC = {
+    "MAX_EVENTS": int(os.getenv("CLIENT_SYNC_MAX_EVENTS", 1000)),  # Per batch
+    "MAX_BODY_SIZE": int(os.getenv("CLIENT_SYNC_MAX_BODY_SIZE", 10 * 1024 * 1024)),  # Decompressed bytes
+}
+
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Screenshot storage: "local" (sharded directories under MEDIA_ROOT) or "s3" (any S3-compatible
+# object store such as AWS S3 or MinIO, needs: pip install django-storages[s3])
+SCREENSHOT_STORAGE = os.getenv("SCREENSHOT_STORAGE", "local")
+SCREENSHOT_URL_TTL = int(os.getenv("SCREENSHOT_URL_TTL", 3600))  # Seconds a signed screenshot URL stays valid
+# When set (e.g. "/protected-media/"), local screenshots are handed to nginx with X-Accel-Redirect
+# instead of being streamed by Django
+SCREENSHOT_ACCEL_REDIRECT_PREFIX = os.getenv("SCREENSHOT_ACCEL_REDIRECT_PREFIX")
+
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+    "screenshots": {
+        "BACKEND": "Timetracker.storage.ShardedFileSystemStorage",  # Stores under MEDIA_ROOT
+    },
+    # Files of archived sessions (see Timetracker/archive.py)
+    "screenshots_cold": {
+        "BACKEND": "Timetracker.storage.ShardedFileSystemStorage",
+        "OPTIONS": {"subdirectory": "cold", "alias": "screenshots_cold"},  # Stores under MEDIA_ROOT/cold
+    },
+}
+
+if SCREENSHOT_STORAGE == "s3":
+    STORAGES["screenshots"] = {
+        "BACKEND": "storages.backends.s3.S3Storage",
+        "OPTIONS": {
+            "bucket_name": os.getenv("SCREENSHOT_S3_BUCKET"),
+            "endpoint_url": os.getenv("SCREENSHOT_S3_ENDPOINT_URL"),  # e.g. http://localhost:9000 for MinIO
+            "access_key": os.getenv("SCREENSHOT_S3_ACCESS_KEY"),
+            "secret_key": os.getenv("SCREENSHOT_S3_SECRET_KEY"),
+            "region_name": os.getenv("SCREENSHOT_S3_REGION"),
+            "querystring_auth": True,  # url() returns presigned URLs
+            "querystring_expire": SCREENSHOT_URL_TTL,
+            "file_overwrite": False,
+        },
+    }
+    STORAGES["screenshots_cold"] = {
+        "BACKEND": "storages.backends.s3.S3Storage",
+        "OPTIONS": {
+            **STORAGES["screenshots"]["OPTIONS"],
+            "bucket_name": os.getenv("SCREENSHOT_COLD_S3_BUCKET", os.getenv("SCREENSHOT_S3_BUCKET")),
+            "location": "cold",
+            # Infrequent-access class: cheaper storage, archived screenshots are rarely looked at
+            "object_parameters": {"StorageClass": os.getenv("SCREENSHOT_COLD_STORAGE_CLASS", "STANDARD_IA")},
+        },
+    }
+
+# Screenshot uploads
+SCREENSHOT_MAX_SIZE = int(os.getenv("SCREENSHOT_MAX_SIZE", 20 * 1024 * 1024))  # Bytes
+SCREENSHOT_UPLOAD_CHUNK_SIZE = int(os.getenv("SCREENSHOT_UPLOAD_CHUNK_SIZE", 1024 * 1024))  # Must stay below DATA_UPLOAD_MAX_MEMORY_SIZE
+SCREENSHOT_UPLOAD_EXPIRY = int(os.getenv("SCREENSHOT_UPLOAD_EXPIRY", 24 * 3600))  # Seconds before an unfinished upload is purged
+
+# Most recent screenshots shown per session on the dashboards
+DASHBOARD_SCREENSHOTS_PER_SESSION = int(os.getenv("DASHBOARD_SCREENSHOTS_PER_SESSION", 20))
+
+# Screenshot post-processing worker (python manage.py process_screenshots)
+SCREENSHOT_PROCESSING = {
+    "THUMBNAIL_SIZE": int(os.getenv("SCREENSHOT_THUMBNAIL_SIZE", 320)),  # Longest side, in pixels
+    "THUMBNAIL_QUALITY": 70,
+    "ARCHIVE_QUALITY": int(os.getenv("SCREENSHOT_ARCHIVE_QUALITY", 80)),
+    "DUPLICATE_THRESHOLD": 5,  # Max differing dHash bits for two frames to count as near-identical
+    "MAX_ATTEMPTS": 3,
+    "RETRY_DELAY": 60,  # Seconds before the first retry of a failed job, doubled on each further one
+    "STALE_AFTER": 600,  # Seconds before a running job is assumed abandoned
+}
+
+# Screenshot capture policy sent to the desktop client at clock-in (see Timetracker/capture.py).
+# Projects can override the interval, width and quality in the admin. While the processing
+# queue is backed up clients are asked to capture less often; when the disk under MEDIA_ROOT
+# is almost full uploads are refused with 503 and Retry-After.
+CAPTURE_POLICY = {
+    "INTERVAL": int(os.getenv("CAPTURE_INTERVAL", 300)),  # Seconds between screenshots
+    "MAX_WIDTH": int(os.getenv("CAPTURE_MAX_WIDTH", 1920)),  # Pixels
+    "QUALITY": int(os.getenv("CAPTURE_QUALITY", 80)),  # JPEG quality
+    "BACKLOG_THRESHOLD": int(os.getenv("CAPTURE_BACKLOG_THRESHOLD", 1000)),  # Pending processing jobs, 0 ignores the queue
+    "MIN_FREE_DISK": int(os.getenv("CAPTURE_MIN_FREE_DISK", 1024 ** 3)),  # Bytes, 0 ignores the disk
+    "SLOWDOWN_FACTOR": 2,  # Interval multiplier while the queue is backed up
+    "RETRY_AFTER": int(os.getenv("CAPTURE_RETRY_AFTER", 300)),  # Seconds a refused client waits
+    "CHECK_INTERVAL": 10,  # Seconds the queue and disk check is reused for
+}
+
+# Who is working right now (see Timetracker/status.py): a session is stale when neither its
+# clock-in nor a screenshot was seen for STALE_AFTER seconds
+EMPLOYEE_STATUS = {
+    "STALE_AFTER": int(os.getenv("EMPLOYEE_STATUS_STALE_AFTER", 900)),
+}
+
+# Sessions of crashed or closed clients (python manage.py close_abandoned_sessions, or the
+# scheduler): open sessions with no clock-in, screenshot or activity for ABANDONED_AFTER seconds
+# are closed at their last sign of life. 0 disables it.
+SESSION_SWEEPER = {
+    "ABANDONED_AFTER": int(os.getenv("SESSION_ABANDONED_AFTER", 4 * 3600)),
+    "BATCH_SIZE": int(os.getenv("SESSION_SWEEPER_BATCH_SIZE", 500)),  # Sessions closed per transaction
+}
+
+# Live feed of the admin dashboard (see Timetracker/events.py): clock-ins, clock-outs and
+# screenshot uploads are pushed over server-sent events under ASGI, long-polled under WSGI.
+# With REDIS_URL set, events reach the dashboards served by every worker.
+LIVE_FEED = {
+    "BUFFER_SIZE": int(os.getenv("LIVE_FEED_BUFFER_SIZE", 500)),  # Events kept per worker for reconnecting dashboards
+    "POLL_TIMEOUT": int(os.getenv("LIVE_FEED_POLL_TIMEOUT", 25)),  # Seconds a long-poll waits for events
+    "KEEPALIVE": 15,  # Seconds between comments on an idle event stream
+    "REDIS_URL": os.getenv("REDIS_URL"),
+}
+
+# Archival of old closed sessions (python manage.py archive_sessions). 0 disables archival and
+# the archive lookups of the API; once sessions were archived keep it set, or they disappear
+# from the listings.
+ARCHIVE = {
+    "AFTER_DAYS": int(os.getenv("ARCHIVE_AFTER_DAYS", 0)),  # Archive sessions closed this many days ago
+    "BATCH_SIZE": int(os.getenv("ARCHIVE_BATCH_SIZE", 500)),  # Sessions moved per transaction
+}
+
+# Periodic maintenance jobs (see Timetracker/scheduler.py): seconds between runs, 0 disables.
+# Run them with "python manage.py run_scheduler", or set SCHEDULER_AUTOSTART=True to run them
+# in a thread of each web worker.
+SCHEDULER = {
+    "AUTOSTART": os.getenv("SCHEDULER_AUTOSTART", "False") == "True",
+    "INTERVALS": {
+        "archive_sessions": int(os.getenv("SCHEDULE_ARCHIVE_SESSIONS", 24 * 3600)),
+        "downsample_activity": int(os.getenv("SCHEDULE_DOWNSAMPLE_ACTIVITY", 24 * 3600)),
+        "close_abandoned_sessions": int(os.getenv("SCHEDULE_CLOSE_ABANDONED_SESSIONS", 900)),
+        "purge_screenshot_uploads": int(os.getenv("SCHEDULE_PURGE_SCREENSHOT_UPLOADS", 3600)),
+    },
+}
+
+# Activity sample ingestion (see Timetracker/activity.py)
+ACTIVITY_INGEST = {
+    "MAX_SAMPLES": int(os.getenv("ACTIVITY_MAX_SAMPLES", 5000)),  # Per batch
+    "MAX_BODY_SIZE": int(os.getenv("ACTIVITY_MAX_BODY_SIZE", 5 * 1024 * 1024)),  # Decompressed bytes
+    "BUFFER_SIZE": int(os.getenv("ACTIVITY_BUFFER_SIZE", 5000)),  # Samples buffered before a flush, 0 writes through
+    "FLUSH_INTERVAL": float(os.getenv("ACTIVITY_FLUSH_INTERVAL", 5)),  # Max seconds a sample waits in the buffer
+    "MAX_BUFFERED": int(os.getenv("ACTIVITY_MAX_BUFFERED", 50000)),  # Then batches get 503 until the buffer drains
+    "RETRY_AFTER": int(os.getenv("ACTIVITY_RETRY_AFTER", 30)),  # Seconds a refused client waits
+    "BULK_BATCH_SIZE": 1000,  # Rows per INSERT
+    "RAW_RETENTION_DAYS": int(os.getenv("ACTIVITY_RAW_RETENTION_DAYS", 7)),  # Then folded into per-minute rows
+}
+
 from django.conf import settings
 def global_settings(request):
     return {
@@ -76,11 +284,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.RequestMetricsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    "MercorTimetracker.db.router.PinPrimaryAfterWriteMiddleware",
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "api.middleware.APITokenMiddleware",
@@ -110,17 +320,54 @@ WSGI_APPLICATION = 'MercorTimetracker.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Connections: DB_CONN_MAX_AGE keeps each thread's connection open across requests (WSGI).
+# DB_POOL_SIZE > 0 shares a pool of connections between the threads of a worker instead, which
+# also works under ASGI (see MercorTimetracker/db/pool.py); leave DB_CONN_MAX_AGE at 0 with it.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'MercorTimetracker.db.mysql' if DB_POOL_SIZE else 'django.db.backends.mysql',
         'NAME': os.getenv("DB_NAME"),
         'USER': os.getenv("DB_USER"),
         'PASSWORD': os.getenv("DB_PASSWORD"),
         'HOST': os.getenv("DB_HOST"),
         'PORT': os.getenv("DB_PORT"),
+        # Seconds; per-thread persistent connections don't suit ASGI, use the pool there
+        'CONN_MAX_AGE': int(os.getenv("DB_CONN_MAX_AGE", 0 if DB_POOL_SIZE or ASYNC_API else 60)),
+        'CONN_HEALTH_CHECKS': os.getenv("DB_CONN_HEALTH_CHECKS", "True") == "True",  # Ping reused connections
+        'OPTIONS': {},
     }
 }
 
+if DB_POOL_SIZE:
+    DATABASES['default']['OPTIONS']['pool'] = {
+        "max_size": DB_POOL_SIZE,  # Per worker process
+        "timeout": int(os.getenv("DB_POOL_TIMEOUT", 10)),  # Seconds a request waits for a free connection
+        "max_lifetime": int(os.getenv("DB_POOL_MAX_LIFETIME", 3600)),  # Below MySQL's wait_timeout
+    }
+
+# Read replicas of the default database (host or host:port, comma separated) serving the
+# listings, reports and dashboards (see MercorTimetracker/db/router.py). After a write, a client
+# reads from the primary for REPLICA_STICKY_SECONDS, which should exceed the replication lag.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(",")), start=1):
+    host, _, port = replica.strip().partition(":")
+    DATABASES[f"replica{number}"] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},  # Tests read what they wrote
+    }
+    DATABASE_REPLICAS.append(f"replica{number}")
+
+DATABASE_ROUTERS = ["MercorTimetracker.db.router.ReplicaRouter"]
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 5))
+if DATABASE_REPLICAS and not SHARED_CACHE_ALIAS:
+    # With per-worker pins, the next request of a client may hit another worker and a lagging replica
+    raise ImproperlyConfigured("DB_REPLICA_HOSTS requires REDIS_URL: clients are pinned to the primary in the shared cache")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MercorTimetracker.settings')
 
 application = get_wsgi_application()
+
+# Periodic maintenance jobs in a background thread, when SCHEDULER_AUTOSTART=True
+from Timetracker.scheduler import autostart  # noqa: E402
+
+autostart()
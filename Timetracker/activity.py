@@ -0,0 +1,261 @@
+"""
+Activity sample ingestion: decoding of the compact batches sent by the desktop client, a
+server-side write buffer, and downsampling of old samples into per-minute aggregates.
+
+A batch is a JSON object, optionally gzip/deflate compressed (Content-Encoding):
+
+    {"work_session": 12, "start": 1760000000, "apps": ["Code", "Chrome"],
+     "samples": [[0, 1, 0], [5, 1, 1], [10, 0, null]]}
+
+Each sample is [seconds after start, active (1) or idle (0), index in apps or null].
+"""
+import atexit
+import logging
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils.timezone import now
+
+from .models import ActivityMinute, ActivitySample, WorkSession
+
+logger = logging.getLogger(__name__)
+
+# Samples may be stamped slightly outside their session because of clock drift on the client
+CLOCK_SKEW = timedelta(minutes=1)
+
+
+def _config(key):
+    return settings.ACTIVITY_INGEST[key]
+
+
+class InvalidBatch(ValueError):
+    pass
+
+
+def decompress(body, encoding, max_size):
+    """ Undo the Content-Encoding of a request body, refusing to inflate past max_size bytes """
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        data = body
+    elif encoding in ("gzip", "deflate"):
+        # wbits=47 auto-detects zlib and gzip headers
+        decompressor = zlib.decompressobj(47)
+        try:
+            data = decompressor.decompress(body, max_size + 1)
+        except zlib.error:
+            raise InvalidBatch("Body is not valid gzip/deflate data")
+    else:
+        raise InvalidBatch(f"Unsupported Content-Encoding: {encoding}")
+    if len(data) > max_size:
+        raise InvalidBatch(f"Batch is larger than {max_size} bytes")
+    return data
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def decode_samples(batch, session, max_samples):
+    """
+    Turn a decoded batch into unsaved ActivitySample rows for session.
+    Returns (samples, rejected) where rejected counts samples outside the session.
+    """
+    try:
+        start = datetime.fromtimestamp(float(batch["start"]), tz=timezone.utc)
+        apps = [str(app)[:255] for app in batch.get("apps") or []]
+        rows = batch["samples"]
+    except (KeyError, TypeError, ValueError, OverflowError, OSError):
+        raise InvalidBatch("'start' (epoch seconds) and 'samples' are required")
+    if not isinstance(rows, list):
+        raise InvalidBatch("'samples' must be a list")
+    if len(rows) > max_samples:
+        raise InvalidBatch(f"A batch holds at most {max_samples} samples")
+
+    earliest = session.clock_in - CLOCK_SKEW
+    latest = (session.clock_out or now()) + CLOCK_SKEW
+    samples, rejected = [], 0
+    for row in rows:
+        try:
+            offset, active, app_index = row
+            timestamp = start + timedelta(seconds=float(offset))
+        except (TypeError, ValueError, OverflowError):
+            raise InvalidBatch("Each sample must be [offset, active, app index or null]")
+        # Strict ints: "0" would be truthy and a negative index would pick an app from the end
+        if not _is_int(active) or active not in (0, 1):
+            raise InvalidBatch("Sample activity must be 1 (active) or 0 (idle)")
+        if app_index is not None and (not _is_int(app_index) or not 0 <= app_index < len(apps)):
+            raise InvalidBatch("Sample app index must be null or an index in 'apps'")
+        app = apps[app_index] if app_index is not None else ""
+        if not earliest <= timestamp <= latest:
+            rejected += 1
+            continue
+        samples.append(ActivitySample(work_session=session, timestamp=timestamp, is_active=bool(active), app=app))
+    return samples, rejected
+
+
+class ActivityBuffer:
+    """
+    Collects samples from all requests of this process and writes them with bulk_create once
+    max_size samples are waiting or the oldest has waited max_age seconds. Buffered samples
+    are lost if the process dies, so keep max_age short (or max_size 0 to write through).
+    With no max_age, samples are only written once max_size is reached or flush() is called.
+    A failed flush keeps the samples for the next one; once max_pending samples are waiting
+    the buffer is full() and callers should refuse new samples.
+    """
+
+    def __init__(self, max_size=5000, max_age=5.0, batch_size=1000, max_pending=None):
+        self.max_size = max_size
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self._samples = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flusher = None
+
+        self.flushed = 0
+        self.dropped = 0
+
+    def add(self, samples):
+        """ Buffer samples, flushing right away if the buffer is full or too old """
+        if not samples:
+            return
+        with self._lock:
+            self._samples.extend(samples)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = (len(self._samples) >= self.max_size
+                   or bool(self.max_age) and time.monotonic() - self._oldest >= self.max_age)
+        if due:
+            try:
+                self.flush()
+            except Exception:
+                # The samples stay buffered: the flusher thread or the next request writes them
+                logger.exception("Flushing the activity buffer failed")
+                self._start_flusher()
+        else:
+            self._start_flusher()
+
+    def pending(self):
+        with self._lock:
+            return len(self._samples)
+
+    def full(self):
+        return self.max_pending is not None and self.pending() >= self.max_pending
+
+    def flush(self):
+        """ Write every buffered sample; returns how many were written """
+        with self._lock:
+            samples, self._samples, self._oldest = self._samples, [], None
+        if not samples:
+            return 0
+        try:
+            written = self._write(samples)
+        except Exception:
+            # The buffer holds other requests' samples too: put them back for the next flush
+            with self._lock:
+                self._samples[:0] = samples
+                self._oldest = time.monotonic()
+            raise
+        self.flushed += written
+        return written
+
+    def _write(self, samples):
+        try:
+            ActivitySample.objects.bulk_create(samples, batch_size=self.batch_size)
+        except IntegrityError:
+            # A session was deleted while its samples were buffered: keep the others
+            session_ids = set(WorkSession.objects.filter(
+                id__in={sample.work_session_id for sample in samples}).values_list("id", flat=True))
+            kept = [sample for sample in samples if sample.work_session_id in session_ids]
+            ActivitySample.objects.bulk_create(kept, batch_size=self.batch_size)
+            self.dropped += len(samples) - len(kept)
+            samples = kept
+        return len(samples)
+
+    def _start_flusher(self):
+        """ Background thread flushing on age when no new request comes in to do it """
+        if self._flusher is not None or not self.max_age:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_periodically, name="activity-buffer", daemon=True)
+        self._flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.max_age)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing the activity buffer failed")
+
+
+def _build_activity_buffer():
+    buffer = ActivityBuffer(
+        max_size=_config("BUFFER_SIZE"),
+        max_age=_config("FLUSH_INTERVAL"),
+        batch_size=_config("BULK_BATCH_SIZE"),
+        max_pending=_config("MAX_BUFFERED"),
+    )
+    atexit.register(buffer.flush)
+    return buffer
+
+
+activity_buffer = _build_activity_buffer()
+
+
+def _minute(timestamp):
+    return timestamp.astimezone(timezone.utc).replace(second=0, microsecond=0)
+
+
+def downsample_activity(older_than, chunk_size=5000):
+    """
+    Fold raw samples stamped before older_than into ActivityMinute rows and delete them.
+    Works in chunks of chunk_size samples; returns the number of samples folded.
+    """
+    folded = 0
+    while True:
+        rows = list(ActivitySample.objects.filter(timestamp__lt=older_than).order_by("id")
+                    .values_list("id", "work_session_id", "timestamp", "is_active", "app")[:chunk_size])
+        if not rows:
+            return folded
+
+        totals = {}
+        for _, session_id, timestamp, is_active, app in rows:
+            key = (session_id, _minute(timestamp), app)
+            samples, active = totals.get(key, (0, 0))
+            totals[key] = (samples + 1, active + is_active)
+
+        with transaction.atomic():
+            # Minutes already folded by an earlier run (samples arriving late) are added to
+            existing = {
+                (row.work_session_id, _minute(row.minute), row.app): row
+                for row in ActivityMinute.objects.select_for_update().filter(
+                    work_session_id__in={key[0] for key in totals}, minute__in={key[1] for key in totals})
+            }
+            updated, created = [], []
+            for key, (samples, active) in totals.items():
+                row = existing.get(key)
+                if row:
+                    row.samples += samples
+                    row.active_samples += active
+                    updated.append(row)
+                else:
+                    created.append(ActivityMinute(work_session_id=key[0], minute=key[1], app=key[2],
+                                                  samples=samples, active_samples=active))
+            ActivityMinute.objects.bulk_update(updated, ["samples", "active_samples"], batch_size=chunk_size)
+            ActivityMinute.objects.bulk_create(created, batch_size=chunk_size)
+            ActivitySample.objects.filter(id__in=[row[0] for row in rows]).delete()
+        folded += len(rows)
+
+
+def default_cutoff():
+    """ Samples older than this are downsampled (settings.ACTIVITY_INGEST["RAW_RETENTION_DAYS"]) """
+    return now() - timedelta(days=_config("RAW_RETENTION_DAYS"))
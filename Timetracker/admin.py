@@ -3,7 +3,7 @@ from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin
 from django.contrib import admin
 from.views import send_activation_email
-from .models import Employee, Project
+from .models import CapturePolicy, Employee, Project
 
 # Create a Custom Form Without Password Fields
 class CustomUserCreationForm(forms.ModelForm):
@@ -60,10 +60,15 @@ class CustomUserAdmin(UserAdmin):
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
 
+class CapturePolicyInline(admin.StackedInline):
+    """ Screenshot interval, width and quality of the project's sessions """
+    model = CapturePolicy
+
 @admin.register(Project)
 class ProjectAdmin(admin.ModelAdmin):
     list_display = ("name", "start_date")
     search_fields = ("name",)
+    inlines = [CapturePolicyInline]
 
 @admin.register(Employee)
 class EmployeeAdmin(admin.ModelAdmin):
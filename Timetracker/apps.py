@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TimetrackerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Timetracker'
+
+    def ready(self):
+        from . import signals  # Registers the screenshot processing queue
@@ -0,0 +1,159 @@
+"""
+Archival of old closed work sessions.
+
+Sessions closed more than ARCHIVE["AFTER_DAYS"] days ago are moved, with their screenshot
+metadata and per-minute activity, to the Archived* tables, and their screenshot files are copied
+to cold storage (settings.STORAGES["screenshots_cold"]). The live tables, and the indexes every
+clock-in, clock-out and listing query walks, then only hold recent data.
+
+Archived sessions keep their id and still count in the DailyHours rollups. The API listings and
+the export fall back to the archive tables (see archive_watermark()).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils.timezone import now
+
+from .activity import CLOCK_SKEW, downsample_activity
+from .models import (
+    ActivityMinute, ArchivedActivityMinute, ArchivedScreenshot, ArchivedWorkSession, Screenshot, WorkSession,
+)
+from .rollups import rollups_frozen
+from .screenshots import screenshot_storage
+
+logger = logging.getLogger(__name__)
+
+SCREENSHOT_FILE_FIELDS = ("image_path", "thumbnail_path", "archive_path")
+NAME_CHUNK_SIZE = 500  # File names checked per query before deleting hot copies
+
+
+def archive_enabled():
+    return settings.ARCHIVE["AFTER_DAYS"] > 0
+
+
+def archive_watermark():
+    """
+    Every archived session was clocked in (and out) before this time, so a listing whose
+    rows are all newer never needs to look at the archive. None when archival is disabled.
+    """
+    if not archive_enabled():
+        return None
+    return now() - timedelta(days=settings.ARCHIVE["AFTER_DAYS"])
+
+
+def copy_to_cold_storage(names):
+    """ Copy files to cold storage under the same names; files already there are skipped """
+    hot, cold = screenshot_storage(), screenshot_storage(ArchivedScreenshot.storage_alias)
+    for name in names:
+        if cold.exists(name):
+            continue
+        if not hot.exists(name):
+            logger.warning("Screenshot file %s is missing, not archived", name)
+            continue
+        with hot.open(name, "rb") as f:
+            cold.save(name, f)
+
+
+def files_in_use(names):
+    """ Those of names that a live screenshot refers to """
+    in_use = Q()
+    for field in SCREENSHOT_FILE_FIELDS:
+        in_use |= Q(**{f"{field}__in": names})
+    used = set()
+    for row in Screenshot.objects.filter(in_use).values_list(*SCREENSHOT_FILE_FIELDS):
+        used.update(row)
+    return used & set(names)
+
+
+def restore_hot_files(names):
+    """ Copy files back from cold storage where hot storage no longer has them """
+    hot, cold = screenshot_storage(), screenshot_storage(ArchivedScreenshot.storage_alias)
+    for name in names:
+        if hot.exists(name) or not cold.exists(name):
+            continue
+        with cold.open(name, "rb") as f:
+            hot.save(name, f)
+
+
+def release_hot_files(names):
+    """
+    Delete files from hot storage once no live screenshot refers to them (blobs are shared).
+    An upload may be deduplicated to a file while it is being deleted: references are checked
+    again afterwards and such files restored from their cold copy. A screenshot saved after that
+    check restores its own files (see keep_screenshot_files_hot in signals.py).
+    """
+    hot = screenshot_storage()
+    for start in range(0, len(names), NAME_CHUNK_SIZE):
+        chunk = names[start:start + NAME_CHUNK_SIZE]
+        released = sorted(set(chunk) - files_in_use(chunk))
+        for name in released:
+            hot.delete(name)
+        if released:
+            restore_hot_files(files_in_use(released))
+
+
+def archive_batch(sessions):
+    """ Move a list of closed WorkSession objects (and their screenshots and activity) to the archive """
+    ids = [session.id for session in sessions]
+    shots = list(Screenshot.objects.filter(work_session_id__in=ids))
+    names = sorted({getattr(shot, field) for shot in shots for field in SCREENSHOT_FILE_FIELDS} - {None, ""})
+
+    # Copy first: if anything below fails the rows stay live and the copies are simply reused
+    copy_to_cold_storage(names)
+
+    with transaction.atomic(), rollups_frozen():
+        ArchivedWorkSession.objects.bulk_create([
+            ArchivedWorkSession(
+                id=session.id, employee_id=session.employee_id, project_id=session.project_id,
+                clock_in=session.clock_in, clock_out=session.clock_out, duration=session.duration,
+                ip_address=session.ip_address, mac_address=session.mac_address, close_reason=session.close_reason)
+            for session in sessions
+        ])
+        ArchivedScreenshot.objects.bulk_create([
+            ArchivedScreenshot(
+                id=shot.id, work_session_id=shot.work_session_id, timestamp=shot.timestamp,
+                image_path=shot.image_path, content_hash=shot.content_hash, thumbnail_path=shot.thumbnail_path,
+                archive_path=shot.archive_path, perceptual_hash=shot.perceptual_hash,
+                is_near_duplicate=shot.is_near_duplicate)
+            for shot in shots
+        ])
+        ArchivedActivityMinute.objects.bulk_create([
+            ArchivedActivityMinute(work_session_id=minute.work_session_id, minute=minute.minute, app=minute.app,
+                                   samples=minute.samples, active_samples=minute.active_samples)
+            for minute in ActivityMinute.objects.filter(work_session_id__in=ids)
+        ])
+        # Cascades to screenshots, their jobs, pending uploads and activity rows
+        WorkSession.objects.filter(id__in=ids).delete()
+
+    release_hot_files(names)
+    return len(shots)
+
+
+def archive_sessions(batch_size=None, limit=None):
+    """
+    Archive every session closed before the watermark, batch_size sessions per transaction
+    (at most `limit` sessions in total). Returns (sessions, screenshots) archived.
+    """
+    watermark = archive_watermark()
+    if watermark is None:
+        return 0, 0
+    batch_size = batch_size or settings.ARCHIVE["BATCH_SIZE"]
+
+    # Raw samples of the sessions about to go are folded into minutes first
+    downsample_activity(watermark + CLOCK_SKEW)
+
+    # clock_in < clock_out, so the clock_in bound lets the (clock_in) index do the seek
+    candidates = (WorkSession.objects.filter(clock_in__lt=watermark, clock_out__lt=watermark)
+                  .order_by("id"))
+    archived = screenshots = 0
+    while limit is None or archived < limit:
+        size = batch_size if limit is None else min(batch_size, limit - archived)
+        sessions = list(candidates[:size])
+        if not sessions:
+            break
+        screenshots += archive_batch(sessions)
+        archived += len(sessions)
+    return archived, screenshots
@@ -0,0 +1,113 @@
+"""
+Screenshot capture policy and ingest backpressure.
+
+The desktop client gets its capture policy (seconds between screenshots, maximum width, JPEG
+quality) with the clock-in response, or from /api/capture-policy/. Defaults come from
+settings.CAPTURE_POLICY and a project can override them with a CapturePolicy row.
+
+The server also tells clients to back off when it cannot keep up:
+
+- "busy": more than BACKLOG_THRESHOLD screenshots wait for post-processing. Uploads are still
+  accepted, but policies come with a longer interval and uploads answer with an
+  X-Capture-Slowdown header the client multiplies its interval by.
+- "full": less than MIN_FREE_DISK bytes are free for local screenshot storage. Uploads are
+  refused with 503 and a Retry-After header until space is freed.
+
+The check runs at most once per CHECK_INTERVAL seconds per process.
+"""
+import os
+import shutil
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import CapturePolicy, ScreenshotJob
+from .screenshots import screenshot_storage
+
+LOAD_OK = "ok"
+LOAD_BUSY = "busy"
+LOAD_FULL = "full"
+
+
+def _config(key):
+    return settings.CAPTURE_POLICY[key]
+
+
+def free_disk_space():
+    """ Free bytes on the volume of the screenshot storage, None for remote storages (S3...) """
+    try:
+        path = screenshot_storage().path("")
+    except NotImplementedError:
+        return None
+    # The storage directory is only created with the first file
+    while not os.path.isdir(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return shutil.disk_usage(path).free
+
+
+def measure_load():
+    min_free = _config("MIN_FREE_DISK")
+    if min_free:
+        free = free_disk_space()
+        if free is not None and free < min_free:
+            return LOAD_FULL
+
+    threshold = _config("BACKLOG_THRESHOLD")
+    if threshold:
+        # Counting stops past the threshold, so a huge backlog costs no more than a small one
+        pending = ScreenshotJob.objects.filter(status=ScreenshotJob.PENDING).values("id")[:threshold + 1]
+        if pending.count() > threshold:
+            return LOAD_BUSY
+    return LOAD_OK
+
+
+class IngestMonitor:
+    """ measure_load(), reused for CHECK_INTERVAL seconds """
+
+    def __init__(self):
+        self._state = LOAD_OK
+        self._checked = None
+        self._lock = threading.Lock()
+
+    def fresh(self):
+        return self._checked is not None and time.monotonic() - self._checked < _config("CHECK_INTERVAL")
+
+    def state(self):
+        if self.fresh():
+            return self._state
+        state = measure_load()
+        with self._lock:
+            self._state, self._checked = state, time.monotonic()
+        return state
+
+    async def astate(self):
+        if self.fresh():
+            return self._state
+        return await sync_to_async(self.state)()
+
+    def reset(self):
+        with self._lock:
+            self._checked = None
+
+
+ingest_monitor = IngestMonitor()
+
+
+def slowdown(load):
+    """ Factor clients multiply their capture interval by """
+    return _config("SLOWDOWN_FACTOR") if load != LOAD_OK else 1
+
+
+def capture_policy(project_id, load=None):
+    """ Capture settings for sessions of a project (or of no project), slowed down under load """
+    policy = CapturePolicy.objects.filter(project_id=project_id).first() if project_id else None
+    load = load or ingest_monitor.state()
+    interval = (policy and policy.interval) or _config("INTERVAL")
+    return {
+        "interval": interval * slowdown(load),
+        "max_width": (policy and policy.max_width) or _config("MAX_WIDTH"),
+        "quality": (policy and policy.quality) or _config("QUALITY"),
+        "load": load,
+    }
@@ -0,0 +1,215 @@
+"""
+Live event feed of the admin dashboard.
+
+Clock-ins, clock-outs and screenshot uploads are published, once their transaction commits, to
+an in-process EventBus (see signals.py, and the bulk and async clock paths that skip save()).
+The bus keeps the last LIVE_FEED["BUFFER_SIZE"] events with increasing ids. Dashboards ask for
+the events after the last id they have, by long-polling (WSGI) or over server-sent events
+(ASGI), and wait on the bus itself: open dashboards cost no database queries.
+
+Each worker process has its own bus. With LIVE_FEED["REDIS_URL"] set, events are numbered by a
+Redis counter and relayed through a Redis channel to the bus of every worker and host serving
+dashboards, so an event has the same id everywhere and a dashboard may reconnect to any worker.
+Without Redis, ids are per process and dashboards should stay on one worker.
+
+A long-poll holds its thread for up to LIVE_FEED["POLL_TIMEOUT"] seconds: under WSGI, run
+threaded workers (gunicorn --threads) so open dashboards don't take every worker.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import formats
+from django.utils.timezone import localtime
+
+from .models import WorkSession
+from .screenshots import screenshot_url
+
+logger = logging.getLogger(__name__)
+
+CLOCK_IN = "clock_in"
+CLOCK_OUT = "clock_out"
+SCREENSHOT = "screenshot"
+EVENT_TYPES = (CLOCK_IN, CLOCK_OUT, SCREENSHOT)
+
+
+class EventBus:
+    """
+    Ring buffer of the latest events, with waiters woken on every publish: threads blocked in
+    wait(), and coroutines in await_events() (woken on their own event loop)
+    """
+
+    def __init__(self, size=500, relay=None):
+        self.relay = relay
+        self._events = deque(maxlen=size)
+        self._last_id = 0
+        self._condition = threading.Condition()
+        self._async_waiters = set()  # (loop, asyncio.Event)
+
+    @property
+    def last_id(self):
+        with self._condition:
+            return self._last_id
+
+    def publish(self, kind, data):
+        """ With a relay, the event is numbered there and comes back to every listening bus, this one included """
+        if self.relay is not None:
+            self.relay.send(kind, data)
+            return None
+        with self._condition:
+            return self.receive(self._last_id + 1, kind, data)
+
+    def receive(self, event_id, kind, data):
+        """ Store an event numbered elsewhere (ids already seen are ignored) """
+        with self._condition:
+            if event_id <= self._last_id:
+                return None
+            self._last_id = event_id
+            event = {"id": event_id, "type": kind, "data": data}
+            self._events.append(event)
+            self._condition.notify_all()
+            waiters = list(self._async_waiters)
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(waiter.set)
+        return event
+
+    def start_at(self, event_id):
+        """ Continue from the relay's numbering: events up to event_id were published before this bus listened """
+        with self._condition:
+            self._last_id = max(self._last_id, event_id)
+
+    def since(self, after):
+        """
+        (events after id `after`, reset): reset means events the client has not seen were
+        already dropped from the buffer (or this process restarted), so it must reload
+        """
+        with self._condition:
+            if after > self._last_id:
+                return [], True
+            oldest = self._events[0]["id"] if self._events else self._last_id + 1
+            return [event for event in self._events if event["id"] > after], after < oldest - 1
+
+    def wait(self, after, timeout):
+        """ since(after), blocking up to timeout seconds while there is nothing new """
+        with self._condition:
+            self._condition.wait_for(lambda: self._last_id != after, timeout)
+        return self.since(after)
+
+    async def await_events(self, after, timeout):
+        """ wait() for coroutines: the event loop is not blocked """
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._condition:
+            if self._last_id == after:
+                self._async_waiters.add(waiter)
+        if waiter in self._async_waiters:
+            try:
+                await asyncio.wait_for(waiter[1].wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._condition:
+                    self._async_waiters.discard(waiter)
+        return self.since(after)
+
+
+class RedisRelay:
+    """
+    Shares events between the buses of all processes through a Redis pub/sub channel. Events are
+    numbered with INCR on a counter and published by the same script, so they are delivered in id order.
+    """
+
+    channel = "timetracker:live-events"
+    counter = "timetracker:live-events:last-id"
+    script = """
+        local id = redis.call("INCR", KEYS[1])
+        redis.call("PUBLISH", KEYS[2], '{"id": ' .. id .. ', "event": ' .. ARGV[1] .. '}')
+        return id
+    """
+
+    def __init__(self, url):
+        import redis  # Installed along the Redis cache backend
+
+        self.client = redis.Redis.from_url(url)
+        self._send = self.client.register_script(self.script)
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def send(self, kind, data):
+        try:
+            self._send(keys=[self.counter, self.channel], args=[json.dumps({"type": kind, "data": data})])
+        except Exception:
+            logger.exception("Relaying a live event failed")
+
+    def listen(self, bus):
+        """ Start feeding the relayed events into bus (once, in a daemon thread) """
+        with self._lock:
+            if self._listener is None:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Read after subscribing: events numbered up to here are older, the bus skips them
+                bus.start_at(int(self.client.get(self.counter) or 0))
+                self._listener = threading.Thread(target=self._listen, args=(bus, pubsub), name="live-events",
+                                                  daemon=True)
+                self._listener.start()
+
+    def _listen(self, bus, pubsub):
+        for message in pubsub.listen():
+            try:
+                message = json.loads(message["data"])
+                event_id, event = int(message["id"]), message["event"]
+            except (TypeError, ValueError, KeyError):
+                continue
+            bus.receive(event_id, event["type"], event["data"])
+
+
+def _build_event_bus():
+    config = settings.LIVE_FEED
+    relay = RedisRelay(config["REDIS_URL"]) if config["REDIS_URL"] else None
+    return EventBus(size=config["BUFFER_SIZE"], relay=relay)
+
+
+event_bus = _build_event_bus()
+
+
+def listen():
+    """ Called by the feed views: only processes serving dashboards subscribe to the relay """
+    if event_bus.relay is not None:
+        event_bus.relay.listen(event_bus)
+
+
+def format_datetime(value):
+    # As the dashboard template renders dates
+    return formats.date_format(localtime(value), "DATETIME_FORMAT") if value else None
+
+
+def session_event(session):
+    return {
+        "id": session.id,
+        "employee": session.employee.user.username,
+        "project": session.project.name if session.project else None,
+        "clock_in": format_datetime(session.clock_in),
+        "clock_out": format_datetime(session.clock_out),
+        "duration": session.duration,
+    }
+
+
+def publish_sessions(session_ids):
+    sessions = WorkSession.objects.select_related("employee__user", "project").filter(id__in=session_ids)
+    for session in sessions.order_by("clock_in", "id"):
+        event_bus.publish(CLOCK_OUT if session.clock_out else CLOCK_IN, session_event(session))
+
+
+def sessions_changed(session_ids):
+    """ Publish the clock events of these sessions once the current transaction commits """
+    session_ids = list(session_ids)
+    if session_ids:
+        transaction.on_commit(lambda: publish_sessions(session_ids))
+
+
+def screenshot_added(screenshot):
+    data = {"session": screenshot.work_session_id, "url": screenshot_url(screenshot.image_path)}
+    transaction.on_commit(lambda: event_bus.publish(SCREENSHOT, data))
@@ -0,0 +1,125 @@
+import csv
+import heapq
+import json
+import zlib
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .archive import archive_watermark
+from .models import ArchivedWorkSession, WorkSession
+
+EXPORT_COLUMNS = [
+    ("id", "id"),
+    ("employee_id", "employee_id"),
+    ("username", "employee__user__username"),
+    ("project_id", "project_id"),
+    ("project", "project__name"),
+    ("clock_in", "clock_in"),
+    ("clock_out", "clock_out"),
+    ("duration", "duration"),
+    ("ip_address", "ip_address"),
+    ("mac_address", "mac_address"),
+    ("close_reason", "close_reason"),
+]
+EXPORT_FORMATS = ("csv", "ndjson")
+BLOCK_SIZE = 64 * 1024  # Bytes buffered before each yield
+
+
+def _chunked(sessions, chunk_size):
+    """ Rows of a values_list queryset ordered on (clock_in, id), fetched chunk_size at a time """
+    clock_in_index = [field for _, field in EXPORT_COLUMNS].index("clock_in")
+    page = sessions
+    while True:
+        rows = list(page[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_clock_in, last_id = rows[-1][clock_in_index], rows[-1][0]
+        page = sessions.filter(Q(clock_in__gt=last_clock_in) | Q(clock_in=last_clock_in, id__gt=last_id))
+
+
+def export_rows(start=None, end=None, project_id=None, employee_id=None, chunk_size=2000):
+    """
+    Yield work sessions as tuples (see EXPORT_COLUMNS), oldest first, without loading them all.
+
+    `start` and `end` are dates (inclusive) compared against clock_in. The employee and project
+    are joined in SQL. Rows are fetched `chunk_size` at a time by seeking past the last
+    (clock_in, id) seen: mysqlclient buffers a whole result set client-side even with
+    .iterator(), so chunked queries are what keeps memory flat on MySQL. Archived sessions
+    are merged in when the range starts before the archive watermark.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    filters = Q()
+    if start:
+        filters &= Q(clock_in__gte=timezone.make_aware(datetime.combine(start, time.min)))
+    if end:
+        filters &= Q(clock_in__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)))
+    if project_id:
+        filters &= Q(project_id=project_id)
+    if employee_id:
+        filters &= Q(employee_id=employee_id)
+
+    fields = [field for _, field in EXPORT_COLUMNS]
+    sources = [WorkSession.objects.filter(filters)]
+    watermark = archive_watermark()
+    if watermark and (not start or timezone.make_aware(datetime.combine(start, time.min)) < watermark):
+        sources.append(ArchivedWorkSession.objects.filter(filters))
+
+    streams = [_chunked(source.order_by("clock_in", "id").values_list(*fields), chunk_size) for source in sources]
+    clock_in_index = fields.index("clock_in")
+    yield from heapq.merge(*streams, key=lambda row: (row[clock_in_index], row[0]))
+
+
+def _value(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+class _LineBuffer:
+    """ File-like object handing back whatever csv.writer writes to it """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow([_value(value) for value in row])
+
+
+def ndjson_lines(rows):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(names, (_value(value) for value in row)))) + "\n"
+
+
+def encode_blocks(lines, compress=False):
+    """ Join lines into ~64KB byte blocks, optionally gzip-compressed on the fly """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= BLOCK_SIZE:
+            block = b"".join(buffer)
+            buffer, size = [], 0
+            block = compressor.compress(block) if compressor else block
+            if block:
+                yield block
+
+    block = b"".join(buffer)
+    if compressor:
+        block = compressor.compress(block) + compressor.flush()
+    if block:
+        yield block
+
+
+def export_stream(output_format="csv", compress=False, **filters):
+    """ Byte blocks of the whole export, ready for StreamingHttpResponse or a file """
+    lines = csv_lines if output_format == "csv" else ndjson_lines
+    return encode_blocks(lines(export_rows(**filters)), compress=compress)
@@ -0,0 +1,81 @@
+"""
+Bulk data factory for benchmarks and load tests.
+
+Everything is inserted with bulk_create, so seeding 100k sessions takes seconds instead of
+minutes. bulk_create skips save() and the post_save signals: sessions are created closed with
+their duration already set, no screenshot jobs are queued, and the DailyHours rollups are
+rebuilt once at the end.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils.timezone import now
+
+from .models import Employee, Project, Screenshot, WorkSession
+from .rollups import rebuild_rollups
+from .screenshots import blob_name
+
+SESSION_HOURS = 8  # Length of a seeded work session
+
+
+def seed(projects=10, employees=100, sessions_per_employee=20, screenshots_per_session=5,
+         prefix="bench", batch_size=2000):
+    """
+    Create projects, employees (with their users), closed work sessions one per day going back
+    from today, and screenshots spread over each session. Usernames and project names start with
+    `prefix` so several seeds can live in one database. Returns the number of rows created per model.
+    """
+    today = now().replace(hour=9, minute=0, second=0, microsecond=0)
+    password = make_password(None)  # Unusable, hashed once instead of once per user
+
+    project_rows = Project.objects.bulk_create(
+        [Project(name=f"{prefix}-project-{i}", start_date=today.date()) for i in range(projects)],
+        batch_size=batch_size)
+    # MySQL doesn't return primary keys from bulk_create, so read them back by name
+    project_rows = list(Project.objects.filter(name__startswith=f"{prefix}-project-").order_by("id"))
+
+    User.objects.bulk_create(
+        [User(username=f"{prefix}-user-{i}", password=password) for i in range(employees)], batch_size=batch_size)
+    users = User.objects.filter(username__startswith=f"{prefix}-user-").order_by("id")
+    Employee.objects.bulk_create(
+        [Employee(user=user, job_title="Benchmark", project=project_rows[i % len(project_rows)] if project_rows else None)
+         for i, user in enumerate(users)],
+        batch_size=batch_size)
+    employee_rows = list(Employee.objects.filter(user__username__startswith=f"{prefix}-user-").order_by("id"))
+
+    sessions = []
+    for employee in employee_rows:
+        for day in range(1, sessions_per_employee + 1):
+            clock_in = today - timedelta(days=day)
+            sessions.append(WorkSession(
+                employee=employee, project_id=employee.project_id, clock_in=clock_in,
+                clock_out=clock_in + timedelta(hours=SESSION_HOURS), duration=SESSION_HOURS * 3600, is_open=None))
+    WorkSession.objects.bulk_create(sessions, batch_size=batch_size)
+
+    # Every seeded screenshot points at the same (content-addressed) blob name
+    digest = hashlib.sha256(prefix.encode()).hexdigest()
+    image_path = blob_name(digest, ".png")
+    screenshot_count = 0
+    if screenshots_per_session:
+        session_ids = WorkSession.objects.filter(
+            employee__in=employee_rows).order_by("id").values_list("id", flat=True).iterator(chunk_size=batch_size)
+        batch = []
+        for session_id in session_ids:
+            batch += [Screenshot(work_session_id=session_id, image_path=image_path, content_hash=digest)
+                      for _ in range(screenshots_per_session)]
+            if len(batch) >= batch_size:
+                Screenshot.objects.bulk_create(batch, batch_size=batch_size)
+                screenshot_count += len(batch)
+                batch = []
+        Screenshot.objects.bulk_create(batch, batch_size=batch_size)
+        screenshot_count += len(batch)
+
+    rebuild_rollups()
+    return {
+        "projects": len(project_rows),
+        "employees": len(employee_rows),
+        "work_sessions": len(sessions),
+        "screenshots": screenshot_count,
+    }
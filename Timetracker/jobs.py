@@ -0,0 +1,27 @@
+""" Periodic maintenance jobs run by Timetracker/scheduler.py """
+from .activity import default_cutoff, downsample_activity
+from .archive import archive_sessions
+from .scheduler import periodic
+from .screenshots import purge_stale_uploads
+from .sweeper import close_abandoned_sessions
+
+
+@periodic("archive_sessions")
+def archive_old_sessions():
+    sessions, screenshots = archive_sessions()
+    return f"{sessions} session(s), {screenshots} screenshot(s) archived"
+
+
+@periodic("downsample_activity")
+def downsample_old_activity():
+    return f"{downsample_activity(default_cutoff())} activity sample(s) downsampled"
+
+
+@periodic("close_abandoned_sessions")
+def close_abandoned():
+    return f"{close_abandoned_sessions()} abandoned session(s) closed"
+
+
+@periodic("purge_screenshot_uploads")
+def purge_abandoned_uploads():
+    return f"{purge_stale_uploads()} abandoned screenshot upload(s) deleted"
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Timetracker.archive import archive_sessions, archive_watermark
+
+
+class Command(BaseCommand):
+    help = "Move work sessions closed more than ARCHIVE_AFTER_DAYS days ago (and their screenshots) to the archive"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="Sessions moved per transaction (default: ARCHIVE_BATCH_SIZE)")
+        parser.add_argument("--limit", type=int, help="Stop after archiving this many sessions")
+
+    def handle(self, *args, **options):
+        watermark = archive_watermark()
+        if watermark is None:
+            raise CommandError("Archival is disabled, set ARCHIVE_AFTER_DAYS")
+
+        sessions, screenshots = archive_sessions(batch_size=options["batch_size"], limit=options["limit"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {sessions} session(s) and {screenshots} screenshot(s) closed before {watermark:%Y-%m-%d}"))
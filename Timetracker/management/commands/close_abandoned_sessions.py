@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Timetracker.sweeper import abandoned_cutoff, abandoned_session_ids, close_abandoned_sessions
+
+
+class Command(BaseCommand):
+    help = ("Close open work sessions nothing was heard from (screenshot, activity) for SESSION_ABANDONED_AFTER "
+            "seconds, at their last sign of life")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="Sessions closed per transaction (default: SESSION_SWEEPER_BATCH_SIZE)")
+        parser.add_argument("--limit", type=int, help="Stop after closing this many sessions")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the abandoned sessions")
+
+    def handle(self, *args, **options):
+        cutoff = abandoned_cutoff()
+        if cutoff is None:
+            raise CommandError("The sweeper is disabled, set SESSION_ABANDONED_AFTER")
+
+        if options["dry_run"]:
+            count = len(abandoned_session_ids(cutoff, options["limit"]))
+            self.stdout.write(f"{count} session(s) abandoned since before {cutoff:%Y-%m-%d %H:%M}")
+            return
+
+        closed = close_abandoned_sessions(batch_size=options["batch_size"], limit=options["limit"])
+        self.stdout.write(self.style.SUCCESS(f"Closed {closed} session(s) abandoned since before {cutoff:%Y-%m-%d %H:%M}"))
@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import now
+
+from Timetracker.activity import activity_buffer, default_cutoff, downsample_activity
+
+
+class Command(BaseCommand):
+    help = "Fold raw activity samples older than the retention period into per-minute aggregates"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int,
+                            help="Downsample samples older than this many days (default: ACTIVITY_INGEST RAW_RETENTION_DAYS)")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Samples folded per transaction")
+
+    def handle(self, *args, **options):
+        activity_buffer.flush()
+        if options["older_than_days"] is not None:
+            cutoff = now() - timedelta(days=options["older_than_days"])
+        else:
+            cutoff = default_cutoff()
+        folded = downsample_activity(cutoff, chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Downsampled {folded} activity sample(s) older than {cutoff:%Y-%m-%d %H:%M}"))
@@ -0,0 +1,47 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from Timetracker.exports import EXPORT_FORMATS, export_stream
+
+
+class Command(BaseCommand):
+    help = "Stream work sessions to a CSV or NDJSON file (for payroll), with constant memory use"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+        parser.add_argument("--output", help="File to write (default: stdout)")
+        parser.add_argument("--gzip", action="store_true", help="Gzip the output")
+        parser.add_argument("--start", help="First clock-in date to include (YYYY-MM-DD)")
+        parser.add_argument("--end", help="Last clock-in date to include (YYYY-MM-DD)")
+        parser.add_argument("--project", type=int, help="Only sessions of this project id")
+        parser.add_argument("--employee", type=int, help="Only sessions of this employee id")
+        parser.add_argument("--chunk-size", type=int, default=2000, help="Rows fetched from the database at a time")
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be at least 1")
+        dates = {}
+        for name in ("start", "end"):
+            if options[name]:
+                dates[name] = parse_date(options[name])
+                if dates[name] is None:
+                    raise CommandError(f"--{name} must be a date (YYYY-MM-DD)")
+
+        stream = export_stream(
+            output_format=options["format"],
+            compress=options["gzip"],
+            project_id=options["project"],
+            employee_id=options["employee"],
+            chunk_size=options["chunk_size"],
+            **dates,
+        )
+
+        output = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        try:
+            for block in stream:
+                output.write(block)
+        finally:
+            if options["output"]:
+                output.close()
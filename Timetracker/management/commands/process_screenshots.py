@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Timetracker.processing import run_worker
+
+
+class Command(BaseCommand):
+    help = "Run the screenshot post-processing worker (thumbnails, archive copies, perceptual hashes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=4, help="Number of worker threads")
+        parser.add_argument("--batch-size", type=int, default=20, help="Jobs claimed per poll")
+        parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise CommandError("Pillow is required to process screenshots: pip install pillow")
+
+        processed = run_worker(
+            threads=options["threads"],
+            batch_size=options["batch_size"],
+            poll_interval=options["poll_interval"],
+            once=options["once"],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} screenshot(s)"))
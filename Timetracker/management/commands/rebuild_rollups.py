@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from Timetracker.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the DailyHours rollup table from scratch using all closed work sessions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Rows read/written per batch")
+
+    def handle(self, *args, **options):
+        rows = rebuild_rollups(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} daily hours row(s)"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from Timetracker.status import rebuild_status
+
+
+class Command(BaseCommand):
+    help = "Rebuild the EmployeeStatus table from the open work sessions and their last screenshots"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Rows read/written per batch")
+
+    def handle(self, *args, **options):
+        count = rebuild_status(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"{count} employee(s) currently working"))
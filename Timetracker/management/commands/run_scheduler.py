@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Timetracker.scheduler import TICK, interval, registered_jobs, run_forever, run_job
+
+
+class Command(BaseCommand):
+    help = "Run the periodic maintenance jobs (archival, activity downsampling...) at their SCHEDULER intervals"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--job", action="append", help="Run this job once now and exit (repeatable)")
+        parser.add_argument("--list", action="store_true", help="List the jobs and their intervals")
+        parser.add_argument("--tick", type=float, default=TICK, help="Seconds between two checks for due jobs")
+
+    def handle(self, *args, **options):
+        jobs = registered_jobs()
+        if options["list"]:
+            for name in jobs:
+                self.stdout.write(f"{name}: every {interval(name)}s" if interval(name) else f"{name}: disabled")
+            return
+
+        if options["job"]:
+            for name in options["job"]:
+                if name not in jobs:
+                    raise CommandError(f"Unknown job {name}, choose from: {', '.join(jobs)}")
+                run_job(name, force=True)
+                self.stdout.write(self.style.SUCCESS(f"Ran {name}"))
+            return
+
+        run_forever(tick=options["tick"])
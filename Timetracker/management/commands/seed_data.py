@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from Timetracker.factories import seed
+
+
+class Command(BaseCommand):
+    help = "Bulk-create projects, employees, closed work sessions and screenshots for load tests (never on production data)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--projects", type=int, default=10)
+        parser.add_argument("--employees", type=int, default=1000)
+        parser.add_argument("--sessions", type=int, default=20, help="Closed work sessions per employee")
+        parser.add_argument("--screenshots", type=int, default=5, help="Screenshots per work session")
+        parser.add_argument("--prefix", default="bench", help="Prefix of the generated usernames and project names")
+        parser.add_argument("--batch-size", type=int, default=2000, help="Rows inserted per query")
+
+    def handle(self, *args, **options):
+        counts = seed(projects=options["projects"], employees=options["employees"],
+                      sessions_per_employee=options["sessions"], screenshots_per_session=options["screenshots"],
+                      prefix=options["prefix"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(", ".join(f"{count} {name}" for name, count in counts.items())))
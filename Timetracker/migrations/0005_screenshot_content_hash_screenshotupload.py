@@ -0,0 +1,33 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:40
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0004_worksession_ip_address_worksession_mac_address_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='screenshot',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.CreateModel(
+            name='ScreenshotUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('upload_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('filename', models.CharField(blank=True, max_length=255)),
+                ('total_size', models.PositiveBigIntegerField()),
+                ('received_size', models.PositiveBigIntegerField(default=0)),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('work_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='screenshot_uploads', to='Timetracker.worksession')),
+            ],
+        ),
+    ]
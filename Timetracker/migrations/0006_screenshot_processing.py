@@ -0,0 +1,49 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0005_screenshot_content_hash_screenshotupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='screenshot',
+            name='archive_path',
+            field=models.CharField(blank=True, max_length=500, null=True),
+        ),
+        migrations.AddField(
+            model_name='screenshot',
+            name='is_near_duplicate',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='screenshot',
+            name='perceptual_hash',
+            field=models.CharField(blank=True, max_length=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='screenshot',
+            name='thumbnail_path',
+            field=models.CharField(blank=True, max_length=500, null=True),
+        ),
+        migrations.CreateModel(
+            name='ScreenshotJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('screenshot', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='job', to='Timetracker.screenshot')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='Timetracker_status_ef5a8e_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0006_screenshot_processing'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='screenshot',
+            index=models.Index(fields=['work_session', 'timestamp'], name='Timetracker_work_se_db98e9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='worksession',
+            index=models.Index(fields=['employee', 'clock_in'], name='Timetracker_employe_c962ae_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0007_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('seconds', models.PositiveBigIntegerField(default=0)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_hours', to='Timetracker.employee')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='Timetracker.project')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'employee'], name='Timetracker_day_6428d2_idx')],
+                'constraints': [models.UniqueConstraint(fields=('employee', 'project', 'day'), name='unique_daily_hours')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:45
+
+from django.db import migrations, models
+
+
+def mark_open_sessions(apps, schema_editor):
+    """
+    Closed sessions get is_open=NULL. If an employee has several open sessions only the latest
+    stays open, and each older one is closed when the next one started (rebuild_rollups then
+    counts them like any closed session)
+    """
+    WorkSession = apps.get_model("Timetracker", "WorkSession")
+    WorkSession.objects.filter(clock_out__isnull=False).update(is_open=None)
+
+    previous = {}
+    for session in WorkSession.objects.filter(clock_out__isnull=True).order_by("clock_in", "id"):
+        earlier = previous.get(session.employee_id)
+        if earlier is not None:
+            WorkSession.objects.filter(id=earlier.id).update(
+                clock_out=session.clock_in, is_open=None,
+                duration=int((session.clock_in - earlier.clock_in).total_seconds()))
+        previous[session.employee_id] = session
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0008_dailyhours'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='worksession',
+            name='clock_in_key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='worksession',
+            name='clock_out_key',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='worksession',
+            name='is_open',
+            field=models.BooleanField(default=True, editable=False, null=True),
+        ),
+        migrations.RunPython(mark_open_sessions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='worksession',
+            constraint=models.UniqueConstraint(fields=('employee', 'is_open'), name='one_open_session_per_employee'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.15 on 2026-10-18 15:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0009_worksession_open_constraint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='worksession',
+            index=models.Index(fields=['clock_in'], name='Timetracker_clock_i_4945c7_idx'),
+        ),
+    ]
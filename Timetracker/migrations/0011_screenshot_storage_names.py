@@ -0,0 +1,34 @@
+from django.db import migrations
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+
+OLD_PREFIX = "media/"
+PATH_FIELDS = ("image_path", "thumbnail_path", "archive_path")
+
+
+def to_storage_names(apps, schema_editor):
+    """ Paths were stored relative to the project root (media/screenshots/...); store storage names instead """
+    Screenshot = apps.get_model("Timetracker", "Screenshot")
+    for field in PATH_FIELDS:
+        Screenshot.objects.filter(**{f"{field}__startswith": OLD_PREFIX}).update(
+            **{field: Substr(field, len(OLD_PREFIX) + 1)})
+
+    # In-progress chunked uploads were kept as local .part files; clients simply start them again
+    apps.get_model("Timetracker", "ScreenshotUpload").objects.all().delete()
+
+
+def to_media_paths(apps, schema_editor):
+    Screenshot = apps.get_model("Timetracker", "Screenshot")
+    for field in PATH_FIELDS:
+        Screenshot.objects.filter(**{f"{field}__isnull": False}).update(**{field: Concat(Value(OLD_PREFIX), field)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0010_worksession_clock_in_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(to_storage_names, to_media_paths),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0011_screenshot_storage_names'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityMinute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField()),
+                ('app', models.CharField(blank=True, max_length=255)),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('active_samples', models.PositiveIntegerField(default=0)),
+                ('work_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_minutes', to='Timetracker.worksession')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('work_session', 'minute', 'app'), name='unique_activity_minute')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ActivitySample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('is_active', models.BooleanField()),
+                ('app', models.CharField(blank=True, max_length=255)),
+                ('work_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_samples', to='Timetracker.worksession')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['work_session', 'timestamp'], name='Timetracker_work_se_c2abb3_idx'), models.Index(fields=['timestamp'], name='Timetracker_timesta_4a4d33_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0012_activity_samples'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedWorkSession',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('clock_in', models.DateTimeField()),
+                ('clock_out', models.DateTimeField()),
+                ('duration', models.PositiveIntegerField(blank=True, null=True)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('mac_address', models.CharField(blank=True, max_length=50, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_sessions', to='Timetracker.employee')),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='Timetracker.project')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedScreenshot',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('timestamp', models.DateTimeField()),
+                ('image_path', models.CharField(max_length=500)),
+                ('content_hash', models.CharField(blank=True, max_length=64, null=True)),
+                ('thumbnail_path', models.CharField(blank=True, max_length=500, null=True)),
+                ('archive_path', models.CharField(blank=True, max_length=500, null=True)),
+                ('perceptual_hash', models.CharField(blank=True, max_length=16, null=True)),
+                ('is_near_duplicate', models.BooleanField(default=False)),
+                ('work_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='screenshots', to='Timetracker.archivedworksession')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedActivityMinute',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField()),
+                ('app', models.CharField(blank=True, max_length=255)),
+                ('samples', models.PositiveIntegerField(default=0)),
+                ('active_samples', models.PositiveIntegerField(default=0)),
+                ('work_session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_minutes', to='Timetracker.archivedworksession')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedworksession',
+            index=models.Index(fields=['employee', 'clock_in'], name='Timetracker_employe_25d03d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedworksession',
+            index=models.Index(fields=['clock_in'], name='Timetracker_clock_i_31049b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedscreenshot',
+            index=models.Index(fields=['work_session', 'timestamp'], name='Timetracker_work_se_a98dfc_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:12
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0013_archive_tables'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CapturePolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.PositiveIntegerField(blank=True, help_text='Seconds between two screenshots', null=True, validators=[django.core.validators.MinValueValidator(10)])),
+                ('max_width', models.PositiveIntegerField(blank=True, help_text='Screenshots are scaled down to this width, in pixels', null=True, validators=[django.core.validators.MinValueValidator(320)])),
+                ('quality', models.PositiveSmallIntegerField(blank=True, help_text='JPEG quality (1-100)', null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(100)])),
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='capture_policy', to='Timetracker.project')),
+            ],
+            options={
+                'verbose_name_plural': 'capture policies',
+            },
+        ),
+    ]
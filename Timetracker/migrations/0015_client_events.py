@@ -0,0 +1,33 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0014_capture_policy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device', models.CharField(max_length=64)),
+                ('sequence', models.PositiveBigIntegerField()),
+                ('kind', models.CharField(choices=[('clock_in', 'Clock-in'), ('clock_out', 'Clock-out'), ('screenshot', 'Screenshot'), ('activity', 'Activity')], max_length=16)),
+                ('occurred_at', models.DateTimeField()),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('status', models.CharField(choices=[('applied', 'Applied'), ('rejected', 'Rejected')], max_length=16)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='client_events', to='Timetracker.employee')),
+                ('work_session', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='Timetracker.worksession')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('device', 'sequence'), name='one_event_per_device_sequence')],
+            },
+        ),
+    ]
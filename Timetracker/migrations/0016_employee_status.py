@@ -0,0 +1,51 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def fill_status(apps, schema_editor):
+    """ A status row for every employee with an open session """
+    WorkSession = apps.get_model("Timetracker", "WorkSession")
+    Screenshot = apps.get_model("Timetracker", "Screenshot")
+    EmployeeStatus = apps.get_model("Timetracker", "EmployeeStatus")
+
+    last_screenshots = dict(Screenshot.objects.filter(work_session__is_open=True)
+                            .values("work_session_id").annotate(last=Max("timestamp"))
+                            .values_list("work_session_id", "last"))
+    statuses = []
+    for session in WorkSession.objects.filter(is_open=True).iterator(chunk_size=5000):
+        last_screenshot = last_screenshots.get(session.id)
+        statuses.append(EmployeeStatus(
+            employee_id=session.employee_id, work_session_id=session.id, project_id=session.project_id,
+            clocked_in_at=session.clock_in, last_screenshot_at=last_screenshot,
+            last_seen_at=max(session.clock_in, last_screenshot) if last_screenshot else session.clock_in,
+        ))
+    EmployeeStatus.objects.bulk_create(statuses, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0015_client_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmployeeStatus',
+            fields=[
+                ('employee', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='status', serialize=False, to='Timetracker.employee')),
+                ('clocked_in_at', models.DateTimeField(blank=True, null=True)),
+                ('last_screenshot_at', models.DateTimeField(blank=True, null=True)),
+                ('last_seen_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('project', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='Timetracker.project')),
+                ('work_session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='Timetracker.worksession')),
+            ],
+            options={
+                'verbose_name_plural': 'employee statuses',
+            },
+        ),
+        migrations.RunPython(fill_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0016_employee_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedworksession',
+            name='close_reason',
+            field=models.CharField(blank=True, choices=[('', 'Clocked out'), ('abandoned', 'Abandoned, closed automatically')], default='', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='worksession',
+            name='close_reason',
+            field=models.CharField(blank=True, choices=[('', 'Clocked out'), ('abandoned', 'Abandoned, closed automatically')], default='', max_length=16),
+        ),
+    ]
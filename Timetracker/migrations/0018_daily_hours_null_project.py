@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:45
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    """ Rows without a project were not kept unique: merge each employee's into one per day """
+    DailyHours = apps.get_model("Timetracker", "DailyHours")
+    duplicates = (DailyHours.objects.filter(project__isnull=True).values("employee_id", "day")
+                  .annotate(rows=Count("id"), keep=Min("id"), total=Sum("seconds")).filter(rows__gt=1))
+    for duplicate in list(duplicates):
+        rows = DailyHours.objects.filter(project__isnull=True, employee_id=duplicate["employee_id"], day=duplicate["day"])
+        rows.exclude(id=duplicate["keep"]).delete()
+        rows.update(seconds=duplicate["total"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0017_close_reason'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='dailyhours',
+            name='unique_daily_hours',
+        ),
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailyhours',
+            constraint=models.UniqueConstraint(django.db.models.functions.comparison.Coalesce('project', models.Value(0)), models.F('employee'), models.F('day'), name='unique_daily_hours'),
+        ),
+    ]
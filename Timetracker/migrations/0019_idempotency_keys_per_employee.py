@@ -0,0 +1,31 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0018_daily_hours_null_project'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='worksession',
+            name='clock_in_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='worksession',
+            name='clock_out_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='worksession',
+            constraint=models.UniqueConstraint(fields=('employee', 'clock_in_key'), name='unique_clock_in_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='worksession',
+            constraint=models.UniqueConstraint(fields=('employee', 'clock_out_key'), name='unique_clock_out_key'),
+        ),
+    ]
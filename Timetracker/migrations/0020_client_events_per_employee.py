@@ -0,0 +1,21 @@
+# Generated by Django 5.1.15 on 2026-10-18 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0019_idempotency_keys_per_employee'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='clientevent',
+            name='one_event_per_device_sequence',
+        ),
+        migrations.AddConstraint(
+            model_name='clientevent',
+            constraint=models.UniqueConstraint(fields=('employee', 'device', 'sequence'), name='one_event_per_device_sequence'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-18 17:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Timetracker', '0020_client_events_per_employee'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='screenshotjob',
+            name='run_after',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
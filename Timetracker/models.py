@@ -1,5 +1,10 @@
+import uuid
+
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
 
 class Project(models.Model):
     """ Represents a project in the system """
@@ -21,6 +26,10 @@ class Employee(models.Model):
 
 class WorkSession(models.Model):
     """ Represents a work session (clock-in and clock-out) """
+    CLOCKED_OUT = ""
+    ABANDONED = "abandoned"
+    CLOSE_REASON_CHOICES = [(CLOCKED_OUT, "Clocked out"), (ABANDONED, "Abandoned, closed automatically")]
+
     employee = models.ForeignKey(Employee, on_delete=models.CASCADE)
     project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True, blank=True)
     clock_in = models.DateTimeField()
@@ -28,13 +37,58 @@ class WorkSession(models.Model):
     duration = models.PositiveIntegerField(null=True, blank=True)  # Stored in seconds (optional)
     ip_address = models.GenericIPAddressField(null=True, blank=True)  # New field for IP
     mac_address = models.CharField(max_length=50, null=True, blank=True)  # New field for MAC
+    # True while the session is open and NULL once closed: unique indexes ignore NULLs, so the
+    # (employee, is_open) constraint allows any number of closed sessions but only one open one
+    is_open = models.BooleanField(null=True, default=True, editable=False)
+    # Client idempotency keys, unique per employee (clients choose them, so they may collide across employees)
+    clock_in_key = models.CharField(max_length=64, null=True, blank=True)
+    clock_out_key = models.CharField(max_length=64, null=True, blank=True)
+    # Why the session ended; the sweeper closes abandoned sessions (see Timetracker/sweeper.py)
+    close_reason = models.CharField(max_length=16, blank=True, default=CLOCKED_OUT, choices=CLOSE_REASON_CHOICES)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of an employee's sessions seeks on (clock_in, id);
+            # InnoDB secondary indexes carry the primary key, so id is included implicitly
+            models.Index(fields=["employee", "clock_in"]),
+            # Date range seeks of the payroll export (Timetracker/exports.py)
+            models.Index(fields=["clock_in"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["employee", "is_open"], name="one_open_session_per_employee"),
+            models.UniqueConstraint(fields=["employee", "clock_in_key"], name="unique_clock_in_key"),
+            models.UniqueConstraint(fields=["employee", "clock_out_key"], name="unique_clock_out_key"),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._rollup_state = instance.rollup_state()
+        return instance
 
+    def rollup_state(self):
+        """ What this session currently contributes to the DailyHours rollups (None while open) """
+        if not self.clock_in or not self.clock_out:
+            return None
+        return (self.employee_id, self.project_id, self.clock_in, self.clock_out)
 
     def save(self, *args, **kwargs):
-        """ Automatically calculate duration on save if clock_out is set """
+        """ Automatically calculate duration and open state on save, and keep the rollups in sync """
+        from .rollups import update_rollups
+
         if self.clock_in and self.clock_out:
             self.duration = int((self.clock_out - self.clock_in).total_seconds())
-        super().save(*args, **kwargs)
+        self.is_open = None if self.clock_out else True
+
+        old_state = getattr(self, "_rollup_state", None)
+        new_state = self.rollup_state()
+        if old_state == new_state:
+            super().save(*args, **kwargs)
+        else:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                update_rollups(old_state, new_state)
+        self._rollup_state = new_state
 
     def __str__(self):
         return f"{self.employee.user.username} - {self.clock_in} to {self.clock_out or 'Active'}"
@@ -44,6 +98,241 @@ class Screenshot(models.Model):
     work_session = models.ForeignKey(WorkSession, on_delete=models.CASCADE, related_name="screenshots")
     timestamp = models.DateTimeField(auto_now_add=True)
     image_path = models.CharField(max_length=500)  # Path to the screenshot file
+    content_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True)  # SHA-256 of the image
+    thumbnail_path = models.CharField(max_length=500, null=True, blank=True)  # Small WebP/JPEG preview
+    archive_path = models.CharField(max_length=500, null=True, blank=True)  # Recompressed full-size copy
+    perceptual_hash = models.CharField(max_length=16, null=True, blank=True)  # 64-bit dHash, hex encoded
+    is_near_duplicate = models.BooleanField(default=False)  # Looks the same as the previous frame
+
+    class Meta:
+        indexes = [models.Index(fields=["work_session", "timestamp"])]
+
+    def __str__(self):
+        return f"Screenshot for {self.work_session.employee.user.username} at {self.timestamp}"
+
+class ScreenshotUpload(models.Model):
+    """ A chunked, resumable screenshot upload that has not been committed yet """
+    upload_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    work_session = models.ForeignKey(WorkSession, on_delete=models.CASCADE, related_name="screenshot_uploads")
+    filename = models.CharField(max_length=255, blank=True)
+    total_size = models.PositiveBigIntegerField()  # Expected size in bytes
+    received_size = models.PositiveBigIntegerField(default=0)  # Bytes written so far
+    sha256 = models.CharField(max_length=64, blank=True)  # Optional checksum announced by the client
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Upload {self.upload_id} ({self.received_size}/{self.total_size} bytes)"
+
+class ScreenshotJob(models.Model):
+    """ Queued post-processing (thumbnail, archive copy, perceptual hash) for a screenshot """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (PENDING, "Pending"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    screenshot = models.OneToOneField(Screenshot, on_delete=models.CASCADE, related_name="job")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(null=True, blank=True)  # Retries of failed jobs wait until then
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self):
+        return f"Job for screenshot {self.screenshot_id} ({self.status})"
+
+class CapturePolicy(models.Model):
+    """
+    How the desktop client captures screenshots for a project's sessions (see Timetracker/capture.py);
+    empty fields fall back to settings.CAPTURE_POLICY
+    """
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, related_name="capture_policy")
+    interval = models.PositiveIntegerField(null=True, blank=True, validators=[MinValueValidator(10)],
+                                           help_text="Seconds between two screenshots")
+    max_width = models.PositiveIntegerField(null=True, blank=True, validators=[MinValueValidator(320)],
+                                            help_text="Screenshots are scaled down to this width, in pixels")
+    quality = models.PositiveSmallIntegerField(null=True, blank=True,
+                                               validators=[MinValueValidator(1), MaxValueValidator(100)],
+                                               help_text="JPEG quality (1-100)")
+
+    class Meta:
+        verbose_name_plural = "capture policies"
+
+    def __str__(self):
+        return f"Capture policy of {self.project}"
+
+class EmployeeStatus(models.Model):
+    """
+    What an employee is doing right now, kept up to date on clock-in, clock-out and screenshot
+    upload (see Timetracker/status.py). Answers "who is working" without scanning WorkSession.
+    """
+    employee = models.OneToOneField(Employee, on_delete=models.CASCADE, primary_key=True, related_name="status")
+    work_session = models.ForeignKey(WorkSession, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name="+")  # The open session, NULL when clocked out
+    project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    clocked_in_at = models.DateTimeField(null=True, blank=True)
+    last_screenshot_at = models.DateTimeField(null=True, blank=True)
+    # Latest sign of life (clock-in, screenshot or activity) while clocked in, NULL otherwise: the index
+    # finds stale sessions with a range scan over the working employees only
+    last_seen_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "employee statuses"
+
+    def __str__(self):
+        return f"{self.employee_id}: {'working' if self.work_session_id else 'off'}"
+
+class DailyHours(models.Model):
+    """ Rollup of closed work session time per employee, project and day (see Timetracker/rollups.py) """
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name="daily_hours")
+    project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True, blank=True)
+    day = models.DateField()
+    seconds = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # NULLs are distinct in a plain unique index, so time without a project is keyed on 0
+            models.UniqueConstraint(Coalesce("project", Value(0)), "employee", "day", name="unique_daily_hours"),
+        ]
+        indexes = [models.Index(fields=["day", "employee"])]
+
+    def __str__(self):
+        return f"{self.employee_id} / {self.project_id} on {self.day}: {self.seconds}s"
+
+
+class ActivitySample(models.Model):
+    """ One active/idle sample reported by the desktop client (raw, downsampled after a while) """
+    work_session = models.ForeignKey(WorkSession, on_delete=models.CASCADE, related_name="activity_samples")
+    timestamp = models.DateTimeField()
+    is_active = models.BooleanField()  # False when the user was idle
+    app = models.CharField(max_length=255, blank=True)  # Application in the foreground
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["work_session", "timestamp"]),
+            # Downsampling walks old samples in id order, bounded by timestamp
+            models.Index(fields=["timestamp"]),
+        ]
+
+    def __str__(self):
+        return f"{self.work_session_id} at {self.timestamp}: {'active' if self.is_active else 'idle'}"
+
+class ActivityMinute(models.Model):
+    """ Per-minute, per-application aggregate of downsampled activity samples """
+    work_session = models.ForeignKey(WorkSession, on_delete=models.CASCADE, related_name="activity_minutes")
+    minute = models.DateTimeField()  # Start of the minute (UTC)
+    app = models.CharField(max_length=255, blank=True)
+    samples = models.PositiveIntegerField(default=0)
+    active_samples = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["work_session", "minute", "app"], name="unique_activity_minute"),
+        ]
+
+    def __str__(self):
+        return f"{self.work_session_id} at {self.minute} ({self.app or '-'}): {self.active_samples}/{self.samples}"
+
+class ArchivedWorkSession(models.Model):
+    """
+    A closed work session moved out of WorkSession by the archive_sessions command (see
+    Timetracker/archive.py). The original id is kept, so API clients see the same session.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name="archived_sessions")
+    project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True, blank=True)
+    clock_in = models.DateTimeField()
+    clock_out = models.DateTimeField()
+    duration = models.PositiveIntegerField(null=True, blank=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    mac_address = models.CharField(max_length=50, null=True, blank=True)
+    close_reason = models.CharField(max_length=16, blank=True, default=WorkSession.CLOCKED_OUT,
+                                    choices=WorkSession.CLOSE_REASON_CHOICES)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["employee", "clock_in"]),
+            models.Index(fields=["clock_in"]),
+        ]
+
+    def __str__(self):
+        return f"Archived session {self.id}: {self.clock_in} to {self.clock_out}"
+
+class ArchivedScreenshot(models.Model):
+    """ Metadata of a screenshot of an archived session; the files live in cold storage """
+    storage_alias = "screenshots_cold"  # settings.STORAGES entry holding the files
+
+    id = models.BigIntegerField(primary_key=True)
+    work_session = models.ForeignKey(ArchivedWorkSession, on_delete=models.CASCADE, related_name="screenshots")
+    timestamp = models.DateTimeField()
+    image_path = models.CharField(max_length=500)
+    content_hash = models.CharField(max_length=64, null=True, blank=True)
+    thumbnail_path = models.CharField(max_length=500, null=True, blank=True)
+    archive_path = models.CharField(max_length=500, null=True, blank=True)
+    perceptual_hash = models.CharField(max_length=16, null=True, blank=True)
+    is_near_duplicate = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [models.Index(fields=["work_session", "timestamp"])]
+
+    def __str__(self):
+        return f"Archived screenshot {self.id} at {self.timestamp}"
+
+class ArchivedActivityMinute(models.Model):
+    """ Per-minute activity aggregate of an archived session """
+    work_session = models.ForeignKey(ArchivedWorkSession, on_delete=models.CASCADE, related_name="activity_minutes")
+    minute = models.DateTimeField()
+    app = models.CharField(max_length=255, blank=True)
+    samples = models.PositiveIntegerField(default=0)
+    active_samples = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.work_session_id} at {self.minute} ({self.app or '-'}): {self.active_samples}/{self.samples}"
+
+class ClientEvent(models.Model):
+    """
+    Append-only log of the events a desktop client recorded, possibly while offline, and synced
+    through /api/sync/events/ (see Timetracker/sync.py). Each device numbers its events; the
+    (employee, device, sequence) constraint makes resending a batch harmless.
+    """
+    CLOCK_IN = "clock_in"
+    CLOCK_OUT = "clock_out"
+    SCREENSHOT = "screenshot"
+    ACTIVITY = "activity"
+    KIND_CHOICES = [(CLOCK_IN, "Clock-in"), (CLOCK_OUT, "Clock-out"), (SCREENSHOT, "Screenshot"), (ACTIVITY, "Activity")]
+
+    APPLIED = "applied"
+    REJECTED = "rejected"
+    STATUS_CHOICES = [(APPLIED, "Applied"), (REJECTED, "Rejected")]
+
+    device = models.CharField(max_length=64)
+    sequence = models.PositiveBigIntegerField()
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name="client_events")
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    occurred_at = models.DateTimeField()  # Client clock
+    received_at = models.DateTimeField(auto_now_add=True)
+    # Kept as a bare id, without a constraint: archived sessions keep their id (see ArchivedWorkSession)
+    work_session = models.ForeignKey(WorkSession, on_delete=models.DO_NOTHING, db_constraint=False,
+                                     null=True, blank=True, related_name="+")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES)
+    error = models.CharField(max_length=255, blank=True)
+    payload = models.JSONField(default=dict, blank=True)  # The event as sent
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["employee", "device", "sequence"], name="one_event_per_device_sequence"),
+        ]
 
     def __str__(self):
-        return f"Screenshot for {self.work_session.employee.user.username} at {self.timestamp}"
\ No newline at end of file
+        return f"{self.device} #{self.sequence}: {self.kind} ({self.status})"
@@ -0,0 +1,172 @@
+import hashlib
+import io
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from . import screenshots
+from .models import Screenshot, ScreenshotJob
+
+logger = logging.getLogger(__name__)
+
+
+def _config(key):
+    return settings.SCREENSHOT_PROCESSING[key]
+
+
+def derived_name(kind, digest, extension):
+    """ Storage name of a derived artifact, sharded like the original blobs """
+    return f"{screenshots.SCREENSHOT_DIR}/{kind}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def difference_hash(image):
+    """ 64-bit dHash: compares neighbouring pixels of a 9x8 grayscale thumbnail """
+    pixels = list(image.convert("L").resize((9, 8)).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{value:016x}"
+
+
+def hamming_distance(hash_a, hash_b):
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+
+def stored_image_hash(name):
+    """ dHash of a stored screenshot, None if its file is gone """
+    from PIL import Image
+
+    try:
+        with screenshots.screenshot_storage().open(name, "rb") as f, Image.open(f) as image:
+            return difference_hash(image.convert("RGB"))
+    except FileNotFoundError:
+        return None
+
+
+def _encode_image(image, image_format, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=quality)
+    return buffer.getvalue()
+
+
+def _output_format():
+    """ WebP when Pillow was built with it, JPEG otherwise """
+    from PIL import features
+
+    return ("WEBP", ".webp") if features.check("webp") else ("JPEG", ".jpg")
+
+
+def process_screenshot(screenshot):
+    """ Build the thumbnail and archive copy, and flag near-identical consecutive frames """
+    from PIL import Image
+
+    storage = screenshots.screenshot_storage()
+    digest = screenshot.content_hash
+    if not digest:
+        with storage.open(screenshot.image_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+
+    # Deduplicated blobs share their derived artifacts too
+    sibling = (Screenshot.objects.filter(content_hash=digest, thumbnail_path__isnull=False)
+               .exclude(pk=screenshot.pk)
+               .values("thumbnail_path", "archive_path", "perceptual_hash").first())
+    if sibling:
+        screenshot.thumbnail_path = sibling["thumbnail_path"]
+        screenshot.archive_path = sibling["archive_path"]
+        screenshot.perceptual_hash = sibling["perceptual_hash"]
+    else:
+        image_format, extension = _output_format()
+        with storage.open(screenshot.image_path, "rb") as f, Image.open(f) as image:
+            image = image.convert("RGB")
+            screenshot.perceptual_hash = difference_hash(image)
+            screenshot.archive_path = screenshots.save_derived(
+                derived_name("archive", digest, extension),
+                _encode_image(image, image_format, _config("ARCHIVE_QUALITY")))
+            image.thumbnail((_config("THUMBNAIL_SIZE"), _config("THUMBNAIL_SIZE")))
+            screenshot.thumbnail_path = screenshots.save_derived(
+                derived_name("thumbs", digest, extension),
+                _encode_image(image, image_format, _config("THUMBNAIL_QUALITY")))
+
+    previous = (Screenshot.objects
+                .filter(work_session_id=screenshot.work_session_id, timestamp__lt=screenshot.timestamp)
+                .order_by("-timestamp")
+                .values("image_path", "perceptual_hash").first())
+    previous_hash = None
+    if previous:
+        # Jobs run in parallel, so the previous frame may not be processed yet: hash it here
+        previous_hash = previous["perceptual_hash"] or stored_image_hash(previous["image_path"])
+    screenshot.is_near_duplicate = bool(
+        previous_hash and hamming_distance(previous_hash, screenshot.perceptual_hash) <= _config("DUPLICATE_THRESHOLD")
+    )
+    screenshot.content_hash = digest
+    screenshot.save(update_fields=["content_hash", "thumbnail_path", "archive_path",
+                                   "perceptual_hash", "is_near_duplicate"])
+
+
+def claim_jobs(limit):
+    """ Atomically mark up to `limit` pending jobs (not waiting for a retry) as running and return their ids """
+    with transaction.atomic():
+        job_ids = list(ScreenshotJob.objects.select_for_update(skip_locked=True)
+                       .filter(status=ScreenshotJob.PENDING)
+                       .filter(Q(run_after__isnull=True) | Q(run_after__lte=now()))
+                       .order_by("created_at")
+                       .values_list("id", flat=True)[:limit])
+        ScreenshotJob.objects.filter(id__in=job_ids).update(
+            status=ScreenshotJob.RUNNING, attempts=F("attempts") + 1, updated_at=now())
+    return job_ids
+
+
+def requeue_stale_jobs():
+    """ Put back jobs left running by a worker that died, giving up on those out of attempts """
+    cutoff = now() - timedelta(seconds=_config("STALE_AFTER"))
+    stale = ScreenshotJob.objects.filter(status=ScreenshotJob.RUNNING, updated_at__lt=cutoff)
+    # An image that kills the worker would otherwise be picked up again forever
+    stale.filter(attempts__gte=_config("MAX_ATTEMPTS")).update(
+        status=ScreenshotJob.FAILED, error="Worker stopped while processing", updated_at=now())
+    return stale.update(status=ScreenshotJob.PENDING, updated_at=now())
+
+
+def retry_delay(attempts):
+    """ Exponential backoff: RETRY_DELAY after the first failure, doubled after each further one """
+    return timedelta(seconds=_config("RETRY_DELAY") * 2 ** max(attempts - 1, 0))
+
+
+def run_job(job_id):
+    close_old_connections()
+    try:
+        job = ScreenshotJob.objects.select_related("screenshot").get(id=job_id)
+        try:
+            process_screenshot(job.screenshot)
+            job.status = ScreenshotJob.DONE
+            job.error = ""
+        except Exception as e:
+            logger.exception("Screenshot job %s failed", job_id)
+            job.status = ScreenshotJob.FAILED if job.attempts >= _config("MAX_ATTEMPTS") else ScreenshotJob.PENDING
+            job.error = str(e)
+            job.run_after = now() + retry_delay(job.attempts)
+        job.save(update_fields=["status", "error", "run_after", "updated_at"])
+    finally:
+        close_old_connections()
+
+
+def run_worker(threads=4, batch_size=20, poll_interval=2.0, once=False):
+    """ Process queued jobs with a thread pool until stopped (or the queue is empty if once=True) """
+    requeue_stale_jobs()
+    processed = 0
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        while True:
+            job_ids = claim_jobs(batch_size)
+            if job_ids:
+                list(executor.map(run_job, job_ids))
+                processed += len(job_ids)
+            elif once:
+                return processed
+            else:
+                time.sleep(poll_interval)
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.db.models import F, Prefetch
+
+from .models import EmployeeStatus, Screenshot, WorkSession
+
+SESSION_FIELDS = ("id", "employee_id", "project_id", "clock_in", "clock_out", "duration")
+SCREENSHOT_FIELDS = ("id", "work_session_id", "timestamp", "image_path", "thumbnail_path", "archive_path",
+                     "is_near_duplicate")
+
+
+def session_listing(queryset=None, with_employee=True, screenshot_limit=None):
+    """
+    Work sessions with everything a listing renders loaded up front.
+
+    The employee's username and the project name are joined in, and the most recent
+    `screenshot_limit` screenshots of each session are prefetched into
+    `session.recent_screenshots` (0 skips them). The number of queries does not
+    depend on how many sessions are listed.
+    """
+    if queryset is None:
+        queryset = WorkSession.objects.all()
+    if screenshot_limit is None:
+        screenshot_limit = settings.DASHBOARD_SCREENSHOTS_PER_SESSION
+
+    fields = list(SESSION_FIELDS) + ["project__name"]
+    related = ["project"]
+    if with_employee:
+        fields += ["employee__id", "employee__user__id", "employee__user__username"]
+        related.append("employee__user")
+
+    queryset = queryset.select_related(*related).only(*fields)
+
+    if screenshot_limit:
+        recent = Screenshot.objects.only(*SCREENSHOT_FIELDS).order_by("-timestamp")[:screenshot_limit]
+        queryset = queryset.prefetch_related(Prefetch("screenshots", queryset=recent, to_attr="recent_screenshots"))
+
+    return queryset
+
+
+def session_values(queryset=None):
+    """
+    Work sessions (live or archived) as plain dicts holding what the API renders, with the
+    project name joined in SQL: no model instances are built, for the lean listing path
+    (api.serializers.work_session_rows)
+    """
+    if queryset is None:
+        queryset = WorkSession.objects.all()
+    return queryset.values("id", "employee_id", "clock_in", "clock_out", "duration", project_name=F("project__name"))
+
+
+def status_values(queryset=None):
+    """
+    EmployeeStatus rows as plain dicts with the username and project name joined in, keyed on
+    "id" (the employee id) for keyset pagination (api.serializers.employee_status_rows)
+    """
+    if queryset is None:
+        queryset = EmployeeStatus.objects.all()
+    return queryset.values("work_session_id", "clocked_in_at", "last_screenshot_at", "last_seen_at",
+                           id=F("employee_id"), username=F("employee__user__username"),
+                           project_name=F("project__name"))
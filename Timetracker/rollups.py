@@ -0,0 +1,116 @@
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+from itertools import chain
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import ArchivedWorkSession, DailyHours, WorkSession
+
+_frozen = contextvars.ContextVar("rollups_frozen", default=False)
+
+
+def split_by_day(clock_in, clock_out):
+    """ Yield (day, seconds) for each local calendar day a session overlaps, splitting at midnight """
+    start = timezone.localtime(clock_in)
+    end = timezone.localtime(clock_out)
+    while start < end:
+        next_midnight = timezone.make_aware(datetime.combine(start.date() + timedelta(days=1), time.min))
+        chunk_end = min(end, next_midnight)
+        seconds = int((chunk_end - start).total_seconds())
+        if seconds:
+            yield start.date(), seconds
+        start = chunk_end
+
+
+def _increment(employee_id, project_id, day, seconds):
+    """
+    Add seconds to a DailyHours row. Clock-outs, batches, the sweeper, sync and admin edits may
+    write the same row at once: the row is created if missing, with concurrent creations
+    ignored by the unique constraint, then incremented in place.
+    """
+    if seconds > 0:
+        DailyHours.objects.bulk_create(
+            [DailyHours(employee_id=employee_id, project_id=project_id, day=day, seconds=0)], ignore_conflicts=True)
+    DailyHours.objects.filter(employee_id=employee_id, project_id=project_id, day=day).update(
+        seconds=F("seconds") + seconds)
+
+
+def _add(employee_id, project_id, clock_in, clock_out, sign):
+    for day, seconds in split_by_day(clock_in, clock_out):
+        _increment(employee_id, project_id, day, sign * seconds)
+
+
+def update_rollups(old_state, new_state):
+    """
+    Apply the change of a session's contribution, where each state is
+    (employee_id, project_id, clock_in, clock_out) or None for an open session.
+    """
+    if old_state == new_state:
+        return
+    if old_state:
+        _add(*old_state, sign=-1)
+    if new_state:
+        _add(*new_state, sign=1)
+
+
+@contextmanager
+def rollups_frozen():
+    """ Deleting sessions inside this block leaves their time in the rollups (used by archival) """
+    token = _frozen.set(True)
+    try:
+        yield
+    finally:
+        _frozen.reset(token)
+
+
+def rollups_are_frozen():
+    return _frozen.get()
+
+
+def add_sessions(sessions):
+    """ Roll up sessions closed without going through WorkSession.save() (e.g. bulk_update) """
+    for session in sessions:
+        update_rollups(None, session.rollup_state())
+
+
+def fold_project(project_id):
+    """
+    Move a project's rollups to "no project" before the project is deleted (DailyHours.project
+    is SET_NULL, and the employee may already have time without a project on those days)
+    """
+    with transaction.atomic():
+        rows = list(DailyHours.objects.select_for_update().filter(project_id=project_id)
+                    .values_list("employee_id", "day", "seconds"))
+        DailyHours.objects.filter(project_id=project_id).delete()
+        for employee_id, day, seconds in rows:
+            _increment(employee_id, None, day, seconds)
+
+
+def rebuild_rollups(chunk_size=5000):
+    """ Recompute every DailyHours row from the closed work sessions, archived ones included """
+    with transaction.atomic():
+        # Locking the rollups first makes concurrent increments wait for the rebuild, and the
+        # sessions below are read after any increment that got in before
+        list(DailyHours.objects.select_for_update().values_list("id", flat=True))
+
+        totals = defaultdict(int)
+        columns = ("employee_id", "project_id", "clock_in", "clock_out")
+        sessions = chain(
+            WorkSession.objects.filter(clock_out__isnull=False).values_list(*columns).iterator(chunk_size=chunk_size),
+            ArchivedWorkSession.objects.values_list(*columns).iterator(chunk_size=chunk_size),
+        )
+        for employee_id, project_id, clock_in, clock_out in sessions:
+            for day, seconds in split_by_day(clock_in, clock_out):
+                totals[(employee_id, project_id, day)] += seconds
+
+        DailyHours.objects.all().delete()
+        DailyHours.objects.bulk_create(
+            (DailyHours(employee_id=employee_id, project_id=project_id, day=day, seconds=seconds)
+             for (employee_id, project_id, day), seconds in totals.items()),
+            batch_size=chunk_size,
+        )
+    return len(totals)
@@ -0,0 +1,99 @@
+"""
+Minimal scheduler for periodic maintenance jobs (archival, activity downsampling...).
+
+Jobs register with @periodic(name). Each job runs every SCHEDULER["INTERVALS"][name] seconds,
+and an interval of 0 disables it. They run from `python manage.py run_scheduler` (one long-lived
+process), or, with SCHEDULER["AUTOSTART"], in a daemon thread of every web worker started from
+wsgi.py / asgi.py.
+
+Before a run a lock is taken in the cache for the length of the interval, so several workers or
+hosts never run the same job twice in one interval. This needs the shared cache (REDIS_URL);
+with the per-process default cache each worker runs its own copy.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY_PREFIX = "scheduler:lock:"
+TICK = 30  # Seconds between two checks for due jobs
+
+_jobs = {}
+_thread = None
+_thread_lock = threading.Lock()
+
+
+def periodic(name):
+    """ Register a function as the periodic job `name` """
+    def decorator(func):
+        _jobs[name] = func
+        return func
+    return decorator
+
+
+def registered_jobs():
+    from . import jobs  # noqa: F401  (registers the built-in jobs)
+
+    return dict(_jobs)
+
+
+def interval(name):
+    return settings.SCHEDULER["INTERVALS"].get(name, 0)
+
+
+def run_job(name, force=False):
+    """
+    Run a job unless it is disabled or already ran within its interval (force runs it regardless);
+    returns whether it ran
+    """
+    if not force:
+        seconds = interval(name)
+        cache = caches[settings.SHARED_CACHE_ALIAS or "default"]
+        if not seconds or not cache.add(LOCK_KEY_PREFIX + name, time.time(), seconds):
+            return False
+
+    close_old_connections()
+    started = time.monotonic()
+    try:
+        result = registered_jobs()[name]()
+    except Exception:
+        logger.exception("Scheduled job %s failed", name)
+    else:
+        logger.info("Scheduled job %s done in %.1fs: %s", name, time.monotonic() - started, result)
+    finally:
+        close_old_connections()
+    return True
+
+
+def run_pending(last_runs):
+    """ Run every job whose interval elapsed since its last run here (last_runs: name -> monotonic time) """
+    for name in registered_jobs():
+        seconds = interval(name)
+        if not seconds:
+            continue
+        if time.monotonic() - last_runs.get(name, float("-inf")) >= seconds:
+            last_runs[name] = time.monotonic()
+            run_job(name)
+
+
+def run_forever(tick=TICK):
+    last_runs = {}
+    while True:
+        run_pending(last_runs)
+        time.sleep(tick)
+
+
+def autostart():
+    """ Start the scheduler thread in this process if SCHEDULER["AUTOSTART"] is set (called by wsgi/asgi) """
+    global _thread
+    if not settings.SCHEDULER["AUTOSTART"]:
+        return
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=run_forever, name="scheduler", daemon=True)
+            _thread.start()
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import transaction
+from django.utils.timezone import now
+
+SCREENSHOT_DIR = "screenshots"
+UPLOAD_DIR = "screenshots/uploads"
+ALLOWED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp"}
+
+
+def screenshot_storage(alias="screenshots"):
+    """ Storage backend holding screenshot files (settings.STORAGES["screenshots"], or the cold archive) """
+    return storages[alias]
+
+
+def image_extension(filename):
+    """ Return a safe file extension for an uploaded screenshot (defaults to .png) """
+    extension = os.path.splitext(filename or "")[1].lower()
+    return extension if extension in ALLOWED_EXTENSIONS else ".png"
+
+
+def blob_name(digest, extension):
+    """
+    Content-addressed storage name for a screenshot, e.g. screenshots/ab/cd/abcd...png.
+
+    Blobs are sharded on the first two bytes of their SHA-256 so no single directory
+    (or object-store prefix) ends up holding millions of files.
+    """
+    return f"{SCREENSHOT_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def chunk_name(upload_id, offset):
+    """ Storage name of one received chunk of a resumable upload """
+    return f"{UPLOAD_DIR}/{upload_id}/{offset:012d}"
+
+
+def screenshot_url(name, alias="screenshots"):
+    """
+    Signed URL clients fetch the file from directly (object store or web server), so image
+    bytes never go through Django. URLs are cached for half their lifetime so repeated page
+    views hand out the same, browser-cacheable URL.
+    """
+    if not name:
+        return None
+    key = f"screenshot-url:{alias}:{name}"
+    url = cache.get(key)
+    if url is None:
+        url = screenshot_storage(alias).url(name)
+        cache.set(key, url, settings.SCREENSHOT_URL_TTL // 2)
+    return url
+
+
+def find_blob(digest):
+    """ Return the storage name of an already stored screenshot with this content, if any """
+    from .models import Screenshot
+
+    return (Screenshot.objects.filter(content_hash=digest)
+            .values_list("image_path", flat=True).first())
+
+
+def store_blob(file, digest, extension):
+    """
+    Save a fully received file under its content-addressed name and return that name.
+    If identical content is already stored, nothing is written.
+    """
+    storage = screenshot_storage()
+    name = blob_name(digest, extension)
+    if storage.exists(name):
+        return name
+    file.seek(0)
+    return _save_once(storage, name, File(file, name=os.path.basename(name)))
+
+
+def save_derived(name, data):
+    """ Save a derived artifact (thumbnail, archive copy) unless it already exists """
+    storage = screenshot_storage()
+    if storage.exists(name):
+        return name
+    return _save_once(storage, name, ContentFile(data))
+
+
+def _save_once(storage, name, content):
+    """
+    Save content under its content-addressed name. A concurrent save of the same content may
+    get there first, and storage then saves ours under another name: drop that copy
+    """
+    saved = storage.save(name, content)
+    if saved != name:
+        storage.delete(saved)
+    return name
+
+
+def store_uploaded_file(uploaded_file):
+    """ Stream a Django UploadedFile into the blob store, hashing as it goes; returns (digest, name) """
+    digest = hashlib.sha256()
+    with tempfile.TemporaryFile() as f:
+        for chunk in uploaded_file.chunks():
+            digest.update(chunk)
+            f.write(chunk)
+
+        digest = digest.hexdigest()
+        existing = find_blob(digest)
+        if existing:
+            return digest, existing
+        return digest, store_blob(f, digest, image_extension(uploaded_file.name))
+
+
+def save_chunk(upload_id, offset, data):
+    storage = screenshot_storage()
+    name = chunk_name(upload_id, offset)
+    # A retry of a chunk whose offset was never recorded replaces it (save() would rename instead)
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(data))
+
+
+def delete_chunks(upload_id):
+    storage = screenshot_storage()
+    directory = f"{UPLOAD_DIR}/{upload_id}"
+    try:
+        _, files = storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for filename in files:
+        storage.delete(f"{directory}/{filename}")
+
+
+def purge_stale_uploads(cutoff=None):
+    """
+    Delete the uploads started before cutoff (SCREENSHOT_UPLOAD_EXPIRY seconds ago by default)
+    that were never committed, and their chunks; returns how many were deleted
+    """
+    from .models import ScreenshotUpload
+
+    if cutoff is None:
+        cutoff = now() - timedelta(seconds=settings.SCREENSHOT_UPLOAD_EXPIRY)
+    with transaction.atomic():
+        # A chunk being received holds the row lock: it finishes first, or finds the upload gone
+        upload_ids = list(ScreenshotUpload.objects.select_for_update()
+                          .filter(created_at__lt=cutoff).values_list("upload_id", flat=True))
+        ScreenshotUpload.objects.filter(upload_id__in=upload_ids).delete()
+    for upload_id in upload_ids:
+        delete_chunks(upload_id)
+    return len(upload_ids)
+
+
+def assemble_chunks(upload_id, destination):
+    """
+    Concatenate the chunks of an upload, in offset order, into the open file `destination`.
+    Chunks are separate objects because object stores cannot append; returns the SHA-256.
+    """
+    storage = screenshot_storage()
+    directory = f"{UPLOAD_DIR}/{upload_id}"
+    digest = hashlib.sha256()
+    _, files = storage.listdir(directory)
+    for filename in sorted(files):
+        with storage.open(f"{directory}/{filename}", "rb") as chunk:
+            for block in iter(lambda: chunk.read(1024 * 1024), b""):
+                digest.update(block)
+                destination.write(block)
+    return digest.hexdigest()
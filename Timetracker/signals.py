@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import events, status
+from .archive import SCREENSHOT_FILE_FIELDS, archive_enabled, restore_hot_files
+from .models import Project, Screenshot, ScreenshotJob, WorkSession
+from .rollups import fold_project, rollups_are_frozen, update_rollups
+
+
+@receiver(post_save, sender=Screenshot)
+def queue_screenshot_processing(sender, instance, created, **kwargs):
+    """ Every new screenshot gets a post-processing job, picked up by the process_screenshots worker """
+    if created:
+        ScreenshotJob.objects.create(screenshot=instance)
+
+
+@receiver(post_save, sender=Screenshot)
+def publish_screenshot(sender, instance, created, **kwargs):
+    """ New screenshots appear on open admin dashboards (see events.py) """
+    if created:
+        events.screenshot_added(instance)
+
+
+@receiver(post_save, sender=Screenshot)
+def record_last_screenshot(sender, instance, created, **kwargs):
+    """ Keep the employee's EmployeeStatus current (see status.py) """
+    if created:
+        # timestamp is auto_now_add: a synced screenshot brings the time it was taken (see sync.py)
+        status.screenshot_taken(instance.work_session_id, getattr(instance, "_taken_at", instance.timestamp))
+
+
+@receiver(post_save, sender=Screenshot)
+def keep_screenshot_files_hot(sender, instance, created, update_fields=None, **kwargs):
+    """ Archival may have released a file this screenshot was just deduplicated to: bring it back """
+    fields = SCREENSHOT_FILE_FIELDS if created or update_fields is None else \
+        [field for field in SCREENSHOT_FILE_FIELDS if field in update_fields]
+    names = [getattr(instance, field) for field in fields if getattr(instance, field)]
+    if names and archive_enabled():
+        transaction.on_commit(lambda: restore_hot_files(names))
+
+
+@receiver(post_save, sender=WorkSession)
+def record_clock_change(sender, instance, created, **kwargs):
+    """ Keep the employee's EmployeeStatus current (see status.py) """
+    if created or instance.clock_out:
+        status.sessions_changed([instance])
+
+
+@receiver(post_save, sender=WorkSession)
+def publish_clock_change(sender, instance, created, **kwargs):
+    """ Clock-ins and clock-outs appear on open admin dashboards (see events.py) """
+    if created or instance.clock_out:
+        events.sessions_changed([instance.pk])
+
+
+@receiver(post_delete, sender=WorkSession)
+def record_session_deleted(sender, instance, **kwargs):
+    """ Keep the employee's EmployeeStatus current (see status.py) """
+    if not instance.clock_out:
+        status.session_deleted(instance)
+
+
+@receiver(post_delete, sender=WorkSession)
+def remove_session_from_rollups(sender, instance, **kwargs):
+    """ A deleted session no longer counts towards the DailyHours rollups (unless it is being archived) """
+    if rollups_are_frozen():
+        return
+    update_rollups(getattr(instance, "_rollup_state", instance.rollup_state()), None)
+
+
+@receiver(pre_delete, sender=Project)
+def fold_project_rollups(sender, instance, **kwargs):
+    """ The project's DailyHours rows become "no project" rows, merged with any existing ones """
+    fold_project(instance.pk)
@@ -0,0 +1,116 @@
+"""
+The EmployeeStatus table: one row per employee who ever clocked in, holding their open session
+(if any), its project, clock-in time and last screenshot time.
+
+WorkSession and Screenshot saves keep it current through signals (signals.py); code writing
+sessions without save() (clock batches, the async clock-out) calls sessions_changed() itself.
+rebuild_status() recomputes it from the open sessions.
+
+A session is stale when nothing was heard from it (clock-in, screenshot or activity) for
+EMPLOYEE_STATUS["STALE_AFTER"] seconds. last_seen_at is only set while clocked in, so finding
+stale sessions is a range scan of its index over the working employees.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Count, Max, Q
+from django.utils.timezone import now
+
+from .models import EmployeeStatus, Screenshot, WorkSession
+
+STATUS_FIELDS = ["work_session", "project", "clocked_in_at", "last_screenshot_at", "last_seen_at", "updated_at"]
+CLOCKED_OUT = {field: None for field in STATUS_FIELDS if field != "updated_at"}
+
+
+def stale_cutoff():
+    return now() - timedelta(seconds=settings.EMPLOYEE_STATUS["STALE_AFTER"])
+
+
+def working(queryset=None):
+    if queryset is None:
+        queryset = EmployeeStatus.objects.all()
+    return queryset.filter(last_seen_at__isnull=False)
+
+
+def stale(queryset=None):
+    return working(queryset).filter(last_seen_at__lt=stale_cutoff())
+
+
+def working_counts():
+    """ {"working": ..., "stale": ...} in one query over the working employees """
+    return working().aggregate(working=Count("pk"), stale=Count("pk", filter=Q(last_seen_at__lt=stale_cutoff())))
+
+
+def _upsert(statuses):
+    connection = connections[router.db_for_write(EmployeeStatus)]
+    # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+    unique_fields = ["employee"] if connection.features.supports_update_conflicts_with_target else None
+    EmployeeStatus.objects.bulk_create(statuses, update_conflicts=True, unique_fields=unique_fields,
+                                       update_fields=STATUS_FIELDS)
+
+
+def sessions_changed(sessions):
+    """ Record sessions that were just opened or closed """
+    sessions = list(sessions)
+    closed = [session.pk for session in sessions if session.clock_out and session.pk]
+    if closed:
+        EmployeeStatus.objects.filter(work_session_id__in=closed).update(**CLOCKED_OUT, updated_at=now())
+
+    opened = [session for session in sessions if not session.clock_out]
+    if any(session.pk is None for session in opened):
+        # bulk_create doesn't return primary keys on MySQL
+        open_ids = dict(WorkSession.objects.filter(employee_id__in=[session.employee_id for session in opened],
+                                                   is_open=True).values_list("employee_id", "id"))
+        for session in opened:
+            session.pk = session.pk or open_ids.get(session.employee_id)
+    _upsert([
+        EmployeeStatus(employee_id=session.employee_id, work_session_id=session.pk, project_id=session.project_id,
+                       clocked_in_at=session.clock_in, last_screenshot_at=None, last_seen_at=session.clock_in)
+        for session in opened if session.pk
+    ])
+
+
+def session_deleted(session):
+    """ Deleting an open session only clears the work_session of its status row (SET_NULL): clear the rest """
+    (EmployeeStatus.objects
+     .filter(employee_id=session.employee_id, work_session__isnull=True, clocked_in_at__isnull=False)
+     .update(**CLOCKED_OUT, updated_at=now()))
+
+
+def screenshot_taken(work_session_id, timestamp):
+    """ Record a screenshot of an open session (older ones than the last are ignored) """
+    (EmployeeStatus.objects
+     .filter(work_session_id=work_session_id)
+     .filter(Q(last_screenshot_at__isnull=True) | Q(last_screenshot_at__lt=timestamp))
+     .update(last_screenshot_at=timestamp, last_seen_at=timestamp, updated_at=now()))
+
+
+def session_seen(work_session_id, timestamp):
+    """ Record another sign of life of an open session, such as activity samples """
+    (EmployeeStatus.objects
+     .filter(work_session_id=work_session_id, last_seen_at__lt=timestamp)
+     .update(last_seen_at=timestamp, updated_at=now()))
+
+
+def rebuild_status(chunk_size=5000):
+    """ Recompute every EmployeeStatus row from the open sessions and their last screenshots """
+    open_sessions = (WorkSession.objects.filter(is_open=True)
+                     .values_list("id", "employee_id", "project_id", "clock_in").iterator(chunk_size=chunk_size))
+    last_screenshots = dict(Screenshot.objects.filter(work_session__is_open=True)
+                            .values("work_session_id").annotate(last=Max("timestamp"))
+                            .values_list("work_session_id", "last"))
+    statuses = []
+    for session_id, employee_id, project_id, clock_in in open_sessions:
+        last_screenshot = last_screenshots.get(session_id)
+        statuses.append(EmployeeStatus(
+            employee_id=employee_id, work_session_id=session_id, project_id=project_id,
+            clocked_in_at=clock_in, last_screenshot_at=last_screenshot,
+            last_seen_at=max(clock_in, last_screenshot) if last_screenshot else clock_in,
+        ))
+
+    with transaction.atomic():
+        EmployeeStatus.objects.update(**CLOCKED_OUT, updated_at=now())
+        for start in range(0, len(statuses), chunk_size):
+            _upsert(statuses[start:start + chunk_size])
+    return len(statuses)
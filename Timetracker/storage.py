@@ -0,0 +1,56 @@
+import math
+import os
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import FileSystemStorage
+from django.urls import reverse
+from django.utils.functional import cached_property
+
+URL_SALT = "Timetracker.storage.screenshot-url"
+
+
+class ShardedFileSystemStorage(FileSystemStorage):
+    """
+    Local-disk screenshot storage.
+
+    Names are already sharded (screenshots/ab/cd/<sha256>.png, see Timetracker/screenshots.py).
+    url() returns a signed, expiring link to the serve_screenshot view, which hands the file to
+    the web server with X-Accel-Redirect when SCREENSHOT_ACCEL_REDIRECT_PREFIX is set.
+
+    `subdirectory` keeps a second instance (the cold archive storage) apart under MEDIA_ROOT,
+    and `alias` is the settings.STORAGES entry the serve view opens the file from.
+    """
+
+    def __init__(self, subdirectory="", alias="screenshots", **kwargs):
+        super().__init__(**kwargs)
+        self.subdirectory = subdirectory
+        self.alias = alias
+
+    @cached_property
+    def base_location(self):
+        base = super().base_location
+        return os.path.join(base, self.subdirectory) if self.subdirectory else base
+
+    def url(self, name):
+        # Expiry is rounded up to the next TTL boundary so every worker signs the same URL
+        # for the same file during a window, and browsers can cache it
+        ttl = settings.SCREENSHOT_URL_TTL
+        expires = int(math.ceil(time.time() / ttl) * ttl) + ttl
+        payload = {"name": name, "expires": expires}
+        if self.alias != "screenshots":
+            payload["storage"] = self.alias
+        token = signing.Signer(salt=URL_SALT).sign_object(payload, compress=True)
+        return reverse("screenshot-file", args=[token])
+
+
+def load_url_token(token):
+    """ Return (name, expires, storage alias) for a valid token from ShardedFileSystemStorage.url(), else None """
+    try:
+        payload = signing.Signer(salt=URL_SALT).unsign_object(token)
+    except signing.BadSignature:
+        return None
+    if payload.get("expires", 0) < time.time():
+        return None
+    return payload["name"], payload["expires"], payload.get("storage", "screenshots")
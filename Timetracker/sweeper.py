@@ -0,0 +1,87 @@
+"""
+Closing of abandoned work sessions.
+
+A desktop client that crashes, or a laptop closed for the night, never clocks out, and its
+session would stay open forever: the employee counts as working, and its duration is lost.
+Sessions nothing was heard from (clock-in, screenshot or activity, see
+EmployeeStatus.last_seen_at) for SESSION_SWEEPER["ABANDONED_AFTER"] seconds are closed at that
+last sign of life, with close_reason WorkSession.ABANDONED.
+
+Candidates come from the last_seen_at index of EmployeeStatus, so a sweep only reads the
+abandoned sessions, however large WorkSession is. Run it with
+`python manage.py close_abandoned_sessions` (cron), or as the scheduler job of the same name.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+
+from . import events
+from . import status as employee_status
+from .models import EmployeeStatus, WorkSession
+from .rollups import add_sessions
+
+
+def sweeper_enabled():
+    return settings.SESSION_SWEEPER["ABANDONED_AFTER"] > 0
+
+
+def abandoned_cutoff():
+    """ Open sessions last heard from before this time are abandoned (None when disabled) """
+    if not sweeper_enabled():
+        return None
+    return now() - timedelta(seconds=settings.SESSION_SWEEPER["ABANDONED_AFTER"])
+
+
+def abandoned_session_ids(cutoff, limit=None):
+    """ Ids of the open sessions last heard from before cutoff, longest silent first """
+    candidates = (EmployeeStatus.objects.filter(last_seen_at__lt=cutoff).order_by("last_seen_at")
+                  .values_list("work_session_id", flat=True))
+    return list(candidates[:limit] if limit else candidates)
+
+
+def close_batch(session_ids, cutoff):
+    """ Close the sessions still open and silent since before cutoff; returns how many were closed """
+    with transaction.atomic():
+        # The row locks make a concurrent clock-out wait, then find nothing left to close
+        sessions = list(WorkSession.objects.select_for_update().filter(id__in=session_ids, is_open=True))
+        # A screenshot may have come in since the candidates were read
+        last_seen = dict(EmployeeStatus.objects.select_for_update()
+                         .filter(work_session_id__in=[session.id for session in sessions], last_seen_at__lt=cutoff)
+                         .values_list("work_session_id", "last_seen_at"))
+        closed = []
+        for session in sessions:
+            if session.id not in last_seen:
+                continue
+            # bulk_update skips WorkSession.save(), so the duration and open state are computed here
+            session.clock_out = max(last_seen[session.id], session.clock_in)
+            session.duration = int((session.clock_out - session.clock_in).total_seconds())
+            session.is_open = None
+            session.close_reason = WorkSession.ABANDONED
+            closed.append(session)
+
+        if closed:
+            WorkSession.objects.bulk_update(closed, ["clock_out", "duration", "is_open", "close_reason"])
+            # ...and so are the rollups, employee statuses and live dashboard events
+            add_sessions(closed)
+            employee_status.sessions_changed(closed)
+            events.sessions_changed(session.id for session in closed)
+    return len(closed)
+
+
+def close_abandoned_sessions(batch_size=None, limit=None):
+    """
+    Close every abandoned session, batch_size per transaction (at most `limit` in total).
+    Returns the number of sessions closed.
+    """
+    cutoff = abandoned_cutoff()
+    if cutoff is None:
+        return 0
+    batch_size = batch_size or settings.SESSION_SWEEPER["BATCH_SIZE"]
+
+    session_ids = abandoned_session_ids(cutoff, limit)
+    closed = 0
+    for start in range(0, len(session_ids), batch_size):
+        closed += close_batch(session_ids[start:start + batch_size], cutoff)
+    return closed
@@ -0,0 +1,197 @@
+"""
+Offline-first sync of the desktop client.
+
+The client appends everything that happens to a local log, numbering events per device
+(sequence 1, 2, 3...), and sends the log in batches whenever it is online:
+
+    {"device": "laptop-3f2a", "employee_id": 7, "events": [
+        {"sequence": 1, "type": "clock_in", "timestamp": "2025-03-03T08:59:58Z", "mac_address": "..."},
+        {"sequence": 2, "type": "screenshot", "timestamp": "2025-03-03T09:05:00Z", "sha256": "..."},
+        {"sequence": 3, "type": "activity", "timestamp": "2025-03-03T09:10:00Z",
+         "start": 1741000200, "apps": ["Code"], "samples": [[0, 1, 0], [5, 1, 0]]},
+        {"sequence": 4, "type": "clock_out", "timestamp": "2025-03-03T17:02:11Z"}]}
+
+Events are applied in sequence order, at their client timestamps, in one transaction, and each
+one is recorded in the ClientEvent log, applied or rejected. Sequences already in the log are
+not applied again but answered with their recorded outcome, so after a network error the
+client resends the same batch, and once it gets an answer it drops its events up to
+last_sequence. The log is kept per employee and device, so another employee picking the same
+device name doesn't clash. A device's sequence must only grow, even across reinstalls: GET
+returns the last sequence the server has.
+
+A clock-in before the employee's last clock-out is rejected: synced sessions never overlap.
+Screenshot and activity events belong to the employee's open session at that point of the log.
+Screenshot events refer to content the employee already uploaded (by SHA-256), so a client can't
+claim an image it only knows the hash of; other content is rejected, with the work session to
+upload the file to through the chunked upload. Activity events carry
+a batch in the /api/activity/ format.
+"""
+from datetime import timezone
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware, now
+
+from .activity import CLOCK_SKEW, InvalidBatch, activity_buffer, decode_samples
+from .models import ArchivedWorkSession, ClientEvent, Screenshot, WorkSession
+from .status import session_seen
+
+
+class Rejected(Exception):
+    pass
+
+
+def last_sequence(employee, device):
+    # Served by the (employee, device, sequence) unique index
+    return ClientEvent.objects.filter(employee=employee, device=device).aggregate(last=Max("sequence"))["last"] or 0
+
+
+def last_clock_out(employee):
+    """ When the employee's latest closed session ended, archived ones included (None if none did) """
+    ends = [model.objects.filter(employee=employee).aggregate(last=Max("clock_out"))["last"]
+            for model in (WorkSession, ArchivedWorkSession)]
+    return max(filter(None, ends), default=None)
+
+
+def parse_events(events, max_events):
+    """ Validate the envelope of a batch; returns its events by sequence, without repeats """
+    if not isinstance(events, list) or not events:
+        raise InvalidBatch("A non-empty list of events is required")
+    if len(events) > max_events:
+        raise InvalidBatch(f"At most {max_events} events per batch")
+    by_sequence = {}
+    for event in events:
+        sequence = event.get("sequence") if isinstance(event, dict) else None
+        if not isinstance(sequence, int) or isinstance(sequence, bool) or sequence < 1:
+            raise InvalidBatch("Each event needs a positive integer 'sequence'")
+        by_sequence.setdefault(sequence, event)
+    return [by_sequence[sequence] for sequence in sorted(by_sequence)]
+
+
+def event_time(event, current_time):
+    """ The client timestamp of an event, which may run a little ahead of ours """
+    timestamp = event.get("timestamp")
+    timestamp = parse_datetime(timestamp) if isinstance(timestamp, str) else None
+    if timestamp is None:
+        raise Rejected("'timestamp' must be an ISO 8601 date and time")
+    if is_naive(timestamp):
+        timestamp = make_aware(timestamp, timezone.utc)
+    if timestamp > current_time + CLOCK_SKEW:
+        raise Rejected("Timestamp is in the future")
+    return min(timestamp, current_time)
+
+
+class Replay:
+    """ Applies the new events of a batch in order, tracking the employee's open session """
+
+    def __init__(self, employee, ip_address, max_samples):
+        self.employee = employee
+        self.ip_address = ip_address
+        self.max_samples = max_samples
+        self.session = WorkSession.objects.filter(employee=employee, is_open=True).first()
+        self.last_clock_out = last_clock_out(employee)
+        self.samples = []
+
+    def apply(self, kind, event, timestamp):
+        if kind not in [choice for choice, _ in ClientEvent.KIND_CHOICES]:
+            raise Rejected("Type must be 'clock_in', 'clock_out', 'screenshot' or 'activity'")
+        return getattr(self, kind)(event, timestamp)
+
+    def open_session(self):
+        if self.session is None:
+            raise Rejected("No active session found")
+        return self.session
+
+    def clock_in(self, event, timestamp):
+        if self.session is not None:
+            raise Rejected("Employee is already checked in")
+        if self.last_clock_out and timestamp < self.last_clock_out:
+            raise Rejected("Clock-in is before the last clock-out")
+        self.session = WorkSession.objects.create(
+            employee=self.employee,
+            project=self.employee.project,
+            clock_in=timestamp,
+            ip_address=self.ip_address,
+            mac_address=event.get("mac_address"),
+        )
+        return self.session
+
+    def clock_out(self, event, timestamp):
+        session = self.open_session()
+        if timestamp < session.clock_in:
+            raise Rejected("Clock-out is before the clock-in")
+        session.clock_out = timestamp
+        session.save()
+        self.session, self.last_clock_out = None, timestamp
+        return session
+
+    def screenshot(self, event, timestamp):
+        session = self.open_session()
+        digest = str(event.get("sha256") or "").lower()
+        image_path = (Screenshot.objects.filter(content_hash=digest, work_session__employee=self.employee)
+                      .values_list("image_path", flat=True).first()) if digest else None
+        if image_path is None:
+            raise Rejected("Screenshot content not uploaded")
+        screenshot = Screenshot(work_session=session, image_path=image_path, content_hash=digest)
+        screenshot._taken_at = timestamp  # For the employee status, recorded on save
+        screenshot.save()
+        # timestamp is auto_now_add
+        Screenshot.objects.filter(pk=screenshot.pk).update(timestamp=timestamp)
+        return session
+
+    def activity(self, event, timestamp):
+        session = self.open_session()
+        try:
+            samples, _ = decode_samples(event, session, self.max_samples)
+        except InvalidBatch as e:
+            raise Rejected(str(e))
+        self.samples.extend(samples)
+        if samples:
+            session_seen(session.id, max(sample.timestamp for sample in samples))
+        return session
+
+
+def apply_events(device, employee, events, ip_address=None, max_samples=5000):
+    """
+    Log and apply the events of a batch (see the module docstring). Returns one result per
+    event, in sequence order. Raises IntegrityError when a concurrent request logged some of
+    the same events; nothing is written then.
+    """
+    results = {}
+    logged = ClientEvent.objects.filter(employee=employee, device=device, sequence__in=[event["sequence"] for event in events])
+    for entry in logged.values("sequence", "status", "error", "work_session_id"):
+        results[entry["sequence"]] = {"sequence": entry["sequence"], "status": entry["status"], "duplicate": True,
+                                      "work_session": entry["work_session_id"], "error": entry["error"]}
+
+    current_time = now()
+    log = []
+    with transaction.atomic():
+        replay = Replay(employee, ip_address, max_samples)
+        for event in events:
+            if event["sequence"] in results:
+                continue
+            kind = event.get("type")
+            entry = ClientEvent(device=device, sequence=event["sequence"], employee=employee,
+                                kind=str(kind)[:16], occurred_at=current_time, payload=event)
+            try:
+                entry.occurred_at = event_time(event, current_time)
+                session = replay.apply(kind, event, entry.occurred_at)
+            except Rejected as e:
+                entry.status, entry.error = ClientEvent.REJECTED, str(e)[:255]
+                # Screenshot content goes to the open session, if any
+                entry.work_session = replay.session
+            else:
+                entry.status, entry.work_session = ClientEvent.APPLIED, session
+            log.append(entry)
+            results[entry.sequence] = {"sequence": entry.sequence, "status": entry.status, "duplicate": False,
+                                       "work_session": entry.work_session_id, "error": entry.error}
+        ClientEvent.objects.bulk_create(log)
+        if replay.samples:
+            samples = replay.samples
+            transaction.on_commit(lambda: activity_buffer.add(samples))
+
+    for result in results.values():
+        if not result["error"]:
+            del result["error"]
+    return [results[event["sequence"]] for event in events]
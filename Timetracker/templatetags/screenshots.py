@@ -0,0 +1,11 @@
+from django import template
+
+from Timetracker.screenshots import screenshot_url as signed_screenshot_url
+
+register = template.Library()
+
+
+@register.filter
+def screenshot_url(name):
+    """ {{ screenshot.image_path|screenshot_url }}: signed URL of a stored screenshot file """
+    return signed_screenshot_url(name) or ""
@@ -1,3 +1,641 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils.timezone import now
+
+from api.models import APIToken
+from MercorTimetracker.db.pool import ConnectionPool, PooledDatabaseWrapperMixin, PoolTimeout, close_pool
+from .activity import ActivityBuffer, downsample_activity
+from .archive import archive_sessions
+from .events import EventBus, event_bus
+from .exports import export_rows
+from .factories import seed
+from .models import (ActivityMinute, ActivitySample, ArchivedScreenshot, ArchivedWorkSession, DailyHours, Employee,
+                     EmployeeStatus, Project, Screenshot, ScreenshotJob, WorkSession)
+from .processing import claim_jobs, difference_hash, hamming_distance, process_screenshot, requeue_stale_jobs, run_job
+from .rollups import rebuild_rollups
+from .screenshots import screenshot_storage, store_blob
+from .storage import URL_SALT
+from .status import session_seen
+from .sweeper import close_abandoned_sessions
+
+
+class DashboardQueryCountTests(TestCase):
+    """ The dashboards must run a fixed number of queries, however many sessions they list """
+
+    def setUp(self):
+        self.project = Project.objects.create(name="Apollo", start_date=date(2025, 1, 1))
+        self.admin = User.objects.create_user("admin", password="x", is_staff=True)
+        self.user = User.objects.create_user("worker", password="x")
+        self.employee = Employee.objects.create(user=self.user, job_title="Dev", project=self.project)
+
+    def create_sessions(self, count, screenshots_per_session=3):
+        for i in range(count):
+            user = User.objects.create_user(f"employee{WorkSession.objects.count()}")
+            employee = Employee.objects.create(user=user, job_title="Dev", project=self.project)
+            for owner in (employee, self.employee):
+                clock_in = now() - timedelta(hours=i + 1)
+                session = WorkSession.objects.create(
+                    employee=owner, project=self.project, clock_in=clock_in, clock_out=clock_in + timedelta(minutes=30))
+                Screenshot.objects.bulk_create(
+                    Screenshot(work_session=session, image_path=f"media/screenshots/{session.id}-{n}.png")
+                    for n in range(screenshots_per_session)
+                )
+
+    def test_admin_dashboard_query_count_is_constant(self):
+        self.client.force_login(self.admin)
+
+        self.create_sessions(1)
+        # session + user, working counts, working employees (joined with user/project),
+        # work sessions (joined with employee/user/project), screenshots
+        with self.assertNumQueries(6):
+            response = self.client.get("/timetracker/")
+        self.assertEqual(len(response.context["work_sessions"]), 2)
+
+        self.create_sessions(10)
+        with self.assertNumQueries(6):
+            response = self.client.get("/timetracker/")
+        self.assertEqual(len(response.context["work_sessions"]), 10)
+        self.assertContains(response, 'class="screenshot-btn"', count=30)
+
+    def test_employee_dashboard_query_count_is_constant(self):
+        self.client.force_login(self.user)
+
+        self.create_sessions(1)
+        # session + user, employee + project, work sessions (joined with project), screenshots
+        with self.assertNumQueries(6):
+            response = self.client.get("/timetracker/dashboard/")
+        self.assertEqual(len(response.context["work_sessions"]), 1)
+
+        self.create_sessions(10)
+        with self.assertNumQueries(6):
+            response = self.client.get("/timetracker/dashboard/")
+        self.assertEqual(len(response.context["work_sessions"]), 5)
+
+    def test_screenshots_are_limited_per_session(self):
+        self.client.force_login(self.admin)
+        self.create_sessions(1, screenshots_per_session=30)
+
+        with self.settings(DASHBOARD_SCREENSHOTS_PER_SESSION=20):
+            response = self.client.get("/timetracker/")
+
+        for session in response.context["work_sessions"]:
+            self.assertEqual(len(session.recent_screenshots), 20)
+
+
+class DailyHoursRollupTests(TestCase):
+
+    def setUp(self):
+        self.project = Project.objects.create(name="Apollo", start_date=date(2025, 1, 1))
+        self.employee = Employee.objects.create(
+            user=User.objects.create_user("worker"), job_title="Dev", project=self.project)
+
+    def rollups(self):
+        return {(row.day, row.seconds) for row in DailyHours.objects.all()}
+
+    def test_session_crossing_midnight_is_split(self):
+        session = WorkSession.objects.create(
+            employee=self.employee, project=self.project, clock_in=datetime(2025, 3, 1, 22, 0, tzinfo=timezone.utc))
+        self.assertEqual(self.rollups(), set())
+
+        session.clock_out = datetime(2025, 3, 2, 1, 30, tzinfo=timezone.utc)
+        session.save()
+        self.assertEqual(self.rollups(), {(date(2025, 3, 1), 7200), (date(2025, 3, 2), 5400)})
+
+    def test_edits_and_deletes_are_reflected(self):
+        session = WorkSession.objects.create(
+            employee=self.employee, project=self.project,
+            clock_in=datetime(2025, 3, 1, 9, 0, tzinfo=timezone.utc),
+            clock_out=datetime(2025, 3, 1, 10, 0, tzinfo=timezone.utc))
+        self.assertEqual(self.rollups(), {(date(2025, 3, 1), 3600)})
+
+        session = WorkSession.objects.get(id=session.id)
+        session.clock_out = datetime(2025, 3, 1, 12, 0, tzinfo=timezone.utc)
+        session.save()
+        self.assertEqual(self.rollups(), {(date(2025, 3, 1), 10800)})
+
+        session.delete()
+        self.assertEqual(self.rollups(), {(date(2025, 3, 1), 0)})
+
+    def test_time_without_a_project_is_one_row_per_day(self):
+        other = Project.objects.create(name="Gemini", start_date=date(2025, 1, 1))
+        for project, hour in ((None, 9), (None, 11), (other, 13)):
+            WorkSession.objects.create(
+                employee=self.employee, project=project, clock_in=datetime(2025, 3, 1, hour, 0, tzinfo=timezone.utc),
+                clock_out=datetime(2025, 3, 1, hour + 1, 0, tzinfo=timezone.utc))
+        self.assertEqual(self.rollups(), {(date(2025, 3, 1), 7200), (date(2025, 3, 1), 3600)})
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DailyHours.objects.create(employee=self.employee, project=None, day=date(2025, 3, 1))
+
+        # A deleted project's time joins the time without a project
+        other.delete()
+        self.assertEqual(self.rollups(), {(date(2025, 3, 1), 10800)})
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), {(date(2025, 3, 1), 10800)})
+
+    def test_rebuild_matches_incremental(self):
+        for day in range(1, 4):
+            WorkSession.objects.create(
+                employee=self.employee, project=self.project,
+                clock_in=datetime(2025, 3, day, 20, 0, tzinfo=timezone.utc),
+                clock_out=datetime(2025, 3, day + 1, 2, 0, tzinfo=timezone.utc))
+        incremental = self.rollups()
+
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), incremental)
+
+
+class BulkFactoryTests(TestCase):
+
+    def test_seed_creates_closed_sessions_and_rollups(self):
+        counts = seed(projects=2, employees=3, sessions_per_employee=4, screenshots_per_session=2)
+        self.assertEqual(counts, {"projects": 2, "employees": 3, "work_sessions": 12, "screenshots": 24})
+        self.assertFalse(WorkSession.objects.filter(is_open=True).exists())
+        self.assertEqual(Screenshot.objects.count(), 24)
+        # Rollups are rebuilt once at the end, 8 hours per session
+        self.assertEqual(sum(DailyHours.objects.values_list("seconds", flat=True)), 12 * 8 * 3600)
+
+
+class ActivitySampleTests(TestCase):
+
+    def setUp(self):
+        employee = Employee.objects.create(user=User.objects.create_user("worker"), job_title="Dev")
+        self.session = WorkSession.objects.create(
+            employee=employee, clock_in=datetime(2025, 3, 1, 9, 0, tzinfo=timezone.utc),
+            clock_out=datetime(2025, 3, 1, 10, 0, tzinfo=timezone.utc))
+
+    def samples(self, seconds, app="Code"):
+        start = datetime(2025, 3, 1, 9, 0, tzinfo=timezone.utc)
+        return [ActivitySample(work_session=self.session, timestamp=start + timedelta(seconds=second),
+                               is_active=second % 2 == 0, app=app) for second in seconds]
+
+    def test_buffer_flushes_when_full(self):
+        buffer = ActivityBuffer(max_size=3, max_age=None)
+        buffer.add(self.samples([0, 1]))
+        self.assertEqual(ActivitySample.objects.count(), 0)
+        buffer.add(self.samples([2]))
+        self.assertEqual(ActivitySample.objects.count(), 3)
+        self.assertEqual(buffer.pending(), 0)
+
+    def test_failed_flushes_keep_the_samples(self):
+        buffer = ActivityBuffer(max_size=3, max_age=None)
+        buffer.add(self.samples([0, 1]))
+        with mock.patch.object(ActivitySample.objects, "bulk_create", side_effect=OperationalError):
+            with self.assertLogs("Timetracker.activity", "ERROR"):
+                buffer.add(self.samples([2]))
+        self.assertEqual(buffer.pending(), 3)
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(ActivitySample.objects.count(), 3)
+
+    def test_downsampling_adds_to_existing_minutes(self):
+        ActivitySample.objects.bulk_create(self.samples([0, 1, 2, 61]))
+        self.assertEqual(downsample_activity(datetime(2025, 3, 2, tzinfo=timezone.utc), chunk_size=3), 4)
+        # A late sample for an already folded minute
+        ActivitySample.objects.bulk_create(self.samples([4]))
+        downsample_activity(datetime(2025, 3, 2, tzinfo=timezone.utc))
+
+        self.assertFalse(ActivitySample.objects.exists())
+        self.assertEqual(
+            list(ActivityMinute.objects.order_by("minute").values_list("minute__minute", "samples", "active_samples")),
+            [(0, 4, 3), (1, 1, 0)])
+
+
+class ExportRowsTests(TestCase):
+
+    def test_chunks_seek_past_equal_clock_ins(self):
+        employee = Employee.objects.create(user=User.objects.create_user("worker"), job_title="Dev")
+        clock_in = now() - timedelta(hours=2)
+        WorkSession.objects.bulk_create(
+            WorkSession(employee=employee, clock_in=clock_in + timedelta(minutes=i // 2),
+                        clock_out=clock_in + timedelta(hours=1), is_open=None)
+            for i in range(5))
+        rows = list(export_rows(chunk_size=2))
+        self.assertEqual([row[0] for row in rows],
+                         list(WorkSession.objects.order_by("clock_in", "id").values_list("id", flat=True)))
+
+        with self.assertRaises(CommandError):
+            call_command("export_sessions", "--chunk-size", "0")
+
+
+class ScreenshotStorageTests(SimpleTestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.digest = hashlib.sha256(b"image").hexdigest()
+
+    def test_blobs_are_sharded_on_their_hash(self):
+        name = store_blob(ContentFile(b"image"), self.digest, ".png")
+        self.assertEqual(name, f"screenshots/{self.digest[:2]}/{self.digest[2:4]}/{self.digest}.png")
+        self.assertTrue(os.path.isfile(os.path.join(self.media_root, name)))
+        # Identical content is not written twice
+        self.assertEqual(store_blob(ContentFile(b"other"), self.digest, ".png"), name)
+
+    def test_concurrent_stores_of_the_same_content_keep_one_file(self):
+        name = store_blob(ContentFile(b"image"), self.digest, ".png")
+        # Another upload of the content lands between the exists() check and the save
+        storage, exists = screenshot_storage(), screenshot_storage().exists
+        calls = []
+
+        def exists_after_the_check(path):
+            calls.append(path)
+            return len(calls) > 1 and exists(path)
+
+        with mock.patch.object(storage, "exists", side_effect=exists_after_the_check):
+            self.assertEqual(store_blob(ContentFile(b"image"), self.digest, ".png"), name)
+        self.assertEqual(os.listdir(os.path.dirname(os.path.join(self.media_root, name))), [os.path.basename(name)])
+
+    def test_signed_urls_serve_the_file_until_they_expire(self):
+        name = store_blob(ContentFile(b"image"), self.digest, ".png")
+        url = screenshot_storage().url(name)
+        response = self.client.get(url)
+        self.assertEqual(b"".join(response.streaming_content), b"image")
+        self.assertIn("immutable", response["Cache-Control"])
+
+        token = url.rstrip("/").rsplit("/", 1)[1]
+        tampered = token[:-1] + ("A" if token[-1] != "A" else "B")
+        self.assertEqual(self.client.get(url.replace(token, tampered)).status_code, 404)
+        expired = signing.Signer(salt=URL_SALT).sign_object({"name": name, "expires": int(time.time()) - 1},
+                                                              compress=True)
+        self.assertEqual(self.client.get(url.replace(token, expired)).status_code, 404)
+
+    def test_cold_storage_is_served_from_its_own_directory(self):
+        cold = screenshot_storage("screenshots_cold")
+        name = cold.save(f"screenshots/{self.digest}.png", ContentFile(b"cold image"))
+        self.assertTrue(os.path.isfile(os.path.join(self.media_root, "cold", name)))
+        self.assertFalse(screenshot_storage().exists(name))
+
+        url = cold.url(name)
+        self.assertEqual(b"".join(self.client.get(url).streaming_content), b"cold image")
+        with override_settings(SCREENSHOT_ACCEL_REDIRECT_PREFIX="/protected/"):
+            self.assertEqual(self.client.get(url)["X-Accel-Redirect"], f"/protected/cold/{name}")
+
+
+class ScreenshotProcessingTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        employee = Employee.objects.create(user=User.objects.create_user("worker"), job_title="Dev")
+        self.session = WorkSession.objects.create(employee=employee, clock_in=now() - timedelta(hours=1))
+
+    def gradient(self, brighter_left=True):
+        from PIL import Image
+
+        return Image.linear_gradient("L").rotate(-90 if brighter_left else 90)
+
+    def screenshot(self, name, image, minutes):
+        buffer = io.BytesIO()
+        image.save(buffer, "PNG")
+        screenshot_storage().save(name, ContentFile(buffer.getvalue()))
+        screenshot = Screenshot.objects.create(work_session=self.session, image_path=name)
+        Screenshot.objects.filter(pk=screenshot.pk).update(timestamp=self.session.clock_in + timedelta(minutes=minutes))
+        screenshot.refresh_from_db()
+        return screenshot
+
+    def test_difference_hash(self):
+        self.assertEqual(difference_hash(self.gradient()), "f" * 16)
+        self.assertEqual(difference_hash(self.gradient(brighter_left=False)), "0" * 16)
+        self.assertEqual(hamming_distance("f" * 16, "0" * 16), 64)
+
+    def test_near_duplicates_do_not_depend_on_processing_order(self):
+        frames = [self.screenshot("screenshots/1.png", self.gradient(), 1),
+                  self.screenshot("screenshots/2.png", self.gradient().resize((250, 250)), 2),
+                  self.screenshot("screenshots/3.png", self.gradient(brighter_left=False), 3)]
+        # Later frames first: their previous frame has no perceptual hash yet
+        for frame in reversed(frames):
+            process_screenshot(frame)
+        self.assertEqual([frame.is_near_duplicate for frame in Screenshot.objects.order_by("timestamp")],
+                         [False, True, False])
+        self.assertIsNotNone(frames[0].thumbnail_path)
+
+    @mock.patch("Timetracker.processing.close_old_connections")
+    @mock.patch("Timetracker.processing.process_screenshot", side_effect=OSError("Unreadable image"))
+    def test_failed_jobs_are_retried_then_given_up(self, process, close_connections):
+        for minutes in range(3):
+            Screenshot.objects.create(work_session=self.session, image_path=f"screenshots/{minutes}.png")
+        self.assertEqual(len(claim_jobs(2)), 2)
+        pending = ScreenshotJob.objects.get(status=ScreenshotJob.PENDING)
+        self.assertEqual(claim_jobs(5), [pending.id])
+
+        # Jobs of a dead worker go back to the queue
+        ScreenshotJob.objects.update(updated_at=now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(), 3)
+
+        ScreenshotJob.objects.exclude(id=pending.id).delete()
+        job = pending
+        delays = []
+        with self.assertLogs("Timetracker.processing", "ERROR"):
+            while claim_jobs(1):
+                run_job(job.id)
+                job.refresh_from_db()
+                delays.append(round((job.run_after - now()).total_seconds() / 60))
+                # Backing off: not picked up again until run_after
+                self.assertEqual(claim_jobs(1), [])
+                ScreenshotJob.objects.update(run_after=now())
+        self.assertEqual(delays, [2, 4])  # Its first attempt was the one of the dead worker
+        self.assertEqual(job.status, ScreenshotJob.FAILED)
+        self.assertEqual(job.attempts, settings.SCREENSHOT_PROCESSING["MAX_ATTEMPTS"])
+        self.assertEqual(job.error, "Unreadable image")
+
+    def test_jobs_killing_the_worker_are_given_up(self):
+        Screenshot.objects.create(work_session=self.session, image_path="screenshots/1.png")
+        for _ in range(settings.SCREENSHOT_PROCESSING["MAX_ATTEMPTS"]):
+            self.assertEqual(len(claim_jobs(1)), 1)
+            ScreenshotJob.objects.update(updated_at=now() - timedelta(hours=1))
+            requeue_stale_jobs()
+        job = ScreenshotJob.objects.get()
+        self.assertEqual((job.status, job.attempts), (ScreenshotJob.FAILED, settings.SCREENSHOT_PROCESSING["MAX_ATTEMPTS"]))
+        self.assertEqual(claim_jobs(1), [])
+
+
+@override_settings(ARCHIVE={"AFTER_DAYS": 30, "BATCH_SIZE": 2})
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.employee = Employee.objects.create(user=User.objects.create_user("worker"), job_title="Dev")
+
+    def create_session(self, days_ago, image_path):
+        clock_in = now() - timedelta(days=days_ago)
+        session = WorkSession.objects.create(employee=self.employee, clock_in=clock_in,
+                                             clock_out=clock_in + timedelta(hours=1))
+        Screenshot.objects.create(work_session=session, image_path=image_path)
+        if not screenshot_storage().exists(image_path):
+            screenshot_storage().save(image_path, ContentFile(b"image"))
+        return session
+
+    def test_old_sessions_move_to_the_archive(self):
+        old = [self.create_session(days, f"screenshots/old-{days}.png") for days in (40, 50, 60)]
+        shared = self.create_session(45, "screenshots/shared.png")
+        recent = self.create_session(1, "screenshots/shared.png")
+        rollups = sorted(DailyHours.objects.values_list("day", "seconds"))
+
+        self.assertEqual(archive_sessions(), (4, 4))
+        self.assertEqual(list(WorkSession.objects.values_list("id", flat=True)), [recent.id])
+        self.assertEqual(set(ArchivedWorkSession.objects.values_list("id", flat=True)),
+                         {session.id for session in old + [shared]})
+        # Archived time still counts, and a rebuild finds it too
+        self.assertEqual(sorted(DailyHours.objects.values_list("day", "seconds")), rollups)
+        rebuild_rollups()
+        self.assertEqual(sorted(DailyHours.objects.values_list("day", "seconds")), rollups)
+
+        cold = screenshot_storage(ArchivedScreenshot.storage_alias)
+        self.assertTrue(cold.exists("screenshots/old-40.png"))
+        self.assertFalse(screenshot_storage().exists("screenshots/old-40.png"))
+        # Still used by the recent session's screenshot
+        self.assertTrue(screenshot_storage().exists("screenshots/shared.png"))
+        self.assertTrue(cold.exists("screenshots/shared.png"))
+
+    def test_files_deduplicated_to_during_the_release_stay_hot(self):
+        self.create_session(40, "screenshots/old.png")
+        recent = WorkSession.objects.create(employee=self.employee, clock_in=now())
+        hot = screenshot_storage()
+        delete = hot.delete
+
+        def delete_during_upload(name):
+            delete(name)
+            # An upload deduplicated to the file between the reference check and the delete
+            Screenshot.objects.create(work_session=recent, image_path=name)
+
+        with mock.patch.object(hot, "delete", side_effect=delete_during_upload):
+            archive_sessions()
+        self.assertTrue(hot.exists("screenshots/old.png"))
+
+    def test_screenshots_saved_after_the_release_restore_their_file(self):
+        self.create_session(40, "screenshots/old.png")
+        recent = WorkSession.objects.create(employee=self.employee, clock_in=now())
+        archive_sessions()
+        self.assertFalse(screenshot_storage().exists("screenshots/old.png"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Screenshot.objects.create(work_session=recent, image_path="screenshots/old.png")
+        self.assertTrue(screenshot_storage().exists("screenshots/old.png"))
+
+    def test_saves_that_keep_the_files_do_not_check_storage(self):
+        screenshot = self.create_session(0, "screenshots/new.png").screenshots.get()
+        with mock.patch("Timetracker.signals.restore_hot_files") as restore:
+            with self.captureOnCommitCallbacks(execute=True):
+                screenshot.save(update_fields=["content_hash", "perceptual_hash"])
+            restore.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                screenshot.thumbnail_path = "thumbnails/new.jpg"
+                screenshot.save(update_fields=["content_hash", "thumbnail_path"])
+            restore.assert_called_once_with(["thumbnails/new.jpg"])
+
+
+@override_settings(SESSION_SWEEPER={"ABANDONED_AFTER": 4 * 3600, "BATCH_SIZE": 1})
+class AbandonedSessionTests(TestCase):
+
+    def open_session(self, name, hours_ago):
+        employee = Employee.objects.create(user=User.objects.create_user(name), job_title="Dev")
+        return WorkSession.objects.create(employee=employee, clock_in=now() - timedelta(hours=hours_ago))
+
+    def test_silent_sessions_are_closed_at_their_last_sign_of_life(self):
+        silent = self.open_session("silent", 10)
+        last_seen = now() - timedelta(hours=6)
+        session_seen(silent.id, last_seen)
+        crashed = self.open_session("crashed", 5)
+        busy = self.open_session("busy", 10)
+        session_seen(busy.id, now() - timedelta(hours=1))
+
+        self.assertEqual(close_abandoned_sessions(), 2)
+        silent.refresh_from_db()
+        self.assertEqual((silent.clock_out, silent.duration, silent.close_reason), (last_seen, 4 * 3600, "abandoned"))
+        self.assertEqual(list(WorkSession.objects.filter(is_open=True).values_list("id", flat=True)), [busy.id])
+        # Never heard from after its clock-in: closed at it, 0 seconds
+        crashed.refresh_from_db()
+        self.assertEqual(crashed.duration, 0)
+        self.assertEqual(sum(DailyHours.objects.values_list("seconds", flat=True)), 4 * 3600)
+        self.assertEqual(list(EmployeeStatus.objects.filter(last_seen_at__isnull=False).values_list("employee_id", flat=True)),
+                         [busy.employee_id])
+        self.assertEqual(close_abandoned_sessions(), 0)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def test_connections_are_reused_up_to_the_pool_size(self):
+        pool = ConnectionPool(FakeConnection, max_size=2, timeout=0.01)
+        first, reused = pool.get()
+        self.assertFalse(reused)
+        pool.put(first)
+        self.assertEqual(pool.get(), (first, True))
+        second, _ = pool.get()
+        with self.assertRaises(PoolTimeout):
+            pool.get()
+
+        # Failed health checks and old connections are replaced
+        pool.put(first)
+        self.assertIsNot(pool.get(check=lambda connection: False)[0], first)
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.stats()["size"], 2)
+        pool.put(second)
+
+    def test_database_wrapper_returns_connections_to_the_pool(self):
+        backend = type("PooledWrapper", (PooledDatabaseWrapperMixin, connections["default"].__class__), {})
+        settings_dict = {**connections["default"].settings_dict, "NAME": tempfile.mktemp(suffix=".sqlite3"), "CONN_MAX_AGE": 0,
+                         "OPTIONS": {"pool": {"max_size": 2}}}
+        wrapper = backend(settings_dict, alias="pool-test")
+        try:
+            wrapper.ensure_connection()
+            raw = wrapper.connection
+            wrapper.close()
+            self.assertEqual(wrapper.pool.stats()["idle"], 1)
+            wrapper.ensure_connection()
+            self.assertIs(wrapper.connection, raw)
+            self.assertTrue(wrapper.pooled_connection_reused)
+            with wrapper.cursor() as cursor:
+                cursor.execute("SELECT 1")
+
+            # A connection closed in the middle of a transaction is not handed out again
+            wrapper.set_autocommit(False)
+            wrapper.close()
+            stats = wrapper.pool.stats()
+            self.assertEqual((stats["size"], stats["idle"]), (0, 0))
+        finally:
+            close_pool("pool-test")
+            os.remove(settings_dict["NAME"])
+
+
+
+class OpenSessionMigrationTests(TransactionTestCase):
+    before = [("Timetracker", "0008_dailyhours")]
+    after = [("Timetracker", "0009_worksession_open_constraint")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_older_open_sessions_are_closed_when_the_next_started(self):
+        apps = self.migrate(self.before)
+        user = apps.get_model("auth", "User").objects.create(username="worker")
+        employee = apps.get_model("Timetracker", "Employee").objects.create(user_id=user.id, job_title="Dev")
+        sessions = apps.get_model("Timetracker", "WorkSession").objects
+        start = datetime(2025, 3, 3, 9, 0, tzinfo=timezone.utc)
+        older = sessions.create(employee_id=employee.id, clock_in=start)
+        latest = sessions.create(employee_id=employee.id, clock_in=start + timedelta(hours=3))
+
+        sessions = self.migrate(self.after).get_model("Timetracker", "WorkSession").objects
+        older, latest = sessions.get(id=older.id), sessions.get(id=latest.id)
+        self.assertEqual((older.clock_out, older.duration, older.is_open), (latest.clock_in, 3 * 3600, None))
+        self.assertEqual((latest.clock_out, latest.is_open), (None, True))
+
+
+class LiveFeedTests(TestCase):
+
+    def test_event_bus_replays_and_waits(self):
+        bus = EventBus(size=3)
+        for n in range(4):
+            bus.publish("clock_in", {"id": n})
+
+        events, reset = bus.since(2)
+        self.assertEqual([event["id"] for event in events], [3, 4])
+        self.assertFalse(reset)
+        # Event 1 has been dropped from the buffer: the client must reload
+        self.assertTrue(bus.since(0)[1])
+        self.assertEqual(bus.wait(4, timeout=0.01), ([], False))
+
+        async def waiter():
+            asyncio.get_running_loop().call_later(0.01, bus.publish, "clock_out", {"id": 5})
+            return await bus.await_events(4, timeout=5)
+
+        events, reset = asyncio.run(waiter())
+        self.assertEqual([(event["id"], event["type"]) for event in events], [(5, "clock_out")])
+
+    def test_relayed_events_keep_their_ids(self):
+        relay = mock.Mock()
+        bus = EventBus(size=3, relay=relay)
+        # Numbered by the relay, which brings the event back to this bus too
+        self.assertIsNone(bus.publish("clock_in", {"id": 1}))
+        relay.send.assert_called_once_with("clock_in", {"id": 1})
+        self.assertEqual(bus.last_id, 0)
+
+        bus.start_at(10)
+        bus.receive(11, "clock_in", {"id": 1})
+        bus.receive(11, "clock_in", {"id": 1})
+        bus.receive(12, "clock_out", {"id": 1})
+        events, reset = bus.since(10)
+        self.assertEqual([(event["id"], event["type"]) for event in events], [(11, "clock_in"), (12, "clock_out")])
+        self.assertFalse(reset)
+        # Published before this bus listened
+        self.assertTrue(bus.since(5)[1])
+
+    def test_dashboard_starts_at_the_relayed_numbering(self):
+        self.client.force_login(User.objects.create_user("admin", is_staff=True))
+        last_id = event_bus.last_id + 50
+        relay = mock.Mock()
+        relay.listen.side_effect = lambda bus: bus.start_at(last_id)
+        with mock.patch.object(event_bus, "relay", relay):
+            response = self.client.get("/timetracker/")
+        self.assertEqual(response.context["last_event_id"], last_id)
+
+    def test_clock_changes_reach_the_long_poll(self):
+        project = Project.objects.create(name="Apollo", start_date=date(2025, 1, 1))
+        employee = Employee.objects.create(user=User.objects.create_user("worker"), job_title="Dev", project=project)
+        admin = User.objects.create_user("admin", password="x", is_staff=True)
+        after = event_bus.last_id
+
+        with self.captureOnCommitCallbacks(execute=True):
+            session = WorkSession.objects.create(employee=employee, project=project, clock_in=now())
+        with self.captureOnCommitCallbacks(execute=True):
+            session.clock_out = now()
+            session.save()
+
+        self.client.force_login(employee.user)
+        self.assertEqual(self.client.get("/timetracker/live/events/", {"after": after}).status_code, 403)
+
+        self.client.force_login(admin)
+        body = self.client.get("/timetracker/live/events/", {"after": after}).json()
+        self.assertFalse(body["reset"])
+        self.assertEqual([event["type"] for event in body["events"]], ["clock_in", "clock_out"])
+        self.assertEqual(body["events"][0]["data"]["employee"], "worker")
+        self.assertEqual(body["events"][1]["data"]["id"], session.id)
+        self.assertEqual(body["last_id"], event_bus.last_id)
+
+    def test_clock_batches_are_published(self):
+        project = Project.objects.create(name="Apollo", start_date=date(2025, 1, 1))
+        employee = Employee.objects.create(user=User.objects.create_user("worker"), job_title="Dev", project=project)
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {APIToken.objects.create().token}"}
+        after = event_bus.last_id
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/worksession/batch/", {"events": [
+                {"employee_id": employee.id, "action": "clock_in"},
+                {"employee_id": employee.id, "action": "clock_out"},
+            ]}, content_type="application/json", **auth)
+        self.assertEqual(response.status_code, 200)
+        events, _ = event_bus.since(after)
+        self.assertEqual([event["type"] for event in events], ["clock_out"])
@@ -1,10 +1,13 @@
 from django.urls import path
 
 from . import views
-from .views import activate, dashboard
+from .views import activate, dashboard, serve_screenshot
 
 urlpatterns = [
     path("", views.index, name="index"),
     path("activate/<uidb64>/<token>/", activate, name="activate"),
     path("dashboard/", dashboard, name="dashboard"),
+    path("live/events/", views.live_events, name="live-events"),
+    path("live/stream/", views.live_stream, name="live-stream"),
+    path("screenshots/<str:token>/", serve_screenshot, name="screenshot-file"),
 ]
\ No newline at end of file
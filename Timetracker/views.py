@@ -1,8 +1,14 @@
-from django.http import HttpResponse
+import time
+
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 
 from django.contrib.auth.models import User
 from django.core.mail import send_mail
 from django.shortcuts import render, redirect
+from django.urls import reverse
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.template.loader import render_to_string
@@ -11,16 +17,37 @@ from django.contrib.auth import login
 from .tokens import account_activation_token
 from .forms import SetPasswordForm  # ✅ Import the password form
 from django.contrib.auth.decorators import login_required
+from . import events
+from . import status as employee_status
 from .models import Employee, WorkSession
+from .queries import session_listing
+from .screenshots import screenshot_storage
+from .storage import load_url_token
 from django.conf import settings
+from MercorTimetracker.db.router import read_from_replica
 
 
 def index(request):
     if request.user.is_authenticated:
         if request.user.is_staff:
-            work_sessions = WorkSession.objects.all().order_by('-clock_in')[:10]
+            work_sessions = session_listing().order_by('-clock_in')[:10]
+            # Longest silent first, so stale sessions come on top
+            working = (employee_status.working().select_related("employee__user", "project")
+                       .only("clocked_in_at", "last_screenshot_at", "last_seen_at", "employee__user__username",
+                             "project__name")
+                       .order_by("last_seen_at")[:20])
+            # Without this a worker that never served the feed would number the page from 0
+            events.listen()
             return render(request, "Timetracker/admin_dashboard.html", {
                 "work_sessions": work_sessions,
+                "working": working,
+                "working_counts": employee_status.working_counts(),
+                "stale_before": employee_status.stale_cutoff(),
+                "stale_minutes": settings.EMPLOYEE_STATUS["STALE_AFTER"] // 60,
+                # The page is up to date as of this event; the feed sends what follows
+                "last_event_id": events.event_bus.last_id,
+                "live_transport": "sse" if settings.ASYNC_API else "poll",
+                "live_url": reverse("live-stream" if settings.ASYNC_API else "live-events"),
             })
         else:
             return redirect("dashboard")
@@ -74,11 +101,12 @@ def activate(request, uidb64, token):
         return HttpResponse("Activation was not successful.")
 
 @login_required
+@read_from_replica
 def dashboard(request):
     # Get the Employee object for the logged-in user
     try:
         employee = request.user.employee
-        work_sessions = WorkSession.objects.filter(employee=employee).order_by('-clock_in')[:5]  # Get last 5 sessions
+        work_sessions = session_listing(WorkSession.objects.filter(employee=employee), with_employee=False).order_by('-clock_in')[:5]  # Get last 5 sessions
     except Employee.DoesNotExist:
         employee = None
         work_sessions = []
@@ -88,4 +116,85 @@ def dashboard(request):
         "employee": employee,
         "work_sessions": work_sessions,
         "software_download_url": settings.SOFTWARE_DOWNLOAD_URL,
-    })
\ No newline at end of file
+    })
+
+def serve_screenshot(request, token):
+    """ Serve a screenshot from local storage through a signed URL (see Timetracker/storage.py) """
+    payload = load_url_token(token)
+    if payload is None:
+        raise Http404("Invalid or expired link")
+    name, expires, alias = payload
+    storage = screenshot_storage(alias)
+
+    if settings.SCREENSHOT_ACCEL_REDIRECT_PREFIX:
+        # nginx sends the file itself, the worker is released immediately
+        path = "/".join(part for part in (getattr(storage, "subdirectory", ""), name) if part)
+        response = HttpResponse(content_type="")
+        response["X-Accel-Redirect"] = settings.SCREENSHOT_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + path
+    else:
+        if not storage.exists(name):
+            raise Http404("Screenshot not found")
+        response = FileResponse(storage.open(name, "rb"))
+
+    # Screenshots never change (names are content hashes), so cache until the link expires
+    response["Cache-Control"] = f"private, max-age={max(int(expires - time.time()), 0)}, immutable"
+    return response
+
+def _last_event_id(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def live_events(request):
+    """ Long-poll of the admin dashboard feed: events after ?after=, waiting up to POLL_TIMEOUT seconds for some """
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return JsonResponse({"error": "Staff only"}, status=403)
+    after = _last_event_id(request.GET.get("after"))
+    if after is None:
+        return JsonResponse({"error": "after must be an event id"}, status=400)
+
+    events.listen()
+    new_events, reset = events.event_bus.wait(after, settings.LIVE_FEED["POLL_TIMEOUT"])
+    return JsonResponse({
+        "events": new_events,
+        "last_id": new_events[-1]["id"] if new_events else (events.event_bus.last_id if reset else after),
+        "reset": reset,
+    })
+
+
+def _sse_frame(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+async def live_stream(request):
+    """ Server-sent events of the admin dashboard feed, for ASGI deployments (see events.py) """
+    user = await request.auser()
+    if not user.is_authenticated or not user.is_staff:
+        return JsonResponse({"error": "Staff only"}, status=403)
+    # EventSource sends the id of the last event it got when it reconnects
+    after = _last_event_id(request.headers.get("Last-Event-ID") or request.GET.get("after"))
+    if after is None:
+        return JsonResponse({"error": "after must be an event id"}, status=400)
+
+    await sync_to_async(events.listen)()
+
+    async def stream(after):
+        yield "retry: 3000\n\n"
+        while True:
+            new_events, reset = await events.event_bus.await_events(after, settings.LIVE_FEED["KEEPALIVE"])
+            if reset:
+                after = events.event_bus.last_id
+                yield f"id: {after}\nevent: reset\ndata: {{}}\n\n"
+                continue
+            for event in new_events:
+                yield _sse_frame(event)
+                after = event["id"]
+            if not new_events:
+                yield ": keepalive\n\n"  # Keeps proxies from closing an idle connection
+
+    response = StreamingHttpResponse(stream(after), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx must not buffer the stream
+    return response
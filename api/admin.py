@@ -1,12 +1,31 @@
-from django.contrib import admin
-from .models import APIToken
+from django import forms
+from django.contrib import admin, messages
+from .models import SCOPE_CHOICES, APIToken, all_scopes
+
+
+class APITokenForm(forms.ModelForm):
+    scopes = forms.MultipleChoiceField(choices=SCOPE_CHOICES, initial=all_scopes,
+                                       widget=forms.CheckboxSelectMultiple)
+
+    class Meta:
+        model = APIToken
+        fields = ("description", "scopes")
+
 
 @admin.register(APIToken)
 class APITokenAdmin(admin.ModelAdmin):
-    list_display = ("token", "created_at", "description")
-    readonly_fields = ("token", "created_at")
-    search_fields = ("description",)
+    form = APITokenForm
+    list_display = ("prefix", "scopes", "created_at", "description")
+    readonly_fields = ("prefix", "created_at")
+    search_fields = ("description", "prefix")
 
     def has_change_permission(self, request, obj=None):
         """ Prevent tokens from being modified after creation """
-        return False
\ No newline at end of file
+        return False
+
+    def save_model(self, request, obj, form, change):
+        """ Only a digest is stored, so the token is shown this once """
+        super().save_model(request, obj, form, change)
+        if obj.token:
+            self.message_user(request, f"New API token (copy it now, it won't be shown again): {obj.token}",
+                              messages.WARNING)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import metrics  # Installs the SQL recorder on new database connections
+        from . import signals  # Registers token cache invalidation
@@ -0,0 +1,180 @@
+"""
+Native async versions of the hot desktop-client endpoints (clock-in, clock-out, screenshot upload).
+
+DRF's @api_view is sync-only, so under ASGI every call to api/views.py is handed to a thread.
+These plain Django async views keep the request on the event loop and use the async ORM
+(aget, acreate, afirst, aupdate...). They are routed instead of the sync ones when
+ASYNC_API=True (see api/urls.py) and return the same payloads.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+from django.utils.timezone import now
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from Timetracker import events, screenshots
+from Timetracker import status as employee_status
+from Timetracker.capture import LOAD_FULL, ingest_monitor
+from Timetracker.models import Employee, Screenshot, WorkSession
+from Timetracker.rollups import add_sessions
+from .serializers import WorkSessionSerializer
+from .views import add_slowdown_hint, clock_in_data, get_client_ip, storage_full_response
+
+
+def _request_data(request):
+    """ JSON or form body as a dict (what DRF's request.data gives the sync views) """
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+def _idempotency_key(request, data):
+    key = request.headers.get("Idempotency-Key") or data.get("idempotency_key")
+    return str(key) if key else None
+
+
+@sync_to_async
+def _create_session(**fields):
+    """ Insert in a savepoint so a constraint violation doesn't break an enclosing transaction """
+    with transaction.atomic():
+        return WorkSession.objects.create(**fields)
+
+
+@sync_to_async
+def _close_session(session):
+    """
+    Write the clock-out of an open session, False if it was already closed. Compare-and-set on
+    is_open instead of a row lock: of two concurrent clock-outs only one updates the row. update()
+    skips WorkSession.save(), so the rollups, employee status and live dashboard events are handled
+    here, in the same transaction
+    """
+    with transaction.atomic():
+        updated = WorkSession.objects.filter(pk=session.pk, is_open=True).update(
+            clock_out=session.clock_out, duration=session.duration, is_open=None,
+            clock_out_key=session.clock_out_key)
+        if not updated:
+            return False
+        add_sessions([session])
+        employee_status.sessions_changed([session])
+        events.sessions_changed([session.pk])
+    return True
+
+
+def _session_response(session, status):
+    return JsonResponse(WorkSessionSerializer(session).data, status=status)
+
+
+async def _clock_in_response(session, status):
+    return JsonResponse(await sync_to_async(clock_in_data)(session), status=status)
+
+
+@csrf_exempt
+@require_POST
+async def clock_in(request):
+    """ Clock-in an employee to a work session """
+    data = _request_data(request)
+    if data is None:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+
+    employee_id = data.get("employee_id")
+    key = _idempotency_key(request, data)
+    if key and len(key) > 64:
+        return JsonResponse({"error": "Idempotency key is limited to 64 characters"}, status=400)
+
+    try:
+        employee = await Employee.objects.select_related("project").aget(id=employee_id)
+    except (Employee.DoesNotExist, ValueError, TypeError):
+        return JsonResponse({"error": "Invalid employee"}, status=404)
+
+    # A retried request gets back the session it already created
+    if key:
+        session = await WorkSession.objects.select_related("project").filter(employee=employee, clock_in_key=key).afirst()
+        if session:
+            return await _clock_in_response(session, 200)
+
+    try:
+        # The one_open_session_per_employee constraint rejects a second open session
+        session = await _create_session(
+            employee=employee,
+            project=employee.project,
+            clock_in=now(),
+            ip_address=get_client_ip(request),
+            mac_address=data.get("mac_address"),
+            clock_in_key=key,
+        )
+    except IntegrityError:
+        session = (await WorkSession.objects.select_related("project").filter(employee=employee, clock_in_key=key).afirst()
+                   if key else None)
+        if session:
+            return await _clock_in_response(session, 200)
+        return JsonResponse({"error": "Employee is already checked in"}, status=400)
+
+    return await _clock_in_response(session, 201)
+
+
+@csrf_exempt
+@require_POST
+async def clock_out(request):
+    """ Clock-out an employee from a work session """
+    data = _request_data(request)
+    if data is None:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+
+    employee_id = data.get("employee_id")
+    key = _idempotency_key(request, data)
+    if key and len(key) > 64:
+        return JsonResponse({"error": "Idempotency key is limited to 64 characters"}, status=400)
+
+    try:
+        if key:
+            session = await (WorkSession.objects.select_related("project")
+                             .filter(employee_id=employee_id, clock_out_key=key).afirst())
+            if session:
+                return _session_response(session, 200)
+
+        session = await (WorkSession.objects.select_related("project")
+                         .filter(employee_id=employee_id, is_open=True).afirst())
+    except (ValueError, TypeError):
+        session = None
+    if not session:
+        return JsonResponse({"error": "No active session found"}, status=400)
+
+    session.clock_out = now()
+    session.duration = int((session.clock_out - session.clock_in).total_seconds())
+    session.is_open = None
+    session.clock_out_key = key
+
+    if not await _close_session(session):
+        return JsonResponse({"error": "No active session found"}, status=400)
+    return _session_response(session, 200)
+
+
+@csrf_exempt
+@require_POST
+async def upload_screenshot(request):
+    """ Upload a screenshot for a valid work session """
+    load = await ingest_monitor.astate()
+    if load == LOAD_FULL:
+        return storage_full_response()
+
+    try:
+        work_session = await WorkSession.objects.aget(id=request.POST.get("work_session"))
+    except (WorkSession.DoesNotExist, ValueError, TypeError):
+        return JsonResponse({"error": "Invalid work session ID"}, status=404)
+
+    if "image_path" not in request.FILES:
+        return JsonResponse({"error": "No image file provided"}, status=400)
+
+    # Hashing and writing to storage is blocking I/O, keep it off the event loop
+    content_hash, file_path = await sync_to_async(screenshots.store_uploaded_file)(request.FILES["image_path"])
+    await Screenshot.objects.acreate(work_session=work_session, image_path=file_path, content_hash=content_hash)
+
+    return add_slowdown_hint(
+        JsonResponse({"message": "Screenshot uploaded successfully!", "file_path": file_path}, status=201), load)
@@ -0,0 +1,40 @@
+"""
+Helpers shared by the benchmark_api and loadtest_api management commands: latency
+summaries and the comparison of two JSON result files.
+"""
+import json
+
+
+def percentile(values, pct):
+    """ Nearest-rank percentile of an already sorted list """
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, int(round(pct / 100 * len(values))) - 1))
+    return values[index]
+
+
+def latency_summary(latencies):
+    """ p50/p95/p99/max in milliseconds of a list of durations in seconds """
+    latencies = sorted(latencies)
+    summary = {name: percentile(latencies, pct) for name, pct in (("p50", 50), ("p95", 95), ("p99", 99))}
+    summary["max"] = latencies[-1] if latencies else None
+    return {name: round(value * 1000, 2) if value is not None else None for name, value in summary.items()}
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_rows(baseline, candidate, metrics):
+    """
+    Yield (name, before, after, change) for each dotted metric path, e.g. "latency_ms.p99".
+    `change` is the relative difference (None when it can't be computed).
+    """
+    for metric in metrics:
+        before, after = baseline, candidate
+        for key in metric.split("."):
+            before = before.get(key) if isinstance(before, dict) else None
+            after = after.get(key) if isinstance(after, dict) else None
+        change = (after - before) / before if before and after is not None else None
+        yield metric, before, after, change
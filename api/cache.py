@@ -0,0 +1,315 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+GENERATION_KEY = "api-token-cache:generation"
+TOKEN_KEY_PREFIX = "api-token-cache:token:"
+MISS = object()
+
+
+class TokenCache:
+    """
+    In-process LRU cache of API token lookups (the token's scopes, or None when it is not valid),
+    with a TTL and a separate negative cache
+    """
+
+    def __init__(self, max_size=10000, ttl=300, negative_max_size=10000, negative_ttl=30, shared_alias=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_max_size = negative_max_size
+        self.negative_ttl = negative_ttl
+        self.shared_alias = shared_alias
+
+        # Valid and invalid tokens live in separate LRUs so a scanner spraying
+        # random tokens can never evict the tokens of real clients.
+        self._valid = OrderedDict()    # token -> (expires_at, scopes)
+        self._invalid = OrderedDict()  # token -> expires_at
+        self._generation = None  # Shared generation the local entries belong to
+        self._invalidations = 0  # Local invalidations, so a lookup can tell one happened meanwhile
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        """ Optional cross-worker cache (any Django cache alias) """
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def _shared_key(self, token, generation):
+        # Never use the raw token as a key in a shared cache. Keys include the generation, so a
+        # result stored after an invalidation is never read.
+        return f"{TOKEN_KEY_PREFIX}{generation}:{hashlib.sha256(token.encode()).hexdigest()}"
+
+    def _sync_generation(self):
+        """ Drop local entries if another worker invalidated the shared generation """
+        generation = self.shared.get(GENERATION_KEY, 0)
+        if generation != self._generation:
+            self._valid.clear()
+            self._invalid.clear()
+            self._generation = generation
+
+    def _lookup_local(self, token):
+        current = time.monotonic()
+        entry = self._valid.get(token)
+        if entry is not None:
+            if entry[0] < current:
+                del self._valid[token]
+                return MISS
+            self._valid.move_to_end(token)
+            return entry[1]
+        expires_at = self._invalid.get(token)
+        if expires_at is not None:
+            if expires_at < current:
+                del self._invalid[token]
+                return MISS
+            self._invalid.move_to_end(token)
+            return None
+        return MISS
+
+    def _store_local(self, token, scopes):
+        if scopes is not None:
+            entries, max_size = self._valid, self.max_size
+            entries[token] = (time.monotonic() + self.ttl, scopes)
+        else:
+            entries, max_size = self._invalid, self.negative_max_size
+            entries[token] = time.monotonic() + self.negative_ttl
+        entries.move_to_end(token)
+        while len(entries) > max_size:
+            entries.popitem(last=False)
+
+    def _count(self, scopes):
+        if scopes is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+
+    def lookup(self, token, loader):
+        """ Scopes of token (None if it is not valid), calling loader(token) only on a cache miss """
+        scopes = self.cached(token)
+        if scopes is MISS:
+            generation = self.generation()
+            scopes = loader(token)
+            self.remember(token, scopes, generation)
+        return scopes
+
+    async def alookup(self, token, aloader):
+        """ Async lookup(); with a shared backend the (blocking) cache calls run in a thread """
+        if self.shared_alias:
+            scopes = await sync_to_async(self.cached)(token)
+        else:
+            scopes = self.cached(token)
+        if scopes is MISS:
+            generation = await sync_to_async(self.generation)() if self.shared_alias else self.generation()
+            scopes = await aloader(token)
+            if self.shared_alias:
+                await sync_to_async(self.remember)(token, scopes, generation)
+            else:
+                self.remember(token, scopes, generation)
+        return scopes
+
+    def generation(self):
+        """ Current state of the cache; remember() drops results looked up before an invalidation """
+        with self._lock:
+            if self.shared_alias:
+                self._sync_generation()
+            return self._generation, self._invalidations
+
+    def cached(self, token):
+        """ Cached scopes of token (None if it is not valid), or MISS """
+        with self._lock:
+            if self.shared_alias:
+                self._sync_generation()
+            generation = self._generation
+            scopes = self._lookup_local(token)
+            if scopes is not MISS:
+                self._count(scopes)
+                return scopes
+
+        stored = self.shared.get(self._shared_key(token, generation)) if self.shared_alias else None
+        with self._lock:
+            if stored is None:
+                self.misses += 1
+                return MISS
+            # The shared backend holds False for invalid tokens, and a list of scopes otherwise
+            scopes = None if stored is False else frozenset(stored)
+            self._count(scopes)
+            self._store_local(token, scopes)
+        return scopes
+
+    def remember(self, token, scopes, generation=None):
+        """
+        Store the result of a database lookup. With the generation() taken before the lookup, a
+        result that an invalidation made stale during the lookup is dropped.
+        """
+        if scopes is not None:
+            scopes = frozenset(scopes)
+        current = self.generation()
+        if generation is not None and generation != current:
+            return
+        if self.shared_alias:
+            stored = False if scopes is None else sorted(scopes)
+            self.shared.set(self._shared_key(token, current[0]), stored,
+                            self.negative_ttl if scopes is None else self.ttl)
+        with self._lock:
+            if generation is None or generation == (self._generation, self._invalidations):
+                self._store_local(token, scopes)
+
+    def invalidate(self, token=None):
+        """ Forget one token (or everything) here and on every worker sharing the backend """
+        with self._lock:
+            self._invalidations += 1
+            if token is None:
+                self._valid.clear()
+                self._invalid.clear()
+            else:
+                self._valid.pop(token, None)
+                self._invalid.pop(token, None)
+            generation = self._generation
+
+        if self.shared_alias:
+            shared = self.shared
+            if token is not None:
+                shared.delete(self._shared_key(token, generation))
+            # Bumping the generation makes every other worker drop its local entries
+            try:
+                shared.incr(GENERATION_KEY)
+            except ValueError:
+                shared.set(GENERATION_KEY, 1, None)
+
+    def stats(self):
+        """ Hit/miss counters and current sizes """
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+                "valid_entries": len(self._valid),
+                "invalid_entries": len(self._invalid),
+            }
+
+
+def _build_token_cache():
+    config = getattr(settings, "API_TOKEN_CACHE", {})
+    return TokenCache(
+        max_size=config.get("MAX_SIZE", 10000),
+        ttl=config.get("TTL", 300),
+        negative_max_size=config.get("NEGATIVE_MAX_SIZE", 10000),
+        negative_ttl=config.get("NEGATIVE_TTL", 30),
+        shared_alias=config.get("SHARED_CACHE"),
+    )
+
+
+token_cache = _build_token_cache()
+
+
+RESPONSE_GENERATION_KEY_PREFIX = "api-response-cache:generation:"
+
+
+class CachedResponse:
+    """ A rendered list response: JSON body, its ETag, and the cursor of the next page """
+
+    def __init__(self, body, next_cursor=None):
+        self.body = body
+        self.etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'  # Same content, same ETag on every worker
+        self.next_cursor = next_cursor
+
+
+class ResponseCache:
+    """
+    In-process LRU of rendered responses of rarely-changing list endpoints.
+
+    Entries are keyed on (namespace, generation, request path). Model signals bump a namespace's
+    generation (see api/signals.py), so after a change every key misses and the stale entries age
+    out of the LRU. With a shared backend the generations live there, and a change made on one
+    worker is seen by all; entries stay per process. The TTL bounds staleness after writes that
+    send no signals (bulk_create, queryset.update).
+    """
+
+    def __init__(self, max_size=256, ttl=300, shared_alias=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+
+        self._entries = OrderedDict()  # (namespace, generation, path) -> (expires_at, CachedResponse)
+        self._generations = {}         # namespace -> generation, when there is no shared backend
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def generation(self, namespace):
+        if self.shared_alias:
+            return self.shared.get(RESPONSE_GENERATION_KEY_PREFIX + namespace, 0)
+        with self._lock:
+            return self._generations.get(namespace, 0)
+
+    def bump(self, namespace):
+        """ Invalidate every cached response of a namespace (here and, with a shared backend, everywhere) """
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        if self.shared_alias:
+            try:
+                self.shared.incr(RESPONSE_GENERATION_KEY_PREFIX + namespace)
+            except ValueError:
+                self.shared.set(RESPONSE_GENERATION_KEY_PREFIX + namespace, 1, None)
+
+    def get_or_render(self, namespace, path, render, ttl=None):
+        """
+        Cached response for path, calling render() -> (body bytes, next cursor) on a miss;
+        ttl shortens the lifetime of the new entry
+        """
+        key = (namespace, self.generation(namespace), path)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        entry = CachedResponse(*render())
+        with self._lock:
+            self._entries[key] = (time.monotonic() + min(self.ttl, ttl or self.ttl), entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+def _build_response_cache():
+    config = getattr(settings, "API_RESPONSE_CACHE", {})
+    return ResponseCache(
+        max_size=config.get("MAX_SIZE", 256),
+        ttl=config.get("TTL", 300),
+        shared_alias=config.get("SHARED_CACHE"),
+    )
+
+
+response_cache = _build_response_cache()
@@ -0,0 +1,251 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import localdate
+from rest_framework.renderers import JSONRenderer
+
+from Timetracker.factories import seed
+from Timetracker.models import Employee, WorkSession
+from Timetracker.queries import session_listing, session_values
+from api.benchmarks import compare_rows, latency_summary, load_results
+from api.models import APIToken
+from api.renderers import render_json
+from api.serializers import WorkSessionSerializer, work_session_rows
+
+SCENARIOS = ("clock_in", "clock_out", "upload_screenshot", "list_employees", "list_sessions",
+             "list_screenshots", "hours_report")
+
+# A PNG signature followed by filler, made unique per request so every upload is a new blob
+PNG_HEADER = b"\x89PNG\r\n\x1a\n"
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the REST API in-process: seed a throwaway test database with the bulk factory, drive "
+            "the clock, upload and listing endpoints with concurrent clients, and report throughput, latency "
+            "percentiles and queries per request as JSON. Works on the configured database (SQLite or MySQL)")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--projects", type=int, default=10)
+        parser.add_argument("--employees", type=int, default=200)
+        parser.add_argument("--sessions", type=int, default=20, help="Closed work sessions per employee")
+        parser.add_argument("--screenshots", type=int, default=5, help="Screenshots per work session")
+        parser.add_argument("--clients", type=int, default=8, help="Concurrent client threads")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+        parser.add_argument("--scenario", action="append", choices=SCENARIOS,
+                            help="Only run this scenario (repeatable, default: all)")
+        parser.add_argument("--serialization-rows", type=int, default=1000,
+                            help="Also time rendering this many work sessions with WorkSessionSerializer "
+                                 "against the lean listing path (0 skips it)")
+        parser.add_argument("--keepdb", action="store_true", help="Keep the benchmark database afterwards")
+        parser.add_argument("--label", default="", help="Name stored in the results, e.g. a branch name")
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+        parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                            help="Compare two result files instead of running the benchmark")
+        parser.add_argument("--max-regression", type=float, default=0.25,
+                            help="With --compare, fail when a p95 latency grows by more than this fraction "
+                                 "or when any scenario runs more queries per request")
+
+    def handle(self, *args, **options):
+        if options["compare"]:
+            return self.compare(*options["compare"], options["max_regression"])
+        if options["clients"] < 1 or options["requests"] < 1:
+            raise CommandError("--clients and --requests must be positive")
+
+        if connection.vendor == "sqlite":
+            # Threads need a file-backed database (not a shared in-memory one) and should queue
+            # for the write lock instead of failing with "database is locked"
+            connection.settings_dict["TEST"]["NAME"] = (
+                connection.settings_dict["TEST"].get("NAME") or os.path.join(tempfile.gettempdir(), "benchmark.sqlite3"))
+            connection.settings_dict["OPTIONS"].setdefault("transaction_mode", "IMMEDIATE")
+
+        # Never touch real data: everything runs in the test database (test_<NAME>)
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False, keepdb=options["keepdb"])
+        media_root = tempfile.mkdtemp(prefix="benchmark-media-")
+        try:
+            # The rate limit would measure itself rather than the endpoints
+            with override_settings(MEDIA_ROOT=media_root, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                                   API_RATE_LIMIT={**settings.API_RATE_LIMIT, "RATE": 0}):
+                results = self.run_benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def run_benchmark(self, options):
+        started = time.perf_counter()
+        counts = seed(projects=options["projects"], employees=options["employees"],
+                      sessions_per_employee=options["sessions"], screenshots_per_session=options["screenshots"])
+        seed_seconds = time.perf_counter() - started
+
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {APIToken.objects.create().token}"}
+        employee_ids = list(Employee.objects.order_by("id").values_list("id", flat=True))
+        session_ids = list(WorkSession.objects.order_by("-id").values_list("id", flat=True)[:options["requests"]])
+        if not employee_ids or not session_ids:
+            raise CommandError("The benchmark needs at least one employee with one session")
+
+        results = {
+            "label": options["label"],
+            "commit": self.git_commit(),
+            "database": connection.vendor,
+            "seed": {**counts, "seconds": round(seed_seconds, 2)},
+            "clients": options["clients"],
+            "scenarios": {},
+        }
+        for name in options["scenario"] or SCENARIOS:
+            requests = self.scenario_requests(name, options["requests"], employee_ids, session_ids, auth)
+            results["scenarios"][name] = self.run_scenario(requests, options["clients"])
+        if options["serialization_rows"] > 0:
+            results["serialization"] = self.compare_serialization(options["serialization_rows"])
+        return results
+
+    def scenario_requests(self, name, count, employee_ids, session_ids, auth):
+        """ List of (callable(client) -> response, expected status) making up one scenario """
+        employees = [employee_ids[i % len(employee_ids)] for i in range(count)]
+        sessions = [session_ids[i % len(session_ids)] for i in range(count)]
+        end = localdate()
+        start = end - timedelta(days=30)
+
+        if name in ("clock_in", "clock_out"):
+            # One request per employee: clock_out closes what clock_in opened
+            path, expected = ("/api/worksession/clock-in/", 201) if name == "clock_in" else ("/api/worksession/clock-out/", 200)
+            return [(lambda client, e=e: client.post(path, {"employee_id": e}, content_type="application/json", **auth),
+                     expected) for e in employee_ids[:count]]
+        if name == "upload_screenshot":
+            return [(lambda client, s=s, i=i: client.post("/api/screenshots/upload/", {
+                "work_session": s,
+                "image_path": SimpleUploadedFile(f"{i}.png", PNG_HEADER + os.urandom(16) + b"\0" * 50_000),
+            }, **auth), 201) for i, s in enumerate(sessions)]
+        if name == "list_employees":
+            return [(lambda client: client.get("/api/employees/", **auth), 200)] * count
+        if name == "list_sessions":
+            return [(lambda client, e=e: client.get(f"/api/worksession/{e}/", **auth), 200) for e in employees]
+        if name == "list_screenshots":
+            return [(lambda client, s=s: client.get(f"/api/screenshots/{s}/", **auth), 200) for s in sessions]
+        if name == "hours_report":
+            path = f"/api/reports/hours/?start={start}&end={end}&group_by=employee,day"
+            return [(lambda client: client.get(path, **auth), 200)] * count
+        raise CommandError(f"Unknown scenario {name}")
+
+    def run_scenario(self, requests, clients):
+        """ Split the requests over `clients` threads started together, and measure each request """
+        latencies, queries, errors, sizes = [], [], [0], []
+        lock = threading.Lock()
+        barrier = threading.Barrier(clients + 1)
+
+        def client_thread(work):
+            client = Client()
+            try:
+                barrier.wait()
+                for send, expected in work:
+                    with CaptureQueriesContext(connection) as captured:
+                        request_started = time.perf_counter()
+                        response = send(client)
+                        elapsed = time.perf_counter() - request_started
+                    with lock:
+                        latencies.append(elapsed)
+                        queries.append(len(captured))
+                        sizes.append(len(response.content))
+                        if response.status_code != expected:
+                            errors[0] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=client_thread, args=(requests[i::clients],)) for i in range(clients)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        return {
+            "requests": len(latencies),
+            "errors": errors[0],
+            "requests_per_second": round(len(latencies) / elapsed, 1) if elapsed else None,
+            "latency_ms": latency_summary(latencies),
+            "queries_per_request": {
+                "mean": round(sum(queries) / len(queries), 2) if queries else None,
+                "max": max(queries, default=None),
+            },
+            "response_bytes_mean": round(sum(sizes) / len(sizes)) if sizes else None,
+        }
+
+    def compare_serialization(self, rows, repeat=5):
+        """ Best-of-`repeat` time to load and render `rows` sessions with the serializer vs the lean path """
+        def serializer_path():
+            sessions = session_listing(with_employee=False, screenshot_limit=0).order_by("-clock_in", "-id")[:rows]
+            return JSONRenderer().render(WorkSessionSerializer(sessions, many=True).data)
+
+        def lean_path():
+            return render_json(work_session_rows(session_values().order_by("-clock_in", "-id")[:rows]))
+
+        results, bodies = {"rows": rows}, {}
+        for name, render in (("serializer", serializer_path), ("lean", lean_path)):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                body = render()
+                timings.append(time.perf_counter() - started)
+            results[f"{name}_ms"] = round(min(timings) * 1000, 2)
+            results[f"{name}_bytes"] = len(body)
+            bodies[name] = body
+        results["identical"] = bodies["serializer"] == bodies["lean"]
+        results["speedup"] = round(results["serializer_ms"] / results["lean_ms"], 2) if results["lean_ms"] else None
+        return results
+
+    def git_commit(self):
+        try:
+            result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                                    capture_output=True, text=True, timeout=5)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return result.stdout.strip() or None
+
+    def compare(self, baseline_path, candidate_path, max_regression):
+        baseline, candidate = load_results(baseline_path), load_results(candidate_path)
+        metrics = ["requests_per_second", "latency_ms.p50", "latency_ms.p95", "latency_ms.p99", "queries_per_request.mean"]
+        regressions = []
+
+        self.stdout.write(f"{'':<44}{baseline.get('label') or baseline.get('commit') or 'baseline':>12}"
+                          f"{candidate.get('label') or candidate.get('commit') or 'candidate':>12}")
+        for scenario in baseline["scenarios"]:
+            if scenario not in candidate["scenarios"]:
+                continue
+            rows = compare_rows(baseline["scenarios"][scenario], candidate["scenarios"][scenario], metrics)
+            for metric, before, after, change in rows:
+                self.stdout.write(f"{scenario + ' ' + metric:<44}{before!s:>12}{after!s:>12}  "
+                                  f"{'' if change is None else f'{change:+.1%}'}")
+                if metric == "latency_ms.p95" and change is not None and change > max_regression:
+                    regressions.append(f"{scenario}: p95 {before}ms -> {after}ms")
+                if metric == "queries_per_request.mean" and before is not None and after is not None and after > before:
+                    regressions.append(f"{scenario}: {before} -> {after} queries per request")
+
+        for name in ("serializer_ms", "lean_ms"):
+            before = baseline.get("serialization", {}).get(name)
+            after = candidate.get("serialization", {}).get(name)
+            if before and after is not None:
+                self.stdout.write(f"{'serialization ' + name:<44}{before!s:>12}{after!s:>12}  {(after - before) / before:+.1%}")
+        if candidate.get("serialization", {}).get("identical") is False:
+            regressions.append("serialization: the lean listing path no longer matches WorkSessionSerializer")
+
+        if regressions:
+            raise CommandError("Regressions:\n" + "\n".join(regressions))
@@ -0,0 +1,123 @@
+import copy
+import json
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+from MercorTimetracker.db.pool import PooledDatabaseWrapperMixin, close_pool
+from api.benchmarks import latency_summary
+
+MODES = ("reconnect", "persistent", "pooled")
+
+
+class Command(BaseCommand):
+    help = ("Measure what database connection handling costs a short API request: each simulated request runs a "
+            "few trivial queries and ends like a Django request does, with a new connection per request "
+            "(CONN_MAX_AGE=0), a persistent connection per thread, or the shared connection pool")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument("--mode", action="append", choices=MODES, help="Only run this mode (repeatable)")
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent request threads")
+        parser.add_argument("--requests", type=int, default=500, help="Requests per mode")
+        parser.add_argument("--queries", type=int, default=2, help="Queries per request (token check, lookup...)")
+        parser.add_argument("--pool-size", type=int, help="Pool size in pooled mode (default: --threads)")
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        if options["threads"] < 1 or options["requests"] < 1:
+            raise CommandError("--threads and --requests must be positive")
+
+        results = {
+            "database": connections[options["database"]].vendor,
+            "threads": options["threads"],
+            "queries_per_request": options["queries"],
+            "modes": {},
+        }
+        for mode in options["mode"] or MODES:
+            results["modes"][mode] = self.run_mode(mode, options)
+            summary = results["modes"][mode]
+            self.stderr.write(f"{mode:<12} p50 {summary['latency_ms']['p50']}ms  p95 {summary['latency_ms']['p95']}ms  "
+                              f"{summary['connections_opened']} connections opened")
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def wrapper_class(self, alias, mode):
+        """ The configured backend, with or without the pool mixin """
+        backend = connections[alias].__class__
+        plain = next(cls for cls in backend.__mro__ if not issubclass(cls, PooledDatabaseWrapperMixin))
+        if mode != "pooled":
+            return plain
+        if backend is not plain:
+            return backend
+        return type(f"Pooled{plain.__name__}", (PooledDatabaseWrapperMixin, plain), {})
+
+    def run_mode(self, mode, options):
+        alias = options["database"]
+        settings_dict = copy.deepcopy(connections.settings[alias])
+        settings_dict["CONN_MAX_AGE"] = None if mode == "persistent" else 0
+        settings_dict["OPTIONS"].pop("pool", None)
+        if mode == "pooled":
+            settings_dict["OPTIONS"]["pool"] = {"max_size": options["pool_size"] or options["threads"]}
+        wrapper_class = self.wrapper_class(alias, mode)
+        # Its own alias, so the pool is not shared with the application's connections
+        benchmark_alias = f"benchmark-{mode}-{time.monotonic_ns()}"
+
+        opened = [0]
+        lock = threading.Lock()
+        latencies = []
+        barrier = threading.Barrier(options["threads"] + 1)
+
+        def count_connection(sender, connection, **kwargs):
+            if connection.alias == benchmark_alias and not getattr(connection, "pooled_connection_reused", False):
+                with lock:
+                    opened[0] += 1
+
+        def request_thread(count):
+            # Like Django's per-thread connection handler: one wrapper per thread
+            connection = wrapper_class(copy.deepcopy(settings_dict), alias=benchmark_alias)
+            timings = []
+            try:
+                barrier.wait()
+                for _ in range(count):
+                    started = time.perf_counter()
+                    connection.close_if_unusable_or_obsolete()  # request_started
+                    with connection.cursor() as cursor:
+                        for _ in range(options["queries"]):
+                            cursor.execute("SELECT 1")
+                            cursor.fetchone()
+                    connection.close_if_unusable_or_obsolete()  # request_finished
+                    timings.append(time.perf_counter() - started)
+            finally:
+                connection.close()
+                with lock:
+                    latencies.extend(timings)
+
+        connection_created.connect(count_connection)
+        try:
+            counts = [len(range(i, options["requests"], options["threads"])) for i in range(options["threads"])]
+            threads = [threading.Thread(target=request_thread, args=(count,)) for count in counts]
+            for thread in threads:
+                thread.start()
+            barrier.wait()
+            started = time.perf_counter()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        finally:
+            connection_created.disconnect(count_connection)
+            close_pool(benchmark_alias)
+
+        return {
+            "requests": len(latencies),
+            "requests_per_second": round(len(latencies) / elapsed, 1) if elapsed else None,
+            "latency_ms": latency_summary(latencies),
+            "connections_opened": opened[0],
+        }
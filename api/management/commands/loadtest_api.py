@@ -0,0 +1,156 @@
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import compare_rows, latency_summary, load_results
+
+
+class Connection:
+    """ Minimal HTTP/1.1 keep-alive client, so thousands of clients don't need thousands of threads """
+
+    def __init__(self, host, port, token):
+        self.host, self.port, self.token = host, port, token
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def request(self, method, path, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                f"Authorization: Bearer {self.token}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n")
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write(head.encode() + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding") == "chunked":
+            data = b""
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                data += await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+        else:
+            data = await self.reader.readexactly(int(headers.get("content-length", 0)))
+
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, headers, data
+
+
+class Command(BaseCommand):
+    help = ("Load test a running server with many idle-heavy desktop clients (clock-in, wait, clock-out, wait) "
+            "and report requests/sec and latency percentiles; run once under WSGI and once under ASGI, "
+            "then compare the two result files with --compare")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the server under test")
+        parser.add_argument("--token", help="API token sent as Bearer token")
+        parser.add_argument("--clients", type=int, default=1000, help="Concurrent clients (one connection each)")
+        parser.add_argument("--duration", type=float, default=60, help="Seconds to run")
+        parser.add_argument("--think-time", type=float, default=5.0,
+                            help="Average idle seconds between two requests of a client")
+        parser.add_argument("--label", default="", help="Name stored in the results, e.g. wsgi or asgi")
+        parser.add_argument("--output", help="Write the results as JSON to this file")
+        parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                            help="Compare two result files instead of running a test")
+
+    def handle(self, *args, **options):
+        if options["compare"]:
+            return self.compare(*options["compare"])
+        if not options["token"]:
+            raise CommandError("--token is required")
+
+        url = urlsplit(options["url"])
+        if url.scheme != "http":
+            raise CommandError("Only plain http:// servers are supported")
+        results = asyncio.run(self.run(url.hostname, url.port or 80, options))
+        results["label"] = options["label"]
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    async def employee_ids(self, host, port, token):
+        """ All employee ids, following the cursor pagination of /api/employees/ """
+        connection, ids, path = Connection(host, port, token), [], "/api/employees/?page_size=500"
+        while path:
+            status, headers, data = await connection.request("GET", path)
+            if status != 200:
+                raise CommandError(f"GET {path} returned {status}")
+            ids += [employee["id"] for employee in json.loads(data)]
+            cursor = headers.get("x-next-cursor")
+            path = f"/api/employees/?page_size=500&cursor={cursor}" if cursor else None
+        await connection.close()
+        return ids
+
+    async def run(self, host, port, options):
+        ids = await self.employee_ids(host, port, options["token"])
+        if not ids:
+            raise CommandError("No employees to clock in, seed some first")
+
+        latencies, statuses, errors = [], {}, [0]
+        deadline = time.monotonic() + options["duration"]
+        think_time = options["think_time"]
+
+        async def client(employee_id):
+            connection = Connection(host, port, options["token"])
+            # Spread the first requests so the clients don't all fire at once
+            await asyncio.sleep(random.uniform(0, think_time))
+            paths = ("/api/worksession/clock-in/", "/api/worksession/clock-out/")
+            step = 0
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    status, _, _ = await connection.request("POST", paths[step % 2], {"employee_id": employee_id})
+                except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                    errors[0] += 1
+                    await connection.close()
+                else:
+                    latencies.append(time.perf_counter() - started)
+                    statuses[status] = statuses.get(status, 0) + 1
+                step += 1
+                await asyncio.sleep(random.expovariate(1 / think_time) if think_time else 0)
+            await connection.close()
+
+        started = time.monotonic()
+        await asyncio.gather(*(client(ids[i % len(ids)]) for i in range(options["clients"])))
+        elapsed = time.monotonic() - started
+
+        return {
+            "clients": options["clients"],
+            "duration": round(elapsed, 2),
+            "think_time": think_time,
+            "requests": len(latencies),
+            "errors": errors[0],
+            "statuses": {str(code): count for code, count in sorted(statuses.items())},
+            "requests_per_second": round(len(latencies) / elapsed, 1),
+            "latency_ms": latency_summary(latencies),
+        }
+
+    def compare(self, baseline_path, candidate_path):
+        baseline, candidate = load_results(baseline_path), load_results(candidate_path)
+        metrics = ["requests_per_second", "latency_ms.p50", "latency_ms.p95", "latency_ms.p99", "errors"]
+
+        self.stdout.write(f"{'':<22}{baseline.get('label') or baseline_path:>14}{candidate.get('label') or candidate_path:>14}")
+        for name, before, after, change in compare_rows(baseline, candidate, metrics):
+            self.stdout.write(f"{name:<22}{before!s:>14}{after!s:>14}  {'' if change is None else f'{change:+.1%}'}")
@@ -0,0 +1,164 @@
+"""
+In-process request metrics for the API (see api.middleware.RequestMetricsMiddleware).
+
+Per URL name and method we keep Prometheus-style histograms of wall time and response size
+for every request, and of query count and database time for a sampled fraction of requests.
+They are rendered in the Prometheus text format by the /api/metrics endpoint. Each worker
+process keeps its own numbers, so scrape every worker (or run a single one per container).
+
+SQL is observed with a database execute wrapper installed on every new connection. It reads
+the recorder of the current request from a context variable, which follows the request into
+the threads sync_to_async runs queries in, so async views are accounted for too.
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .cache import response_cache, token_cache
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Statements kept per sampled request for the slow-request log
+MAX_RECORDED_STATEMENTS = 200
+
+
+class Histogram:
+    """ Cumulative-bucket histogram; not thread-safe on its own (MetricsRegistry holds the lock) """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f"{name}_sum{{{labels}}} {round(self.sum, 6)}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+HISTOGRAMS = (
+    # name, help, buckets, sampled only
+    ("timetracker_request_duration_seconds", "Wall time spent handling the request", DURATION_BUCKETS, False),
+    ("timetracker_response_size_bytes", "Size of the response body (streamed responses excluded)", SIZE_BUCKETS, False),
+    ("timetracker_db_queries", "Database queries per request (sampled requests only)", QUERY_COUNT_BUCKETS, True),
+    ("timetracker_db_duration_seconds", "Time spent in the database per request (sampled requests only)",
+     DURATION_BUCKETS, True),
+)
+
+
+class MetricsRegistry:
+    """ Histograms and request counters keyed by (url name, method) """
+
+    def __init__(self):
+        self._histograms = {}  # (metric name, view, method) -> Histogram
+        self._requests = {}    # (view, method, status) -> count
+        self._lock = threading.Lock()
+
+    def record(self, view, method, status, duration, size=None, queries=None):
+        """ Record one request; size and queries (a QueryRecorder) are optional """
+        values = {
+            "timetracker_request_duration_seconds": duration,
+            "timetracker_response_size_bytes": size,
+            "timetracker_db_queries": queries.count if queries else None,
+            "timetracker_db_duration_seconds": queries.duration if queries else None,
+        }
+        with self._lock:
+            key = (view, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            for name, _, buckets, _ in HISTOGRAMS:
+                if values[name] is None:
+                    continue
+                histogram = self._histograms.get((name, view, method))
+                if histogram is None:
+                    histogram = self._histograms[(name, view, method)] = Histogram(buckets)
+                histogram.observe(values[name])
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._requests.clear()
+
+    def render(self):
+        """ All metrics, plus the token and response cache counters, in the Prometheus text exposition format """
+        lines = ["# HELP timetracker_requests_total API requests handled",
+                 "# TYPE timetracker_requests_total counter"]
+        with self._lock:
+            for (view, method, status), count in sorted(self._requests.items()):
+                lines.append(f'timetracker_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+            for name, help_text, _, _ in HISTOGRAMS:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (metric, view, method), histogram in sorted(self._histograms.items()):
+                    if metric == name:
+                        lines += histogram.lines(name, f'view="{view}",method="{method}"')
+
+        stats = token_cache.stats()
+        for key in ("hits", "negative_hits", "misses"):
+            lines += [f"# TYPE timetracker_token_cache_{key}_total counter",
+                      f"timetracker_token_cache_{key}_total {stats[key]}"]
+        for key in ("hit_ratio", "valid_entries", "invalid_entries"):
+            lines += [f"# TYPE timetracker_token_cache_{key} gauge", f"timetracker_token_cache_{key} {stats[key]}"]
+        stats = response_cache.stats()
+        for key in ("hits", "misses"):
+            lines += [f"# TYPE timetracker_response_cache_{key}_total counter",
+                      f"timetracker_response_cache_{key}_total {stats[key]}"]
+        for key in ("hit_ratio", "entries"):
+            lines += [f"# TYPE timetracker_response_cache_{key} gauge", f"timetracker_response_cache_{key} {stats[key]}"]
+        return "\n".join(lines) + "\n"
+
+
+class QueryRecorder:
+    """ Query count, database time and (up to a limit) the statements of one sampled request """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = []  # (seconds, sql)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if len(self.statements) < MAX_RECORDED_STATEMENTS:
+                self.statements.append((elapsed, sql))
+
+    def slowest(self, limit):
+        return sorted(self.statements, reverse=True)[:limit]
+
+
+current_recorder = contextvars.ContextVar("api_query_recorder", default=None)
+
+
+def record_queries(execute, sql, params, many, context):
+    """ Execute wrapper installed on every connection: a pass-through unless the request is sampled """
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+metrics = MetricsRegistry()
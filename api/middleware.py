@@ -1,17 +1,191 @@
+import logging
+import math
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
 from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+from .cache import token_cache
+from .metrics import QueryRecorder, current_recorder, metrics
 from .models import APIToken
+from .ratelimit import rate_limiter
+from .scopes import required_scope
+
+logger = logging.getLogger(__name__)
+
+
+def get_bearer_token(request):
+    """
+    The token of an "Authorization: Bearer <token>" header, "" if there is none. The bare
+    "Authorization: <token>" of older desktop clients is still accepted, for one more release
+    """
+    scheme, _, token = request.headers.get("Authorization", "").strip().partition(" ")
+    if scheme and not token:
+        logger.warning("Deprecated Authorization header without the Bearer scheme on %s", request.path)
+        return scheme
+    if scheme.lower() != "bearer":
+        return ""
+    return token.strip()
+
+
+def invalid_token_response():
+    return JsonResponse({"error": "Invalid API token"}, status=403)
+
+
+def check_scope(request, scopes):
+    """ None if a token with these scopes may make the request, else the error response """
+    scope = required_scope(request)
+    if scope is None or scope in scopes:
+        return None
+    return JsonResponse({"error": f"Token lacks the '{scope}' scope"}, status=403)
+
+
+def rate_limit_wait(token):
+    """ Seconds the token has to wait before its next request, 0 if it may go ahead """
+    config = settings.API_RATE_LIMIT
+    if not config["RATE"]:
+        return 0
+    return rate_limiter.acquire(token, config["RATE"], config["BURST"])
+
+
+def rate_limited_response(wait):
+    response = JsonResponse({"error": "Rate limit exceeded"}, status=429)
+    response["Retry-After"] = str(math.ceil(wait))
+    return response
+
 
 class APITokenMiddleware:
-    """ Middleware to authenticate API requests using APIToken """
+    """
+    Middleware to authenticate API requests using APIToken, check the token's scopes (see
+    api/scopes.py), and rate limit them per token (runs natively under WSGI and ASGI)
+    """
+
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        if request.path.startswith("/api/"):
+            token = get_bearer_token(request)
+
+            # Token lookups are cached, so most requests never touch the database
+            scopes = token_cache.lookup(token, APIToken.scopes_for) if token else None
+            if scopes is None:
+                return invalid_token_response()
+            denied = check_scope(request, scopes)
+            if denied:
+                return denied
+            wait = rate_limit_wait(token)
+            if wait:
+                return rate_limited_response(wait)
+
+        return self.get_response(request)
+
+    async def __acall__(self, request):
         if request.path.startswith("/api/"):
-            token = request.headers.get("Authorization", "").replace("Bearer ", "").strip()
+            token = get_bearer_token(request)
+
+            scopes = await token_cache.alookup(token, APIToken.ascopes_for) if token else None
+            if scopes is None:
+                return invalid_token_response()
+            denied = check_scope(request, scopes)
+            if denied:
+                return denied
+            wait = rate_limit_wait(token)
+            if wait:
+                return rate_limited_response(wait)
+
+        return await self.get_response(request)
+
+
+def url_name(request):
+    """ Name of the matched URL pattern (resolved again if a middleware answered before the view ran) """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return "unmatched"
+    return match.url_name or "unnamed"
+
+
+class RequestMetricsMiddleware:
+    """
+    Record wall time, response size, and for a sampled fraction of requests the query count and
+    database time of every API request, per URL name (see api/metrics.py). Sampled requests slower
+    than API_METRICS["SLOW_REQUEST_MS"] are logged with their slowest SQL statements.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        config = settings.API_METRICS
+        if not config["ENABLED"] or not request.path.startswith("/api/"):
+            return self.get_response(request)
+
+        recorder, reset = self.start(config)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            if reset:
+                current_recorder.reset(reset)
+        self.finish(config, request, response, time.perf_counter() - started, recorder)
+        return response
+
+    async def __acall__(self, request):
+        config = settings.API_METRICS
+        if not config["ENABLED"] or not request.path.startswith("/api/"):
+            return await self.get_response(request)
+
+        recorder, reset = self.start(config)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            if reset:
+                current_recorder.reset(reset)
+        self.finish(config, request, response, time.perf_counter() - started, recorder)
+        return response
+
+    def start(self, config):
+        """ Decide whether this request is sampled; if so, start recording its queries """
+        if random.random() >= config["SAMPLE_RATE"]:
+            return None, None
+        recorder = QueryRecorder()
+        return recorder, current_recorder.set(recorder)
 
-            if not APIToken.objects.filter(token=token).exists():
-                return JsonResponse({"error": "Invalid API token"}, status=403)
+    def finish(self, config, request, response, duration, recorder):
+        view = url_name(request)
+        size = None if response.streaming else len(response.content)
+        metrics.record(view, request.method, response.status_code, duration, size, recorder)
 
-        return self.get_response(request)
\ No newline at end of file
+        if duration * 1000 < config["SLOW_REQUEST_MS"]:
+            return
+        if recorder is None:
+            logger.warning("Slow request %s %s (%s): %.0fms (not sampled, no SQL recorded)",
+                           request.method, request.path, view, duration * 1000)
+            return
+        statements = "".join(f"\n  {seconds * 1000:.1f}ms {sql}"
+                             for seconds, sql in recorder.slowest(config["SLOW_REQUEST_SQL_LIMIT"]))
+        logger.warning("Slow request %s %s (%s): %.0fms, %d queries in %.0fms%s",
+                       request.method, request.path, view, duration * 1000,
+                       recorder.count, recorder.duration * 1000, statements)
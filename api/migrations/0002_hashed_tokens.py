@@ -0,0 +1,48 @@
+# Generated by Django 5.1.15 on 2026-10-18 18:02
+
+import api.models
+import hashlib
+from django.db import migrations, models
+
+
+def hash_tokens(apps, schema_editor):
+    """ Existing tokens keep working, with every scope """
+    APIToken = apps.get_model("api", "APIToken")
+    tokens = list(APIToken.objects.all())
+    for token in tokens:
+        token.prefix = token.token[:8]
+        token.digest = hashlib.sha256(token.token.encode()).hexdigest()
+        token.scopes = api.models.all_scopes()
+    APIToken.objects.bulk_update(tokens, ["prefix", "digest", "scopes"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apitoken',
+            name='digest',
+            field=models.CharField(default='', editable=False, max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='apitoken',
+            name='prefix',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=8),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='apitoken',
+            name='scopes',
+            field=models.JSONField(default=api.models.all_scopes),
+        ),
+        migrations.RunPython(hash_tokens, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='apitoken',
+            name='token',
+        ),
+    ]
@@ -1,17 +1,71 @@
+import hashlib
+import hmac
 import secrets
 from django.db import models
 
+# What a token may call (see api/scopes.py for the endpoints of each scope)
+SCOPE_CLOCK = "clock"
+SCOPE_UPLOAD = "upload"
+SCOPE_READ = "read"
+SCOPE_MANAGE = "manage"
+SCOPE_METRICS = "metrics"
+SCOPE_CHOICES = [
+    (SCOPE_CLOCK, "Clock in/out and sync (desktop client)"),
+    (SCOPE_UPLOAD, "Upload screenshots and activity (desktop client)"),
+    (SCOPE_READ, "Read employees, sessions, screenshots and reports"),
+    (SCOPE_MANAGE, "Create and change projects"),
+    (SCOPE_METRICS, "Scrape /api/metrics"),
+]
+PREFIX_LENGTH = 8
+
+
+def all_scopes():
+    return [scope for scope, _ in SCOPE_CHOICES]
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
 class APIToken(models.Model):
-    """ Stores API tokens for authenticating external applications """
-    token = models.CharField(max_length=64, unique=True, editable=False)  
-    created_at = models.DateTimeField(auto_now_add=True)  
-    description = models.CharField(max_length=255, blank=True, null=True)  
+    """
+    Stores API tokens for authenticating external applications: only the first PREFIX_LENGTH
+    characters (to find the row) and a SHA-256 digest of the token are kept, so a database dump
+    reveals no usable token
+    """
+    prefix = models.CharField(max_length=PREFIX_LENGTH, db_index=True, editable=False)
+    digest = models.CharField(max_length=64, editable=False)
+    scopes = models.JSONField(default=all_scopes)  # List of SCOPE_CHOICES values
+    created_at = models.DateTimeField(auto_now_add=True)
+    description = models.CharField(max_length=255, blank=True, null=True)
+
+    token = None  # The raw token, only known to the instance that generated it
 
     def save(self, *args, **kwargs):
         """ Generate a secure token if none exists """
-        if not self.token:
+        if not self.digest:
             self.token = secrets.token_hex(32)  # Secure 64-character token
+            self.prefix, self.digest = self.token[:PREFIX_LENGTH], hash_token(self.token)
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def _match(token, rows):
+        """ Scopes of the row whose digest is the token's, compared in constant time; None if none is """
+        digest = hash_token(token)
+        for candidate, scopes in rows:
+            if hmac.compare_digest(candidate, digest):
+                return frozenset(scopes)
+        return None
+
+    @classmethod
+    def scopes_for(cls, token):
+        """ The scopes of a raw token, None if it is not valid: an index seek on the prefix """
+        return cls._match(token, cls.objects.filter(prefix=token[:PREFIX_LENGTH]).values_list("digest", "scopes"))
+
+    @classmethod
+    async def ascopes_for(cls, token):
+        rows = [row async for row in cls.objects.filter(prefix=token[:PREFIX_LENGTH]).values_list("digest", "scopes")]
+        return cls._match(token, rows)
+
     def __str__(self):
-        return f"Token: {self.token[:6]}... (Created {self.created_at})"
\ No newline at end of file
+        return f"Token: {self.prefix}... (Created {self.created_at})"
@@ -0,0 +1,111 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    """ Opaque cursor for a position in a keyset-ordered listing """
+    values = [value.isoformat() if hasattr(value, "isoformat") else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, fields):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(fields):
+        raise InvalidCursor("Invalid cursor")
+
+    decoded = []
+    for field, value in zip(fields, values):
+        if field == "id":
+            if not isinstance(value, int):
+                raise InvalidCursor("Invalid cursor")
+        else:
+            value = parse_datetime(value) if isinstance(value, str) else None
+            if value is None:
+                raise InvalidCursor("Invalid cursor")
+        decoded.append(value)
+    return decoded
+
+
+def page_size_from(request):
+    """ Requested page size ("page_size", or the older "limit"), capped at API_MAX_PAGE_SIZE """
+    size = request.query_params.get("page_size") or request.query_params.get("limit") or ""
+    if not size.isdigit() or int(size) == 0:
+        return settings.API_PAGE_SIZE
+    return min(int(size), settings.API_MAX_PAGE_SIZE)
+
+
+def key_value(row, field):
+    """ Key field of a model instance, or of a .values() dict """
+    return row[field] if isinstance(row, dict) else getattr(row, field)
+
+
+def keyset_page(queryset, request, fields, descending=False):
+    """
+    Return one page of `queryset` ordered on `fields` (a unique key such as ("clock_in", "id"))
+    plus the cursor of the next page, or None when this was the last page.
+
+    Instead of OFFSET, the cursor holds the key of the last row returned and the next page
+    seeks past it, so every page costs one index range scan however deep it is.
+    """
+    ordering = [f"-{field}" if descending else field for field in fields]
+    queryset = queryset.order_by(*ordering)
+
+    cursor = request.query_params.get("cursor")
+    if cursor:
+        values = decode_cursor(cursor, fields)
+        lookup = "lt" if descending else "gt"
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+        condition = Q()
+        for i, field in enumerate(fields):
+            equal = {f: v for f, v in zip(fields[:i], values[:i])}
+            condition |= Q(**equal, **{f"{field}__{lookup}": values[i]})
+        queryset = queryset.filter(condition)
+
+    page_size = page_size_from(request)
+    rows = list(queryset[:page_size + 1])
+    if len(rows) <= page_size:
+        return rows, None
+
+    rows = rows[:page_size]
+    return rows, encode_cursor([key_value(rows[-1], field) for field in fields])
+
+
+def merge_pages(pages, request, fields, descending=False):
+    """
+    Combine the pages keyset_page() returned for the same request from several querysets
+    sharing one key (e.g. live and archived sessions) into a single page in key order.
+    """
+    def key(row):
+        return tuple(key_value(row, field) for field in fields)
+
+    page_size = page_size_from(request)
+    rows = sorted((row for page, _ in pages for row in page), key=key, reverse=descending)
+    has_more = len(rows) > page_size or any(next_cursor for _, next_cursor in pages)
+    rows = rows[:page_size]
+    if not has_more or not rows:
+        return rows, None
+    return rows, encode_cursor(key(rows[-1]))
+
+
+def paginated_response(response, request, next_cursor):
+    """
+    Attach the next page to a list response without changing its body: clients follow
+    the "X-Next-Cursor" header (or the Link header) until it is absent.
+    """
+    if next_cursor:
+        params = request.query_params.copy()
+        params["cursor"] = next_cursor
+        response["X-Next-Cursor"] = next_cursor
+        response["Link"] = f'<{request.build_absolute_uri(request.path)}?{params.urlencode()}>; rel="next"'
+    return response
@@ -0,0 +1,46 @@
+"""
+Per-token rate limiting of the API (settings.API_RATE_LIMIT, applied by api.middleware).
+
+Each token gets a token bucket holding up to `burst` requests and refilled at `rate` requests per
+second. A request takes one; when the bucket is empty the client is told how long to wait
+instead of queueing behind everyone else. Buckets live in the memory of each worker process,
+so the effective limit is per worker.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class RateLimiter:
+    """ Token buckets keyed by API token, least recently used ones dropped past max_keys """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, last refill)
+        self._lock = threading.Lock()
+
+        self.limited = 0
+
+    def acquire(self, key, rate, burst):
+        """ Take one request from key's bucket: returns 0 if allowed, else the seconds to wait """
+        at = time.monotonic()
+        with self._lock:
+            tokens, refilled = self._buckets.pop(key, (burst, at))
+            tokens = min(burst, tokens + (at - refilled) * rate)
+            if tokens >= 1:
+                wait = 0
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+                self.limited += 1
+            self._buckets[key] = (tokens, at)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+rate_limiter = RateLimiter()
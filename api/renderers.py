@@ -0,0 +1,22 @@
+"""
+JSON encoding for hot listing endpoints: orjson when installed, the standard library otherwise.
+
+render_json() returns the same bytes as DRF's JSONRenderer for plain data (dicts, lists, strings,
+numbers, None): compact separators, UTF-8 rather than \\u escapes, and U+2028 / U+2029 escaped.
+Dates must already be strings (see api.serializers.work_session_rows).
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # Optional speedup, see README
+    orjson = None
+
+
+def render_json(data):
+    if orjson is not None:
+        body = orjson.dumps(data)
+    else:
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+    # Valid JSON but not valid JavaScript, so DRF escapes them as well
+    return body.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
@@ -0,0 +1,49 @@
+"""
+The scope an API request needs, from the name of its URL pattern (api/urls.py).
+
+A desktop client only needs a clock + upload token, a reporting integration a read token, and a
+Prometheus server a metrics token, so a leaked token is worth no more than what its holder does.
+Unnamed or unknown patterns need SCOPE_MANAGE, so a new endpoint is closed until it is listed here.
+"""
+from django.urls import Resolver404, resolve
+
+from .models import SCOPE_CLOCK, SCOPE_MANAGE, SCOPE_METRICS, SCOPE_READ, SCOPE_UPLOAD
+
+URL_SCOPES = {
+    "login_api": SCOPE_CLOCK,
+    "worksession-clockin": SCOPE_CLOCK,
+    "worksession-clockout": SCOPE_CLOCK,
+    "worksession-batch": SCOPE_CLOCK,
+    "sync-events": SCOPE_CLOCK,
+
+    "screenshot-upload": SCOPE_UPLOAD,
+    "screenshot-upload-init": SCOPE_UPLOAD,
+    "screenshot-upload-chunk": SCOPE_UPLOAD,
+    "screenshot-upload-commit": SCOPE_UPLOAD,
+    "capture-policy": SCOPE_UPLOAD,
+    "activity-ingest": SCOPE_UPLOAD,
+
+    "employee-list": SCOPE_READ,
+    "employee-detail": SCOPE_READ,
+    "employee-status": SCOPE_READ,
+    "worksession-list": SCOPE_READ,
+    "worksession-export": SCOPE_READ,
+    "screenshot-list": SCOPE_READ,
+    "report-hours": SCOPE_READ,
+
+    "metrics": SCOPE_METRICS,
+}
+# Reading them is SCOPE_READ, changing them SCOPE_MANAGE
+MANAGED_URLS = {"project-list", "project-detail"}
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+def required_scope(request):
+    """ The scope the request needs, None if no URL matches it (it will be a 404 anyway) """
+    try:
+        name = resolve(request.path_info).url_name
+    except Resolver404:
+        return None
+    if name in MANAGED_URLS:
+        return SCOPE_READ if request.method in SAFE_METHODS else SCOPE_MANAGE
+    return URL_SCOPES.get(name, SCOPE_MANAGE)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from Timetracker.models import Employee, Project, WorkSession, Screenshot
+from Timetracker.screenshots import screenshot_url
 
 class EmployeeSerializer(serializers.ModelSerializer):
     """ Serializes Employee data for the API """
@@ -24,8 +25,52 @@ class WorkSessionSerializer(serializers.ModelSerializer):
         model = WorkSession
         fields = ["id", "employee", "project", "clock_in", "clock_out", "duration"]
 
+# Formats dates exactly as the DateTimeFields of the model serializers do
+_datetime = serializers.DateTimeField()
+
+
+def work_session_rows(rows):
+    """
+    WorkSessionSerializer(many=True).data for rows of Timetracker.queries.session_values():
+    same keys, order and formatting, without running the serializer fields for every row
+    """
+    to_datetime = _datetime.to_representation
+    return [{
+        "id": row["id"],
+        "employee": row["employee_id"],
+        "project": row["project_name"],
+        "clock_in": to_datetime(row["clock_in"]),
+        "clock_out": to_datetime(row["clock_out"]),
+        "duration": row["duration"],
+    } for row in rows]
+
+
+def employee_status_rows(rows, stale_before):
+    """ Rows of Timetracker.queries.status_values() as the status API renders them """
+    to_datetime = _datetime.to_representation
+    return [{
+        "employee": row["id"],
+        "username": row["username"],
+        "working": row["work_session_id"] is not None,
+        "work_session": row["work_session_id"],
+        "project": row["project_name"],
+        "clocked_in_at": to_datetime(row["clocked_in_at"]),
+        "last_screenshot_at": to_datetime(row["last_screenshot_at"]),
+        "stale": row["last_seen_at"] is not None and row["last_seen_at"] < stale_before,
+    } for row in rows]
+
 class ScreenshotSerializer(serializers.ModelSerializer):
+    url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+
     class Meta:
         model = Screenshot
-        fields = ["id", "work_session", "image_path", "timestamp"]
-        read_only_fields = ["timestamp"]
\ No newline at end of file
+        fields = ["id", "work_session", "image_path", "timestamp", "url", "thumbnail_url"]
+        read_only_fields = ["timestamp"]
+
+    def get_url(self, obj):
+        """ Signed URL of the image, fetched straight from storage (cold storage for archived ones) """
+        return screenshot_url(obj.image_path, getattr(obj, "storage_alias", "screenshots"))
+
+    def get_thumbnail_url(self, obj):
+        return screenshot_url(obj.thumbnail_path, getattr(obj, "storage_alias", "screenshots"))
\ No newline at end of file
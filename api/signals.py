@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from django.contrib.auth.models import User
+
+from Timetracker.models import Employee, Project
+from .cache import response_cache, token_cache
+from .models import APIToken
+
+
+@receiver(post_save, sender=APIToken)
+@receiver(post_delete, sender=APIToken)
+def invalidate_token_cache(sender, instance, **kwargs):
+    """
+    Drop cached lookups when a token is created, changed or revoked; only its digest is stored,
+    so the raw token to forget is unknown and the whole cache goes
+    """
+    token_cache.invalidate()
+
+
+@receiver(post_save, sender=Employee)
+@receiver(post_delete, sender=Employee)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_employee_list(sender, instance, **kwargs):
+    """ The employee list shows the username, email and project name """
+    bump_on_commit("employees")
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_project_lists(sender, instance, **kwargs):
+    bump_on_commit("projects", "employees")
+
+
+def bump_on_commit(*namespaces):
+    """
+    Bump once the change is committed: a bump before that would let a request still reading the
+    old rows cache them under the new generation
+    """
+    def bump():
+        for namespace in namespaces:
+            response_cache.bump(namespace)
+    transaction.on_commit(bump)
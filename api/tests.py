@@ -1,3 +1,862 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import json
+import shutil
+import tempfile
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError, connection, router
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils.timezone import now
+from rest_framework.renderers import JSONRenderer
+
+from MercorTimetracker.db.router import client_key, read_from_replica
+from Timetracker.activity import activity_buffer
+from Timetracker.archive import archive_sessions
+from Timetracker.capture import ingest_monitor
+from Timetracker.models import (ActivitySample, ArchivedScreenshot, CapturePolicy, ClientEvent, DailyHours, Employee,
+                                EmployeeStatus, Project, Screenshot, ScreenshotUpload, WorkSession)
+from Timetracker.screenshots import UPLOAD_DIR, blob_name, purge_stale_uploads, screenshot_storage, screenshot_url
+from Timetracker.status import rebuild_status
+from . import async_views
+from .cache import MISS, TokenCache, response_cache
+from .metrics import metrics
+from .ratelimit import rate_limiter
+from .models import SCOPE_CLOCK, SCOPE_UPLOAD, APIToken, hash_token
+from .serializers import WorkSessionSerializer
+
+
+class APITestCase(TestCase):
+    """ Base class giving each test an authenticated API client and an employee """
+
+    def setUp(self):
+        token = APIToken.objects.create()
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {token.token}"}
+        self.project = Project.objects.create(name="Apollo", start_date=date(2025, 1, 1))
+        self.employee = Employee.objects.create(
+            user=User.objects.create_user("worker"), job_title="Dev", project=self.project)
+
+    def create_sessions(self, count):
+        """ Closed sessions, one per hour going back from now """
+        WorkSession.objects.bulk_create(
+            WorkSession(employee=self.employee, project=self.project, clock_in=now() - timedelta(hours=i + 1),
+                        clock_out=now() - timedelta(hours=i), is_open=None)
+            for i in range(count)
+        )
+
+
+class WorkSessionListQueryCountTests(APITestCase):
+
+    def test_query_count_is_constant(self):
+        self.create_sessions(1)
+        # token check, employee, work sessions joined with project
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/api/worksession/{self.employee.id}/", **self.auth)
+        self.assertEqual(len(response.json()), 1)
+
+        self.create_sessions(25)
+        # The token check is cached from now on
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/api/worksession/{self.employee.id}/", **self.auth)
+        self.assertEqual(len(response.json()), 26)
+        self.assertEqual(response.json()[0]["project"], "Apollo")
+
+
+class WorkSessionPaginationTests(APITestCase):
+
+    def test_cursor_walks_every_session_once(self):
+        self.create_sessions(7)
+        # Sessions sharing a clock_in must still be split correctly across pages
+        clock_in = now()
+        WorkSession.objects.bulk_create(
+            WorkSession(employee=self.employee, clock_in=clock_in, clock_out=clock_in, is_open=None) for _ in range(3))
+
+        seen, url = [], f"/api/worksession/{self.employee.id}/?page_size=4"
+        while url:
+            response = self.client.get(url, **self.auth)
+            self.assertLessEqual(len(response.json()), 4)
+            seen += [session["id"] for session in response.json()]
+            cursor = response.get("X-Next-Cursor")
+            url = f"/api/worksession/{self.employee.id}/?page_size=4&cursor={cursor}" if cursor else None
+
+        expected = list(WorkSession.objects.order_by("-clock_in", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(f"/api/worksession/{self.employee.id}/?cursor=garbage", **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+
+class WorkSessionRenderingTests(APITestCase):
+    """ The lean listing path must render exactly what WorkSessionSerializer did """
+
+    def expected_body(self):
+        sessions = WorkSession.objects.filter(employee=self.employee).order_by("-clock_in", "-id")
+        return JSONRenderer().render(WorkSessionSerializer(sessions, many=True).data)
+
+    def test_listing_matches_the_serializer_byte_for_byte(self):
+        self.create_sessions(3)
+        odd = Project.objects.create(name="Zürich \u2028 \"ops\"", start_date=date(2025, 1, 1))
+        WorkSession.objects.bulk_create([
+            WorkSession(employee=self.employee, project=odd, clock_in=now().replace(microsecond=0), is_open=None,
+                        clock_out=now().replace(microsecond=0) + timedelta(seconds=1), duration=1),
+            WorkSession(employee=self.employee, clock_in=now() + timedelta(minutes=1)),  # Open, no project
+        ])
+
+        response = self.client.get(f"/api/worksession/{self.employee.id}/", **self.auth)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response.content, self.expected_body())
+        with mock.patch("api.renderers.orjson", None):  # Standard library fallback
+            response = self.client.get(f"/api/worksession/{self.employee.id}/", **self.auth)
+        self.assertEqual(response.content, self.expected_body())
+
+
+class ExportTests(APITestCase):
+
+    def export(self, **params):
+        response = self.client.get("/api/worksession/export/", params, HTTP_ACCEPT_ENCODING="gzip, deflate", **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content)
+
+    def test_sessions_are_exported_oldest_first(self):
+        self.create_sessions(3)
+        response, body = self.export()
+        # Accept-Encoding alone doesn't gzip the file
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = body.decode().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith("id,employee_id,username"))
+        self.assertEqual([line.split(",")[0] for line in lines[1:]],
+                         [str(pk) for pk in WorkSession.objects.order_by("clock_in").values_list("id", flat=True)])
+
+        response, compressed = self.export(gzip="1")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn('filename="work_sessions.csv.gz"', response["Content-Disposition"])
+        self.assertEqual(gzip.decompress(compressed), body)
+
+    def test_filters_and_ndjson(self):
+        self.create_sessions(2)
+        _, body = self.export(output="ndjson", employee=str(self.employee.id))
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([row["username"] for row in rows], ["worker", "worker"])
+        self.assertEqual(self.export(employee=str(self.employee.id + 1))[1].decode().count("\n"), 1)
+        response = self.client.get("/api/worksession/export/", {"start": "March"}, **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(APITestCase):
+
+    def test_reads_go_to_the_primary_after_the_clients_own_writes(self):
+        @read_from_replica
+        def view(request):
+            return router.db_for_read(WorkSession), router.db_for_read(User), router.db_for_write(WorkSession)
+
+        request = RequestFactory().get("/", **self.auth)
+        self.assertEqual(view(request), ("replica", "default", "default"))
+        self.assertEqual(router.db_for_read(WorkSession), "default")  # Outside replica views
+
+        self.client.post("/api/worksession/clock-in/", {"employee_id": self.employee.id},
+                         content_type="application/json", **self.auth)
+        self.assertEqual(view(request)[0], "default")
+        other = RequestFactory().get("/", HTTP_AUTHORIZATION="Bearer other")
+        self.assertEqual(view(other)[0], "replica")
+
+    @override_settings(DATABASE_REPLICAS=["replica", "replica2"])
+    def test_a_request_reads_from_one_replica(self):
+        @read_from_replica
+        def view(request):
+            return {router.db_for_read(WorkSession) for _ in range(20)}
+
+        self.assertEqual(len(view(RequestFactory().get("/", **self.auth))), 1)
+
+
+class ClockInOutTests(APITestCase):
+
+    def post(self, url, **data):
+        return self.client.post(url, data, content_type="application/json", **self.auth)
+
+    def test_second_clock_in_is_rejected(self):
+        self.assertEqual(self.post("/api/worksession/clock-in/", employee_id=self.employee.id).status_code, 201)
+        self.assertEqual(self.post("/api/worksession/clock-in/", employee_id=self.employee.id).status_code, 400)
+        self.assertEqual(WorkSession.objects.filter(employee=self.employee, clock_out__isnull=True).count(), 1)
+
+    def test_retries_with_an_idempotency_key_are_no_ops(self):
+        first = self.post("/api/worksession/clock-in/", employee_id=self.employee.id, idempotency_key="in-1")
+        retry = self.post("/api/worksession/clock-in/", employee_id=self.employee.id, idempotency_key="in-1")
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json()["id"], first.json()["id"])
+
+        first = self.post("/api/worksession/clock-out/", employee_id=self.employee.id, idempotency_key="out-1")
+        retry = self.post("/api/worksession/clock-out/", employee_id=self.employee.id, idempotency_key="out-1")
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(WorkSession.objects.count(), 1)
+
+    def test_idempotency_keys_are_per_employee(self):
+        other = Employee.objects.create(user=User.objects.create_user("other"), job_title="QA")
+        for action, created in (("clock-in", 201), ("clock-out", 200)):
+            mine = self.post(f"/api/worksession/{action}/", employee_id=self.employee.id, idempotency_key="key-1")
+            theirs = self.post(f"/api/worksession/{action}/", employee_id=other.id, idempotency_key="key-1")
+            self.assertEqual(theirs.status_code, created)
+            self.assertNotEqual(theirs.json()["id"], mine.json()["id"])
+        self.assertEqual(WorkSession.objects.filter(employee=other).count(), 1)
+        self.assertIsNotNone(WorkSession.objects.get(employee=other).clock_out)
+
+    def test_clock_out_closes_the_open_session(self):
+        self.post("/api/worksession/clock-in/", employee_id=self.employee.id)
+        response = self.post("/api/worksession/clock-out/", employee_id=self.employee.id)
+        self.assertIsNotNone(response.json()["clock_out"])
+        self.assertEqual(self.post("/api/worksession/clock-out/", employee_id=self.employee.id).status_code, 400)
+
+
+# The hot endpoints as api/urls.py routes them when ASYNC_API=True (it picks the views at import time)
+urlpatterns = [
+    path("api/worksession/clock-in/", async_views.clock_in),
+    path("api/worksession/clock-out/", async_views.clock_out),
+    path("api/screenshots/upload/", async_views.upload_screenshot),
+    path("", include("MercorTimetracker.urls")),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewTests(APITestCase):
+    """ The async views, called through the ASGI handler so the middleware runs its async path """
+
+    def setUp(self):
+        super().setUp()
+        self.headers = {"Authorization": self.auth["HTTP_AUTHORIZATION"]}
+
+    async def post(self, url, **data):
+        return await self.async_client.post(url, data, content_type="application/json", headers=self.headers)
+
+    async def clock_in(self):
+        """ Clock in, an hour ago so the clock-out has time to roll up """
+        response = await self.post("/api/worksession/clock-in/", employee_id=self.employee.id)
+        await WorkSession.objects.filter(pk=response.json()["id"]).aupdate(clock_in=now() - timedelta(hours=1))
+        return response
+
+    async def test_clock_in_and_out(self):
+        self.assertEqual((await self.clock_in()).status_code, 201)
+        self.assertEqual((await self.post("/api/worksession/clock-in/", employee_id=self.employee.id)).status_code, 400)
+
+        response = await self.post("/api/worksession/clock-out/", employee_id=self.employee.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.json()["clock_out"])
+        self.assertEqual((await self.post("/api/worksession/clock-out/", employee_id=self.employee.id)).status_code, 400)
+
+        status = await EmployeeStatus.objects.aget(employee=self.employee)
+        self.assertIsNone(status.work_session_id)
+        self.assertTrue(await DailyHours.objects.filter(employee=self.employee).aexists())
+
+    async def test_clock_out_is_one_transaction(self):
+        await self.clock_in()
+        with mock.patch("api.async_views.employee_status.sessions_changed", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                await self.post("/api/worksession/clock-out/", employee_id=self.employee.id)
+        # The session was not left closed without its rollups and status
+        session = await WorkSession.objects.aget(employee=self.employee)
+        self.assertTrue(session.is_open)
+        self.assertFalse(await DailyHours.objects.filter(employee=self.employee).aexists())
+
+    async def test_upload_screenshot(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        ingest_monitor.reset()
+        session = await WorkSession.objects.acreate(employee=self.employee, project=self.project, clock_in=now())
+
+        image = SimpleUploadedFile("shot.png", b"png bytes", content_type="image/png")
+        response = await self.async_client.post("/api/screenshots/upload/", {
+            "work_session": session.id, "image_path": image}, headers=self.headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(await Screenshot.objects.filter(work_session=session).acount(), 1)
+
+        response = await self.async_client.post("/api/screenshots/upload/", {"work_session": session.id},
+                                                headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_tokens_are_checked(self):
+        response = await self.async_client.post("/api/worksession/clock-in/", {"employee_id": self.employee.id},
+                                                content_type="application/json")
+        self.assertEqual(response.status_code, 403)
+        response = await self.async_client.post("/api/worksession/clock-in/", {"employee_id": self.employee.id},
+                                                content_type="application/json", headers={"Authorization": "Bearer bad"})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(await WorkSession.objects.aexists())
+
+class ClockBatchTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = Employee.objects.create(user=User.objects.create_user("other"), job_title="QA", project=self.project)
+
+    def batch(self, *events):
+        response = self.client.post("/api/worksession/batch/", {"events": list(events)},
+                                    content_type="application/json", **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"]
+
+    def test_events_are_applied_in_order(self):
+        results = self.batch({"employee_id": self.employee.id, "action": "clock_in", "idempotency_key": "in-1"},
+                             {"employee_id": self.other.id, "action": "clock_in", "idempotency_key": "in-2"},
+                             {"employee_id": self.other.id, "action": "clock_out", "idempotency_key": "out-2"})
+        self.assertEqual([result["status"] for result in results], ["clocked_in", "clocked_in", "clocked_out"])
+        sessions = {session.employee_id: session for session in WorkSession.objects.all()}
+        self.assertEqual(results[0]["session"]["id"], sessions[self.employee.id].id)
+        self.assertIsNone(sessions[self.employee.id].clock_out)
+        self.assertIsNotNone(sessions[self.other.id].clock_out)
+
+        # A retry of the same batch changes nothing and reports the same sessions
+        retry = self.batch({"employee_id": self.employee.id, "action": "clock_in", "idempotency_key": "in-1"},
+                           {"employee_id": self.other.id, "action": "clock_in", "idempotency_key": "in-2"},
+                           {"employee_id": self.other.id, "action": "clock_out", "idempotency_key": "out-2"})
+        self.assertEqual([result["status"] for result in retry], ["duplicate"] * 3)
+        self.assertEqual([result["session"]["id"] for result in retry], [result["session"]["id"] for result in results])
+        self.assertEqual(WorkSession.objects.count(), 2)
+
+    def test_idempotency_keys_are_per_employee(self):
+        self.batch({"employee_id": self.employee.id, "action": "clock_in", "idempotency_key": "in-1"})
+        results = self.batch({"employee_id": self.other.id, "action": "clock_in", "idempotency_key": "in-1"})
+        self.assertEqual(results[0]["status"], "clocked_in")
+        self.assertEqual(results[0]["session"]["employee"], self.other.id)
+
+    def test_invalid_events_fail_alone(self):
+        results = self.batch({"employee_id": 0, "action": "clock_in"},
+                             {"employee_id": self.employee.id, "action": "clock_out"},
+                             {"employee_id": self.employee.id, "action": "pause"},
+                             {"employee_id": self.employee.id, "action": "clock_in"},
+                             {"employee_id": self.employee.id, "action": "clock_in"})
+        self.assertEqual([result["status"] for result in results], ["error", "error", "error", "clocked_in", "error"])
+        self.assertEqual(results[4]["error"], "Employee is already checked in")
+        self.assertEqual(WorkSession.objects.get().employee_id, self.employee.id)
+
+    def test_created_sessions_get_their_ids_without_returning_inserts(self):
+        # As on MySQL, where bulk_create doesn't set primary keys
+        with mock.patch.object(type(connection.features), "can_return_rows_from_bulk_insert", False):
+            results = self.batch({"employee_id": self.employee.id, "action": "clock_in"},
+                                 {"employee_id": self.employee.id, "action": "clock_out"},
+                                 {"employee_id": self.employee.id, "action": "clock_in"},
+                                 {"employee_id": self.other.id, "action": "clock_in"})
+        ids = [result["session"]["id"] for result in results]
+        self.assertEqual(ids[0], ids[1])
+        self.assertEqual(sorted(set(ids)), list(WorkSession.objects.order_by("id").values_list("id", flat=True)))
+        self.assertIsNotNone(WorkSession.objects.get(id=ids[0]).clock_out)
+
+    def test_created_ids_are_matched_by_key_without_returning_inserts(self):
+        # A session of the same employee with the very same clock-in is not mistaken for the new one
+        with mock.patch.object(type(connection.features), "can_return_rows_from_bulk_insert", False), \
+                mock.patch("api.views.now", return_value=now()) as clock:
+            WorkSession.objects.create(employee=self.employee, clock_in=clock.return_value,
+                                       clock_out=clock.return_value)
+            results = self.batch({"employee_id": self.employee.id, "action": "clock_in", "idempotency_key": "in-1"},
+                                 {"employee_id": self.employee.id, "action": "clock_out"},
+                                 {"employee_id": self.employee.id, "action": "clock_in"})
+        self.assertEqual(results[0]["session"]["id"], WorkSession.objects.get(clock_in_key="in-1").id)
+        self.assertEqual(results[2]["session"]["id"], WorkSession.objects.get(is_open=True).id)
+
+
+class EmployeeStatusTests(APITestCase):
+
+    def post(self, url, **data):
+        return self.client.post(url, data, content_type="application/json", **self.auth)
+
+    def statuses(self, query=""):
+        return self.client.get(f"/api/status/{query}", **self.auth).json()
+
+    def test_status_follows_clock_and_screenshots(self):
+        other = Employee.objects.create(user=User.objects.create_user("other"), job_title="Dev")
+        session_id = self.post("/api/worksession/clock-in/", employee_id=self.employee.id).json()["id"]
+        # Clock batches write sessions without save()
+        self.post("/api/worksession/batch/", events=[{"employee_id": other.id, "action": "clock_in"}])
+        self.assertEqual([(row["employee"], row["project"]) for row in self.statuses()],
+                         [(self.employee.id, "Apollo"), (other.id, None)])
+
+        WorkSession.objects.filter(employee=other).update(clock_in=now() - timedelta(hours=1))
+        EmployeeStatus.objects.filter(employee=other).update(last_seen_at=now() - timedelta(hours=1))
+        Screenshot.objects.create(work_session_id=session_id, image_path="screenshots/ab/abc.png")
+        self.assertEqual([row["employee"] for row in self.statuses("?stale=true")], [other.id])
+        self.assertIsNotNone(self.statuses()[0]["last_screenshot_at"])
+
+        self.post("/api/worksession/batch/", events=[{"employee_id": other.id, "action": "clock_out"}])
+        self.post("/api/worksession/clock-out/", employee_id=self.employee.id)
+        self.assertEqual(self.statuses(), [])
+        self.assertEqual([row["working"] for row in self.statuses("?all=true")], [False, False])
+
+    def test_deleting_the_open_session_clocks_out(self):
+        self.post("/api/worksession/clock-in/", employee_id=self.employee.id)
+        WorkSession.objects.get().delete()
+        self.assertEqual(self.statuses(), [])
+        status = EmployeeStatus.objects.get(employee=self.employee)
+        self.assertEqual((status.work_session, status.clocked_in_at, status.last_seen_at), (None, None, None))
+
+    def test_synced_screenshots_record_when_they_were_taken(self):
+        taken = now().replace(microsecond=0) - timedelta(minutes=30)
+        Screenshot.objects.create(work_session=WorkSession.objects.create(
+            employee=self.employee, clock_in=taken - timedelta(days=1), clock_out=taken - timedelta(hours=20)),
+            image_path="screenshots/ab/abc.png", content_hash="abc")
+        self.client.post("/api/sync/events/", {"device": "laptop-1", "employee_id": self.employee.id, "events": [
+            {"sequence": 1, "type": "clock_in", "timestamp": (taken - timedelta(minutes=5)).isoformat()},
+            {"sequence": 2, "type": "screenshot", "timestamp": taken.isoformat(), "sha256": "abc"}]},
+            content_type="application/json", **self.auth)
+        status = EmployeeStatus.objects.get(employee=self.employee)
+        self.assertEqual((status.last_screenshot_at, status.last_seen_at), (taken, taken))
+
+    def test_rebuild_matches_incremental_updates(self):
+        self.post("/api/worksession/clock-in/", employee_id=self.employee.id)
+        Screenshot.objects.create(work_session=WorkSession.objects.get(), image_path="screenshots/ab/abc.png")
+        expected = self.statuses()
+        self.assertEqual(rebuild_status(), 1)
+        self.assertEqual(self.statuses(), expected)
+
+
+class ResponseCacheTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        response_cache.clear()
+
+    def test_unchanged_list_is_revalidated_without_queries(self):
+        first = self.client.get("/api/employees/", **self.auth)
+        self.assertEqual(first.json()[0]["username"], "worker")
+        # The token check is cached and the rendered page is reused: nothing reaches the database
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/employees/", HTTP_IF_NONE_MATCH=first["ETag"], **self.auth)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], first["ETag"])
+
+    def test_changes_invalidate_the_cached_lists(self):
+        projects = self.client.get("/api/projects/", **self.auth)
+        employees = self.client.get("/api/employees/", **self.auth)
+        generation = response_cache.generation("projects")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.project.name = "Gemini"
+            self.project.save()
+            # Nothing is invalidated before the change is committed
+            self.assertEqual(response_cache.generation("projects"), generation)
+
+        response = self.client.get("/api/projects/", HTTP_IF_NONE_MATCH=projects["ETag"], **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]["name"], "Gemini")
+        response = self.client.get("/api/employees/", HTTP_IF_NONE_MATCH=employees["ETag"], **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], employees["ETag"])
+
+
+@override_settings(CAPTURE_POLICY={**settings.CAPTURE_POLICY, "INTERVAL": 300, "BACKLOG_THRESHOLD": 1})
+class CapturePolicyTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        ingest_monitor.reset()
+        self.session = WorkSession.objects.create(employee=self.employee, project=self.project, clock_in=now())
+
+    def start_upload(self):
+        return self.client.post("/api/screenshots/uploads/", {"work_session": self.session.id, "size": 10},
+                                content_type="application/json", **self.auth)
+
+    def test_clock_in_returns_the_project_policy(self):
+        self.session.delete()
+        CapturePolicy.objects.create(project=self.project, interval=60)
+        response = self.client.post("/api/worksession/clock-in/", {"employee_id": self.employee.id},
+                                    content_type="application/json", **self.auth)
+        policy = response.json()["capture_policy"]
+        self.assertEqual(policy["interval"], 60)
+        self.assertEqual(policy["quality"], settings.CAPTURE_POLICY["QUALITY"])
+        self.assertEqual(policy["load"], "ok")
+
+    def test_backlog_slows_clients_down(self):
+        for _ in range(2):
+            Screenshot.objects.create(work_session=self.session, image_path="a.png")  # Queues a processing job
+        response = self.start_upload()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response["X-Capture-Slowdown"], "2")
+        policy = self.client.get(f"/api/capture-policy/?work_session={self.session.id}", **self.auth).json()
+        self.assertEqual((policy["interval"], policy["load"]), (600, "busy"))
+
+    def test_full_disk_refuses_uploads(self):
+        with mock.patch("Timetracker.capture.free_disk_space", return_value=0):
+            response = self.start_upload()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], str(settings.CAPTURE_POLICY["RETRY_AFTER"]))
+
+    def test_full_disk_refuses_chunks(self):
+        upload_id = self.start_upload().json()["upload_id"]
+        ingest_monitor.reset()
+        with mock.patch("Timetracker.capture.free_disk_space", return_value=0):
+            response = self.client.put(f"/api/screenshots/uploads/{upload_id}/", b"data",
+                                       content_type="application/octet-stream", HTTP_UPLOAD_OFFSET="0", **self.auth)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(ScreenshotUpload.objects.get(upload_id=upload_id).received_size, 0)
+
+
+class ChunkedUploadTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        ingest_monitor.reset()
+        self.session = WorkSession.objects.create(employee=self.employee, project=self.project, clock_in=now())
+
+    def start_upload(self, content):
+        return self.client.post("/api/screenshots/uploads/", {
+            "work_session": self.session.id, "size": len(content), "sha256": hashlib.sha256(content).hexdigest(),
+            "filename": "shot.png"}, content_type="application/json", **self.auth)
+
+    def put(self, upload_id, offset, chunk):
+        return self.client.put(f"/api/screenshots/uploads/{upload_id}/", chunk, content_type="application/octet-stream",
+                               HTTP_UPLOAD_OFFSET=str(offset), **self.auth)
+
+    def commit(self, upload_id):
+        return self.client.post(f"/api/screenshots/uploads/{upload_id}/commit/", **self.auth)
+
+    def test_interrupted_uploads_resume(self):
+        content = b"0123456789"
+        upload_id = self.start_upload(content).json()["upload_id"]
+        self.assertEqual(self.put(upload_id, 0, content[:4]).json()["offset"], 4)
+        # A lost chunk: the client is told where to resume
+        response = self.put(upload_id, 6, content[6:])
+        self.assertEqual((response.status_code, response.json()["offset"]), (409, 4))
+        self.assertEqual(self.commit(upload_id).status_code, 409)
+        # A retried chunk overlapping what was received
+        self.assertEqual(self.put(upload_id, 2, content[2:6]).json()["offset"], 6)
+        self.assertEqual(self.put(upload_id, 6, content[6:]).json()["offset"], 10)
+
+        response = self.commit(upload_id)
+        self.assertEqual(response.status_code, 201)
+        name = blob_name(hashlib.sha256(content).hexdigest(), ".png")
+        self.assertEqual(response.json()["file_path"], name)
+        with screenshot_storage().open(name) as f:
+            self.assertEqual(f.read(), content)
+        self.assertFalse(ScreenshotUpload.objects.exists())
+
+    def test_content_is_only_deduplicated_once_received(self):
+        content = b"secret image"
+        other = WorkSession.objects.create(employee=Employee.objects.create(user=User.objects.create_user("other")),
+                                           clock_in=now())
+        Screenshot.objects.create(work_session=other, image_path="screenshots/secret.png",
+                                  content_hash=hashlib.sha256(content).hexdigest())
+
+        # Announcing the hash of a stored image gives neither the image nor a screenshot of it
+        response = self.start_upload(content)
+        self.assertNotIn("file_path", response.json())
+        self.assertFalse(self.session.screenshots.exists())
+
+        # Sending the bytes does
+        upload_id = response.json()["upload_id"]
+        self.put(upload_id, 0, content)
+        self.assertEqual(self.commit(upload_id).json()["file_path"], "screenshots/secret.png")
+
+        upload_id = self.start_upload(content).json()["upload_id"]
+        self.put(upload_id, 0, b"other bytes!")
+        self.assertEqual(self.commit(upload_id).json(), {"error": "Checksum mismatch"})
+        self.assertEqual(self.session.screenshots.count(), 1)
+
+    def test_abandoned_uploads_are_purged(self):
+        upload_id = self.start_upload(b"0123456789").json()["upload_id"]
+        self.put(upload_id, 0, b"0123")
+        self.assertEqual(purge_stale_uploads(), 0)
+        self.assertEqual(purge_stale_uploads(cutoff=now() + timedelta(seconds=1)), 1)
+        self.assertEqual(self.put(upload_id, 4, b"456").status_code, 404)
+        self.assertEqual(screenshot_storage().listdir(f"{UPLOAD_DIR}/{upload_id}"), ([], []))
+
+
+@override_settings(API_RATE_LIMIT={"RATE": 1, "BURST": 2})
+class RateLimitTests(APITestCase):
+
+    def test_tokens_over_their_rate_get_429(self):
+        rate_limiter.clear()
+        statuses = [self.client.get("/api/projects/", **self.auth).status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        response = self.client.get("/api/projects/", **self.auth)
+        self.assertEqual(response["Retry-After"], "1")
+
+        # Other tokens have their own bucket
+        other = {"HTTP_AUTHORIZATION": f"Bearer {APIToken.objects.create().token}"}
+        self.assertEqual(self.client.get("/api/projects/", **other).status_code, 200)
+
+
+class TokenCacheTests(SimpleTestCase):
+
+    def test_lookups_are_cached_until_invalidated(self):
+        loads = []
+        cache = TokenCache(negative_ttl=0)
+
+        def loader(token):
+            loads.append(token)
+            return {"clock"} if token == "good" else None
+
+        for _ in range(2):
+            self.assertEqual(cache.lookup("good", loader), {"clock"})
+        self.assertIsNone(cache.lookup("bad", loader))
+        self.assertIsNone(cache.lookup("bad", loader))  # The negative entry has expired
+        self.assertEqual(loads, ["good", "bad", "bad"])
+
+        cache.invalidate()
+        self.assertIs(cache.cached("good"), MISS)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_invalidation_during_a_lookup_wins(self):
+        for cache in (TokenCache(), TokenCache(shared_alias="default")):
+            def revoked_meanwhile(token):
+                cache.invalidate()
+                return {"clock"}
+
+            self.assertEqual(cache.lookup("revoked", revoked_meanwhile), {"clock"})
+            self.assertIs(cache.cached("revoked"), MISS)
+
+
+class APITokenTests(APITestCase):
+
+    def bearer(self, *scopes):
+        return {"HTTP_AUTHORIZATION": f"Bearer {APIToken.objects.create(scopes=list(scopes)).token}"}
+
+    def test_only_a_digest_is_stored(self):
+        token = APIToken.objects.create()
+        stored = APIToken.objects.get(pk=token.pk)
+        self.assertIsNone(stored.token)
+        self.assertEqual((stored.prefix, stored.digest), (token.token[:8], hash_token(token.token)))
+
+        # Same prefix, wrong rest
+        forged = {"HTTP_AUTHORIZATION": f"Bearer {token.token[:8]}{'0' * 56}"}
+        self.assertEqual(self.client.get("/api/projects/", **forged).status_code, 403)
+        self.assertEqual(self.client.get("/api/projects/", HTTP_AUTHORIZATION=f"bearer  {token.token}").status_code, 200)
+        self.assertEqual(self.client.get("/api/projects/", HTTP_AUTHORIZATION=f"Basic {token.token}").status_code, 403)
+
+    def test_bare_tokens_are_still_accepted(self):
+        token = APIToken.objects.create()
+        with self.assertLogs("api.middleware", "WARNING"):
+            self.assertEqual(self.client.get("/api/projects/", HTTP_AUTHORIZATION=token.token).status_code, 200)
+        # The replica pin keys the request like the auth check does
+        bare, bearer = (RequestFactory().get("/", HTTP_AUTHORIZATION=header)
+                        for header in (token.token, f"Bearer {token.token}"))
+        with self.assertLogs("api.middleware", "WARNING"):
+            self.assertEqual(client_key(bare), client_key(bearer))
+
+    def test_tokens_only_reach_their_scopes(self):
+        client = self.bearer(SCOPE_CLOCK, SCOPE_UPLOAD)
+        response = self.client.post("/api/worksession/clock-in/", {"employee_id": self.employee.id}, **client)
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get("/api/reports/hours/", **client)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json(), {"error": "Token lacks the 'read' scope"})
+        self.assertEqual(self.client.get("/api/metrics", **client).status_code, 403)
+
+        # Projects are read with the read scope, changed with the manage scope
+        reader = self.bearer("read")
+        self.assertEqual(self.client.get("/api/projects/", **reader).status_code, 200)
+        response = self.client.post("/api/projects/", {"name": "Gemini", "start_date": "2025-01-01"}, **reader)
+        self.assertEqual(response.json(), {"error": "Token lacks the 'manage' scope"})
+        # Unknown URLs are still a 404
+        self.assertEqual(self.client.get("/api/nowhere/", **reader).status_code, 404)
+
+
+@override_settings(API_METRICS={"ENABLED": True, "SAMPLE_RATE": 1.0, "SLOW_REQUEST_MS": 60000, "SLOW_REQUEST_SQL_LIMIT": 5})
+class RequestMetricsTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+
+    def test_requests_are_recorded_per_url_name(self):
+        self.create_sessions(3)
+        slow = {**settings.API_METRICS, "SLOW_REQUEST_MS": 0}
+        with override_settings(API_METRICS=slow), self.assertLogs("api.middleware", "WARNING") as logs:
+            self.client.get(f"/api/worksession/{self.employee.id}/", **self.auth)
+        self.assertIn("SELECT", logs.output[0])
+
+        body = self.client.get("/api/metrics", **self.auth).content.decode()
+        self.assertIn('timetracker_requests_total{view="worksession-list",method="GET",status="200"} 1', body)
+        self.assertIn('timetracker_db_queries_count{view="worksession-list",method="GET"} 1', body)
+        self.assertIn("timetracker_token_cache_hits_total", body)
+
+    def test_metrics_require_a_token(self):
+        self.assertEqual(self.client.get("/api/metrics").status_code, 403)
+
+
+@mock.patch.object(activity_buffer, "max_size", 0)  # Write through instead of buffering
+class ActivityIngestTests(APITestCase):
+
+    def post_batch(self, batch, **headers):
+        body = gzip.compress(json.dumps(batch).encode())
+        return self.client.post("/api/activity/", body, content_type="application/json",
+                                HTTP_CONTENT_ENCODING="gzip", **headers, **self.auth)
+
+    def test_compressed_batch_is_stored(self):
+        session = WorkSession.objects.create(employee=self.employee, clock_in=now() - timedelta(hours=1))
+        start = (session.clock_in + timedelta(minutes=5)).timestamp()
+        response = self.post_batch({
+            "work_session": session.id, "start": start, "apps": ["Code", "Chrome"],
+            # The last sample is two hours in the future, outside the session
+            "samples": [[0, 1, 0], [5, 1, 1], [10, 0, None], [7200, 1, 0]],
+        })
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {"accepted": 3, "rejected": 1})
+        self.assertEqual(
+            list(ActivitySample.objects.order_by("timestamp").values_list("is_active", "app")),
+            [(True, "Code"), (True, "Chrome"), (False, "")])
+
+    def test_malformed_batches_are_rejected(self):
+        session = WorkSession.objects.create(employee=self.employee, clock_in=now())
+        self.assertEqual(self.post_batch({"work_session": session.id, "samples": []}).status_code, 400)
+        self.assertEqual(self.post_batch({"work_session": session.id, "start": 0, "samples": [[0, 1, 3]]}).status_code, 400)
+        # Activity and app index are strict ints: "0" is not idle and -1 is not the last app
+        start = session.clock_in.timestamp()
+        for sample in (["0", "0", None], [0, "0", None], [0, 2, None], [0, 1, -1], [0, 1, "0"], [0, 1, True]):
+            response = self.post_batch({"work_session": session.id, "start": start, "apps": ["Code"], "samples": [sample]})
+            self.assertEqual(response.status_code, 400, sample)
+        response = self.client.post("/api/activity/", b"not gzip", content_type="application/json",
+                                    HTTP_CONTENT_ENCODING="gzip", **self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ActivitySample.objects.exists())
+
+    @mock.patch.object(activity_buffer, "max_pending", 2)
+    def test_failed_writes_are_kept_and_a_full_buffer_refuses_batches(self):
+        session = WorkSession.objects.create(employee=self.employee, clock_in=now() - timedelta(hours=1))
+        batch = {"work_session": session.id, "start": session.clock_in.timestamp(), "samples": [[0, 1, None], [5, 1, None]]}
+        with mock.patch.object(ActivitySample.objects, "bulk_create", side_effect=OperationalError):
+            with self.assertLogs("Timetracker.activity", "ERROR"):
+                response = self.post_batch(batch)
+            # Accepted: the samples are buffered, a retry would store them twice
+            self.assertEqual(response.status_code, 202)
+            response = self.post_batch(batch)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response["Retry-After"], str(settings.ACTIVITY_INGEST["RETRY_AFTER"]))
+        self.assertEqual(activity_buffer.flush(), 2)
+        self.assertEqual(ActivitySample.objects.count(), 2)
+
+
+class SyncEventsTests(APITestCase):
+
+    def sync(self, *events, device="laptop-1"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post("/api/sync/events/", {"device": device, "employee_id": self.employee.id,
+                                                           "events": list(events)},
+                                    content_type="application/json", **self.auth)
+
+    @mock.patch.object(activity_buffer, "max_size", 0)
+    def test_offline_log_is_applied_in_order_once(self):
+        clock_in = now().replace(microsecond=0) - timedelta(hours=3)
+        Screenshot.objects.create(work_session=WorkSession.objects.create(
+            employee=self.employee, clock_in=clock_in - timedelta(days=1), clock_out=clock_in - timedelta(hours=20)),
+            image_path="screenshots/ab/abc.png", content_hash="abc")
+        events = [
+            # Sent out of order: applied by sequence
+            {"sequence": 3, "type": "clock_out", "timestamp": (clock_in + timedelta(hours=2)).isoformat()},
+            {"sequence": 1, "type": "clock_in", "timestamp": clock_in.isoformat()},
+            {"sequence": 2, "type": "screenshot", "timestamp": (clock_in + timedelta(hours=1)).isoformat(), "sha256": "abc"},
+            {"sequence": 4, "type": "screenshot", "timestamp": clock_in.isoformat(), "sha256": "abc"},
+        ]
+        response = self.sync(*events)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["last_sequence"], 4)
+        self.assertEqual([(r["sequence"], r["status"]) for r in body["results"]],
+                         [(1, "applied"), (2, "applied"), (3, "applied"), (4, "rejected")])
+        self.assertEqual(body["results"][3]["error"], "No active session found")
+
+        session = WorkSession.objects.get(id=body["results"][0]["work_session"])
+        self.assertEqual((session.clock_in, session.duration), (clock_in, 7200))
+        self.assertEqual(session.screenshots.get().timestamp, clock_in + timedelta(hours=1))
+
+        # Resending the batch, plus a new event, applies only the new one
+        response = self.sync(*events, {"sequence": 5, "type": "clock_in", "timestamp": now().isoformat()},
+                             {"sequence": 6, "type": "activity", "timestamp": now().isoformat(),
+                              "start": now().timestamp(), "apps": ["Code"], "samples": [[0, 1, 0]]})
+        self.assertEqual([r["duplicate"] for r in response.json()["results"]], [True] * 4 + [False] * 2)
+        self.assertEqual(WorkSession.objects.filter(employee=self.employee).count(), 3)
+        self.assertEqual(ActivitySample.objects.get().work_session_id, response.json()["results"][4]["work_session"])
+        self.assertEqual(ClientEvent.objects.count(), 6)
+        response = self.client.get(f"/api/sync/events/?device=laptop-1&employee_id={self.employee.id}", **self.auth)
+        self.assertEqual(response.json()["last_sequence"], 6)
+
+    def test_logs_are_per_employee(self):
+        other = Employee.objects.create(user=User.objects.create_user("other"), job_title="QA")
+        self.sync({"sequence": 1, "type": "clock_in", "timestamp": now().isoformat()})
+        # Same device name and sequence, another employee: not a repeat
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/api/sync/events/", {"device": "laptop-1", "employee_id": other.id, "events": [
+                {"sequence": 1, "type": "clock_in", "timestamp": now().isoformat()}]},
+                content_type="application/json", **self.auth)
+        self.assertEqual([(r["status"], r["duplicate"]) for r in response.json()["results"]], [("applied", False)])
+        self.assertTrue(WorkSession.objects.filter(employee=other, is_open=True).exists())
+        response = self.client.get(f"/api/sync/events/?device=laptop-1&employee_id={other.id}", **self.auth)
+        self.assertEqual(response.json()["last_sequence"], 1)
+
+    def test_clock_ins_before_the_last_clock_out_are_rejected(self):
+        clock_out = now() - timedelta(hours=1)
+        WorkSession.objects.create(employee=self.employee, clock_in=clock_out - timedelta(hours=2), clock_out=clock_out)
+        response = self.sync(
+            {"sequence": 1, "type": "clock_in", "timestamp": (clock_out - timedelta(minutes=30)).isoformat()},
+            {"sequence": 2, "type": "clock_in", "timestamp": (clock_out + timedelta(minutes=5)).isoformat()},
+            {"sequence": 3, "type": "clock_out", "timestamp": (clock_out + timedelta(minutes=20)).isoformat()},
+            {"sequence": 4, "type": "clock_in", "timestamp": (clock_out + timedelta(minutes=10)).isoformat()})
+        results = response.json()["results"]
+        self.assertEqual([r["status"] for r in results], ["rejected", "applied", "applied", "rejected"])
+        self.assertEqual(results[0]["error"], "Clock-in is before the last clock-out")
+        self.assertEqual(WorkSession.objects.filter(employee=self.employee).count(), 2)
+
+    def test_screenshots_need_content_the_employee_uploaded(self):
+        other = WorkSession.objects.create(employee=Employee.objects.create(user=User.objects.create_user("other")),
+                                           clock_in=now() - timedelta(hours=1))
+        Screenshot.objects.create(work_session=other, image_path="screenshots/ab/abc.png", content_hash="abc")
+        response = self.sync({"sequence": 1, "type": "clock_in", "timestamp": now().isoformat()},
+                             {"sequence": 2, "type": "screenshot", "timestamp": now().isoformat(), "sha256": "abc"})
+        self.assertEqual(response.json()["results"][1]["error"], "Screenshot content not uploaded")
+        self.assertEqual(Screenshot.objects.count(), 1)
+
+    def test_malformed_batches_are_rejected(self):
+        self.assertEqual(self.sync().status_code, 400)
+        self.assertEqual(self.sync({"type": "clock_in"}).status_code, 400)
+        self.assertEqual(self.sync({"sequence": 1, "type": "clock_in"}, device="x" * 65).status_code, 400)
+        # A bad event is logged as rejected, the others still apply
+        response = self.sync({"sequence": 1, "type": "nap", "timestamp": now().isoformat()},
+                             {"sequence": 2, "type": "clock_in", "timestamp": "yesterday"},
+                             {"sequence": 3, "type": "clock_in", "timestamp": (now() + timedelta(hours=1)).isoformat()})
+        self.assertEqual([r["status"] for r in response.json()["results"]], ["rejected"] * 3)
+        self.assertFalse(WorkSession.objects.exists())
+
+
+@override_settings(ARCHIVE={"AFTER_DAYS": 30, "BATCH_SIZE": 500})
+class ArchiveFallbackTests(APITestCase):
+
+    def test_listings_include_archived_sessions(self):
+        self.create_sessions(3)
+        WorkSession.objects.bulk_create(
+            WorkSession(employee=self.employee, project=self.project, clock_in=now() - timedelta(days=40 + i),
+                        clock_out=now() - timedelta(days=40 + i) + timedelta(hours=1), is_open=None)
+            for i in range(3))
+        oldest = WorkSession.objects.order_by("clock_in").first()
+        Screenshot.objects.bulk_create(Screenshot(work_session=oldest, image_path="screenshots/a.png") for _ in range(2))
+        expected = list(WorkSession.objects.order_by("-clock_in").values_list("id", flat=True))
+        with self.assertLogs("Timetracker.archive", "WARNING"):  # No file behind the screenshots
+            archive_sessions()
+        self.assertEqual(WorkSession.objects.count(), 3)
+
+        seen, url = [], f"/api/worksession/{self.employee.id}/?page_size=2"
+        while url:
+            response = self.client.get(url, **self.auth)
+            seen += [session["id"] for session in response.json()]
+            url = response.headers.get("X-Next-Cursor") and f"{url.split('&cursor')[0]}&cursor={response['X-Next-Cursor']}"
+        self.assertEqual(seen, expected)
+
+        response = self.client.get(f"/api/screenshots/{oldest.id}/", **self.auth)
+        self.assertEqual(len(response.json()), 2)
+        # Signed for the cold storage
+        self.assertNotEqual(response.json()[0]["url"], screenshot_url("screenshots/a.png"))
+
+    def test_live_sessions_do_not_look_in_the_archive(self):
+        session = WorkSession.objects.create(employee=self.employee, clock_in=now())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/api/screenshots/{session.id}/", **self.auth)
+        self.assertEqual(response.json(), [])
+        self.assertFalse([query for query in queries if ArchivedScreenshot._meta.db_table in query["sql"]])
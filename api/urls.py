@@ -1,14 +1,23 @@
+from django.conf import settings
 from django.urls import path
+from . import async_views
 from .views import (
     list_create_projects, project_detail,
-    clock_in, clock_out, get_work_sessions,
-    upload_screenshot, get_screenshots, list_employees,
-    get_employee, login_api
+    clock_in, clock_out, clock_batch, sync_events, get_work_sessions, export_work_sessions,
+    upload_screenshot, init_screenshot_upload, screenshot_upload_chunk, commit_screenshot_upload,
+    get_screenshots, list_employees,
+    get_employee, list_employee_status, hours_report, ingest_activity, login_api, metrics_view, get_capture_policy
 )
 
+# Under ASGI, serve the hot desktop-client endpoints with native async views
+if settings.ASYNC_API:
+    clock_in, clock_out, upload_screenshot = (
+        async_views.clock_in, async_views.clock_out, async_views.upload_screenshot)
+
 urlpatterns = [
     path("employees/", list_employees, name="employee-list"),
     path("employees/<int:employee_id>/", get_employee, name="employee-detail"),
+    path("status/", list_employee_status, name="employee-status"),
 
     path("projects/", list_create_projects, name="project-list"),
     path("projects/<int:project_id>/", project_detail, name="project-detail"),
@@ -16,11 +25,27 @@ urlpatterns = [
     # WorkSessions
     path("worksession/clock-in/", clock_in, name="worksession-clockin"),
     path("worksession/clock-out/", clock_out, name="worksession-clockout"),
+    path("worksession/batch/", clock_batch, name="worksession-batch"),
+    path("sync/events/", sync_events, name="sync-events"),
+    path("worksession/export/", export_work_sessions, name="worksession-export"),
     path("worksession/<int:employee_id>/", get_work_sessions, name="worksession-list"),
 
     # Screenshots
     path("screenshots/upload/", upload_screenshot, name="screenshot-upload"),
+    path("screenshots/uploads/", init_screenshot_upload, name="screenshot-upload-init"),
+    path("screenshots/uploads/<uuid:upload_id>/", screenshot_upload_chunk, name="screenshot-upload-chunk"),
+    path("screenshots/uploads/<uuid:upload_id>/commit/", commit_screenshot_upload, name="screenshot-upload-commit"),
     path("screenshots/<int:session_id>/", get_screenshots, name="screenshot-list"),
+    path("capture-policy/", get_capture_policy, name="capture-policy"),
+
+    # Activity samples
+    path("activity/", ingest_activity, name="activity-ingest"),
+
+    # Reports
+    path("reports/hours/", hours_report, name="report-hours"),
 
     path("login/", login_api, name="login_api"),
+
+    # Prometheus scrape endpoint
+    path("metrics", metrics_view, name="metrics"),
 ]
\ No newline at end of file
@@ -1,12 +1,35 @@
-
-from django.http import JsonResponse
+import json
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F, Q, Sum
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from django.utils.http import parse_etags
 from django.utils.timezone import now
 from django.core.exceptions import ObjectDoesNotExist
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from Timetracker.models import Project, WorkSession, Screenshot, Employee
-from .serializers import ProjectSerializer, WorkSessionSerializer, ScreenshotSerializer, EmployeeSerializer
+from Timetracker import events as live_events, screenshots
+from Timetracker import status as employee_status
+from MercorTimetracker.db.router import read_from_replica, reading_from_replica
+from Timetracker.capture import LOAD_FULL, capture_policy, ingest_monitor, slowdown
+from Timetracker.activity import InvalidBatch, activity_buffer, decode_samples, decompress
+from Timetracker.exports import EXPORT_FORMATS, export_stream
+from Timetracker.archive import archive_enabled, archive_watermark
+from Timetracker.models import ArchivedScreenshot, ArchivedWorkSession, DailyHours, Project, WorkSession, Screenshot, ScreenshotUpload, Employee
+from Timetracker.queries import session_values, status_values
+from Timetracker.rollups import add_sessions
+from Timetracker.sync import apply_events, last_sequence, parse_events
+from .cache import response_cache
+from .metrics import metrics
+from .pagination import InvalidCursor, keyset_page, merge_pages, paginated_response
+from .renderers import render_json
+from .serializers import ProjectSerializer, WorkSessionSerializer, ScreenshotSerializer, EmployeeSerializer, work_session_rows, employee_status_rows
 from django.contrib.auth import authenticate
 
 
@@ -33,12 +56,59 @@ def login_api(request):
 
     return JsonResponse({"status": "failed", "error": "Invalid credentials"}, status=401)
 
+def cached_list_response(request, namespace, render):
+    """
+    Serve a list from response_cache: render() -> (body bytes, next cursor) only runs on a miss,
+    and a client sending the current ETag in If-None-Match gets a bodyless 304.
+    """
+    # A replica may not have the latest changes yet: don't keep what it returned for long
+    ttl = settings.REPLICA_STICKY_SECONDS if reading_from_replica() else None
+    entry = response_cache.get_or_render(namespace, request.get_full_path(), render, ttl)
+    if entry.etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry.body, content_type="application/json")
+    response["ETag"] = entry.etag
+    response["Cache-Control"] = "private, no-cache"  # Clients may keep it, but must revalidate
+    return paginated_response(response, request, entry.next_cursor)
+
+
 @api_view(["GET"])
+@read_from_replica
 def list_employees(request):
-    """ List all employees (Middleware already checks authentication) """
-    employees = Employee.objects.all()
-    serializer = EmployeeSerializer(employees, many=True)
-    return JsonResponse(serializer.data, safe=False, status=200)
+    """ List employees one page at a time (Middleware already checks authentication) """
+    def render():
+        employees, next_cursor = keyset_page(Employee.objects.select_related("user", "project"), request, ("id",))
+        serializer = EmployeeSerializer(employees, many=True)
+        return json.dumps(serializer.data, cls=DjangoJSONEncoder).encode(), next_cursor
+
+    try:
+        return cached_list_response(request, "employees", render)
+    except InvalidCursor as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+@api_view(["GET"])
+@read_from_replica
+def list_employee_status(request):
+    """
+    Who is working right now, one page at a time, from the EmployeeStatus table (see
+    Timetracker/status.py). ?stale=true only lists sessions not heard from for
+    EMPLOYEE_STATUS["STALE_AFTER"] seconds; ?all=true includes clocked-out employees.
+    """
+    stale_before = employee_status.stale_cutoff()
+    if request.query_params.get("stale") == "true":
+        queryset = employee_status.stale()
+    elif request.query_params.get("all") == "true":
+        queryset = None
+    else:
+        queryset = employee_status.working()
+
+    try:
+        rows, next_cursor = keyset_page(status_values(queryset), request, ("id",))
+    except InvalidCursor as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    response = HttpResponse(render_json(employee_status_rows(rows, stale_before)), content_type="application/json")
+    return paginated_response(response, request, next_cursor)
 
 @api_view(["GET"])
 def get_employee(request, employee_id):
@@ -55,9 +125,11 @@ def get_employee(request, employee_id):
 def list_create_projects(request):
     """ List all projects or create a new one """
     if request.method == "GET":
-        projects = Project.objects.all()
-        serializer = ProjectSerializer(projects, many=True)
-        return Response(serializer.data)
+        def render():
+            serializer = ProjectSerializer(Project.objects.all(), many=True)
+            return render_json(serializer.data), None
+
+        return cached_list_response(request, "projects", render)
 
     elif request.method == "POST":
         serializer = ProjectSerializer(data=request.data)
@@ -91,37 +163,84 @@ def project_detail(request, project_id):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+def get_client_ip(request):
+    """ Return the client IP, honouring X-Forwarded-For from the proxy """
+    ip_address = request.META.get("HTTP_X_FORWARDED_FOR")
+    if ip_address:
+        return ip_address.split(",")[0]
+    return request.META.get("REMOTE_ADDR")
+
+
+def get_idempotency_key(request):
+    """ Client-chosen key that makes a clock call safe to retry (Idempotency-Key header or idempotency_key field) """
+    key = request.headers.get("Idempotency-Key") or request.data.get("idempotency_key")
+    return str(key) if key else None
+
+
+def clock_in_data(session):
+    """ The new session, with the capture policy the client should follow during it """
+    return {**WorkSessionSerializer(session).data, "capture_policy": capture_policy(session.project_id)}
+
+
+def storage_full_response():
+    response = JsonResponse({"error": "Screenshot storage is full, retry later"}, status=503)
+    response["Retry-After"] = str(settings.CAPTURE_POLICY["RETRY_AFTER"])
+    return response
+
+
+def activity_backlog_response():
+    response = JsonResponse({"error": "Activity samples are backed up, retry later"}, status=503)
+    response["Retry-After"] = str(settings.ACTIVITY_INGEST["RETRY_AFTER"])
+    return response
+
+
+def add_slowdown_hint(response, load):
+    """ While ingest is backed up, ask the client to capture less often """
+    if slowdown(load) != 1:
+        response["X-Capture-Slowdown"] = str(slowdown(load))
+    return response
+
+
 @api_view(["POST"])
 def clock_in(request):
     """ Clock-in an employee to a work session """
     employee_id = request.data.get("employee_id")
     mac_address = request.data.get("mac_address")
+    key = get_idempotency_key(request)
+
+    if key and len(key) > 64:
+        return Response({"error": "Idempotency key is limited to 64 characters"}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        employee = Employee.objects.get(id=employee_id)
+        employee = Employee.objects.select_related("project").get(id=employee_id)
 
-        # Prevent duplicate clock-ins
-        if WorkSession.objects.filter(employee=employee, clock_out__isnull=True).exists():
-            return Response({"error": "Employee is already checked in"}, status=status.HTTP_400_BAD_REQUEST)
+        # A retried request gets back the session it already created
+        if key:
+            session = WorkSession.objects.select_related("project").filter(employee=employee, clock_in_key=key).first()
+            if session:
+                return Response(clock_in_data(session), status=status.HTTP_200_OK)
 
         project = employee.project if employee.project else None
 
-        ip_address = request.META.get("HTTP_X_FORWARDED_FOR")
-        if ip_address:
-            ip_address = ip_address.split(",")[0]
-        else:
-            ip_address = request.META.get("REMOTE_ADDR")
-
-        session = WorkSession.objects.create(
-            employee=employee,
-            project=project,
-            clock_in=now(),
-            ip_address=ip_address,
-            mac_address=mac_address
-        )
+        # Prevent duplicate clock-ins: the one_open_session_per_employee constraint rejects a
+        # second open session atomically, so concurrent double-clicks cannot both succeed
+        try:
+            with transaction.atomic():
+                session = WorkSession.objects.create(
+                    employee=employee,
+                    project=project,
+                    clock_in=now(),
+                    ip_address=get_client_ip(request),
+                    mac_address=mac_address,
+                    clock_in_key=key,
+                )
+        except IntegrityError:
+            session = WorkSession.objects.filter(employee=employee, clock_in_key=key).first() if key else None
+            if session:
+                return Response(clock_in_data(session), status=status.HTTP_200_OK)
+            return Response({"error": "Employee is already checked in"}, status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = WorkSessionSerializer(session)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return Response(clock_in_data(session), status=status.HTTP_201_CREATED)
 
     except ObjectDoesNotExist:
         return Response({"error": "Invalid employee"}, status=status.HTTP_404_NOT_FOUND)
@@ -130,41 +249,361 @@ def clock_in(request):
 def clock_out(request):
     """ Clock-out an employee from a work session """
     employee_id = request.data.get("employee_id")
-
-    try:
-        session = WorkSession.objects.filter(employee__id=employee_id, clock_out__isnull=True).first()
+    key = get_idempotency_key(request)
+
+    if key and len(key) > 64:
+        return Response({"error": "Idempotency key is limited to 64 characters"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # A retried request gets back the session it already closed
+    if key:
+        session = (WorkSession.objects.select_related("project")
+                   .filter(employee_id=employee_id, clock_out_key=key).first())
+        if session:
+            return Response(WorkSessionSerializer(session).data)
+
+    with transaction.atomic():
+        # Single lookup on the (employee, is_open) unique index; the row lock makes a
+        # concurrent clock-out wait and then find nothing left to close
+        session = (WorkSession.objects.select_for_update(of=("self",)).select_related("project")
+                   .filter(employee_id=employee_id, is_open=True).first())
         if not session:
             return Response({"error": "No active session found"}, status=status.HTTP_400_BAD_REQUEST)
 
         session.clock_out = now()
+        session.clock_out_key = key
         session.save()
-        serializer = WorkSessionSerializer(session)
-        return Response(serializer.data)
 
-    except ObjectDoesNotExist:
-        return Response({"error": "Employee not found"}, status=status.HTTP_404_NOT_FOUND)
+    serializer = WorkSessionSerializer(session)
+    return Response(serializer.data)
+
+
+def fill_created_ids(sessions):
+    """
+    bulk_create doesn't set primary keys without RETURNING (MySQL): read back those of the
+    sessions it created by their clock-in key, unique per employee (see key_created_sessions)
+    """
+    missing = {(session.employee_id, session.clock_in_key): session for session in sessions if session.pk is None}
+    if not missing:
+        return
+    for employee_id, key, session_id in (WorkSession.objects
+                                         .filter(employee_id__in={employee_id for employee_id, _ in missing},
+                                                 clock_in_key__in={key for _, key in missing})
+                                         .values_list("employee_id", "clock_in_key", "id")):
+        session = missing.get((employee_id, key))
+        if session is not None:
+            session.pk = session_id
+
+
+def key_created_sessions(sessions):
+    """ Give sessions created without an idempotency key one, so fill_created_ids() can find them """
+    if connections[router.db_for_write(WorkSession)].features.can_return_rows_from_bulk_insert:
+        return
+    for session in sessions:
+        session.clock_in_key = session.clock_in_key or f"batch:{uuid.uuid4().hex}"
+
+
+@api_view(["POST"])
+def clock_batch(request):
+    """
+    Clock-in / clock-out many employees in one call.
+
+    Expects {"events": [{"employee_id": 1, "action": "clock_in", "mac_address": "...", "idempotency_key": "..."}, ...]}.
+    Events are applied in order and the whole batch is written in one transaction;
+    the response holds one result per event, in the same order, with each session
+    shown as it stands after the whole batch.
+    """
+    events = request.data.get("events")
+    if not isinstance(events, list) or not events:
+        return Response({"error": "A non-empty list of events is required"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(events) > settings.CLOCK_BATCH_MAX_SIZE:
+        return Response({"error": f"At most {settings.CLOCK_BATCH_MAX_SIZE} events per batch"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    employee_ids = set()
+    for event in events:
+        if isinstance(event, dict) and str(event.get("employee_id", "")).isdigit():
+            employee_ids.add(int(event["employee_id"]))
+
+    keys = [str(event["idempotency_key"]) for event in events
+            if isinstance(event, dict) and event.get("idempotency_key")]
+
+    # One query for the employees, one for their currently open sessions
+    employees = Employee.objects.select_related("project").in_bulk(employee_ids)
+    open_sessions = {
+        session.employee_id: session
+        for session in WorkSession.objects.select_related("project").filter(employee_id__in=employee_ids, is_open=True)
+    }
+
+    # ...and one for events already applied by an earlier attempt of this batch
+    applied = {}
+    if keys:
+        for session in (WorkSession.objects.select_related("project").filter(employee_id__in=employee_ids)
+                        .filter(Q(clock_in_key__in=keys) | Q(clock_out_key__in=keys))):
+            applied[(session.employee_id, "clock_in", session.clock_in_key)] = session
+            applied[(session.employee_id, "clock_out", session.clock_out_key)] = session
+
+    timestamp = now()
+    ip_address = get_client_ip(request)
+    to_create, to_update = [], []
+    results = []
+
+    for index, event in enumerate(events):
+        event = event if isinstance(event, dict) else {}
+        employee_id = event.get("employee_id")
+        action = event.get("action")
+        employee = employees.get(int(employee_id)) if str(employee_id).isdigit() else None
+
+        if employee is None:
+            results.append({"index": index, "employee_id": employee_id, "status": "error", "error": "Invalid employee"})
+            continue
+
+        key = str(event["idempotency_key"]) if event.get("idempotency_key") else None
+        if key and len(key) > 64:
+            results.append({"index": index, "employee_id": employee.id, "status": "error",
+                            "error": "Idempotency key is limited to 64 characters"})
+            continue
+        if key and (employee.id, action, key) in applied:
+            results.append({"index": index, "employee_id": employee.id, "status": "duplicate",
+                            "session": applied[(employee.id, action, key)]})
+            continue
+
+        if action == "clock_in":
+            if employee.id in open_sessions:
+                results.append({"index": index, "employee_id": employee.id, "status": "error",
+                                "error": "Employee is already checked in"})
+                continue
+            session = WorkSession(
+                employee=employee,
+                project=employee.project,
+                clock_in=timestamp,
+                ip_address=ip_address,
+                mac_address=event.get("mac_address"),
+                clock_in_key=key,
+            )
+            open_sessions[employee.id] = session
+            applied[(employee.id, "clock_in", key)] = session
+            to_create.append(session)
+            results.append({"index": index, "employee_id": employee.id, "status": "clocked_in", "session": session})
+
+        elif action == "clock_out":
+            session = open_sessions.pop(employee.id, None)
+            if session is None:
+                results.append({"index": index, "employee_id": employee.id, "status": "error",
+                                "error": "No active session found"})
+                continue
+            # bulk_update skips WorkSession.save(), so the duration and open state are computed here
+            session.clock_out = timestamp
+            session.duration = int((session.clock_out - session.clock_in).total_seconds())
+            session.is_open = None
+            session.clock_out_key = key
+            applied[(employee.id, "clock_out", key)] = session
+            if session.pk:
+                to_update.append(session)
+            results.append({"index": index, "employee_id": employee.id, "status": "clocked_out", "session": session})
+
+        else:
+            results.append({"index": index, "employee_id": employee.id, "status": "error",
+                            "error": "Action must be 'clock_in' or 'clock_out'"})
+
+    try:
+        with transaction.atomic():
+            if to_create:
+                key_created_sessions(to_create)
+                WorkSession.objects.bulk_create(to_create)
+                fill_created_ids(to_create)
+            if to_update:
+                WorkSession.objects.bulk_update(to_update, ["clock_out", "duration", "is_open", "clock_out_key"])
+            # bulk writes skip WorkSession.save(), so the rollups are updated here
+            add_sessions(session for session in to_create + to_update if session.clock_out)
+            # ...and so are the employee statuses and live dashboard events
+            employee_status.sessions_changed(to_create + to_update)
+            live_events.sessions_changed(session.pk for session in to_create + to_update if session.pk)
+    except IntegrityError:
+        # Another request clocked one of these employees in or out meanwhile; nothing was
+        # written, and retrying with the same idempotency keys is safe
+        return Response({"error": "Conflicting clock change, retry the batch"}, status=status.HTTP_409_CONFLICT)
+
+    for result in results:
+        if "session" in result:
+            result["session"] = WorkSessionSerializer(result["session"]).data
+
+    return Response({"results": results})
+
+
+@api_view(["GET", "POST"])
+def sync_events(request):
+    """
+    Event log of offline desktop clients (see Timetracker/sync.py for the format).
+    GET ?employee_id=&device= returns the last sequence logged for an employee's device. POST logs
+    and applies a batch of events, optionally gzip or deflate compressed, and answers with one
+    result per event.
+    """
+    if request.method == "GET":
+        device = request.query_params.get("device")
+        if not device:
+            return Response({"error": "device is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            employee = Employee.objects.get(id=request.query_params.get("employee_id"))
+        except (ObjectDoesNotExist, ValueError, TypeError):
+            return Response({"error": "Invalid employee"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"device": device, "last_sequence": last_sequence(employee, device)})
+
+    config = settings.CLIENT_SYNC
+    try:
+        batch = json.loads(decompress(request.body, request.headers.get("Content-Encoding"), config["MAX_BODY_SIZE"]))
+        if not isinstance(batch, dict):
+            raise InvalidBatch("Body must be a JSON object")
+        device = batch.get("device")
+        if not isinstance(device, str) or not 0 < len(device) <= 64:
+            raise InvalidBatch("device must be a string of at most 64 characters")
+        events = parse_events(batch.get("events"), config["MAX_EVENTS"])
+    except InvalidBatch as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except ValueError:
+        return Response({"error": "Body must be a JSON object"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        employee = Employee.objects.select_related("project").get(id=batch.get("employee_id"))
+    except (ObjectDoesNotExist, ValueError, TypeError):
+        return Response({"error": "Invalid employee"}, status=status.HTTP_404_NOT_FOUND)
+
+    if activity_buffer.full():
+        return activity_backlog_response()
+    try:
+        results = apply_events(device, employee, events, get_client_ip(request),
+                               settings.ACTIVITY_INGEST["MAX_SAMPLES"])
+    except IntegrityError:
+        # Another request is syncing the same events; nothing was written, resending is safe
+        return Response({"error": "Conflicting sync of this device, retry the batch"}, status=status.HTTP_409_CONFLICT)
+
+    return Response({"device": device, "last_sequence": last_sequence(employee, device), "results": results})
 
 
 @api_view(["GET"])
+@read_from_replica
 def get_work_sessions(request, employee_id):
-    """ Get all work sessions for an employee, or return the most recent X sessions if 'limit' is provided """
+    """
+    Get an employee's work sessions, most recent first, one page at a time.
+    'page_size' (or 'limit') sets the page size; 'cursor' continues from a previous page.
+    Pages reaching back past the archive watermark include archived sessions.
+    """
     try:
         employee = Employee.objects.get(id=employee_id)
     except ObjectDoesNotExist:
         return Response({"error": "Employee not found"}, status=status.HTTP_404_NOT_FOUND)
 
-    # Get the 'limit' parameter from the request (optional)
-    limit = request.query_params.get("limit")
+    key = ("clock_in", "id")
+    try:
+        sessions, next_cursor = keyset_page(session_values(WorkSession.objects.filter(employee=employee)),
+                                            request, key, descending=True)
+        watermark = archive_watermark()
+        # Archived sessions are all older than the watermark: only pages reaching it need the archive
+        if watermark and (next_cursor is None or sessions[-1]["clock_in"] < watermark):
+            archived = keyset_page(session_values(ArchivedWorkSession.objects.filter(employee=employee)),
+                                   request, key, descending=True)
+            sessions, next_cursor = merge_pages([(sessions, next_cursor), archived], request, key, descending=True)
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Same bytes as WorkSessionSerializer through DRF's JSONRenderer, without a model instance
+    # or serializer field per row
+    body = render_json(work_session_rows(sessions))
+    return paginated_response(HttpResponse(body, content_type="application/json"), request, next_cursor)
+
 
-    # Fetch work sessions, ordered by most recent first
-    sessions = WorkSession.objects.filter(employee=employee).order_by("-clock_in")
+@api_view(["GET"])
+def export_work_sessions(request):
+    """
+    Stream work sessions as CSV or NDJSON ('output' = csv | ndjson) for payroll.
+
+    Optional filters: 'start' / 'end' (YYYY-MM-DD, on clock-in), 'project' and 'employee' ids.
+    Rows are read from the database in chunks and written out as they come, so memory stays
+    flat however large the export is. Add 'gzip=1' for a gzipped file (Accept-Encoding is ignored:
+    clients send it by default and expect the CSV back).
+    """
+    output_format = request.query_params.get("output", "csv")
+    if output_format not in EXPORT_FORMATS:
+        return Response({"error": f"output must be one of: {', '.join(EXPORT_FORMATS)}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    filters = {}
+    for param in ("start", "end"):
+        value = request.query_params.get(param)
+        if value:
+            filters[param] = parse_date(value)
+            if filters[param] is None:
+                return Response({"error": f"'{param}' must be a date (YYYY-MM-DD)"}, status=status.HTTP_400_BAD_REQUEST)
+    for param in ("project", "employee"):
+        value = request.query_params.get(param)
+        if value:
+            if not value.isdigit():
+                return Response({"error": f"'{param}' must be an id"}, status=status.HTTP_400_BAD_REQUEST)
+            filters[f"{param}_id"] = int(value)
+
+    compress = request.query_params.get("gzip") == "1"
+
+    response = StreamingHttpResponse(
+        export_stream(output_format=output_format, compress=compress, **filters),
+        content_type="text/csv" if output_format == "csv" else "application/x-ndjson",
+    )
+    filename = f"work_sessions.{output_format}"
+    if compress:
+        # Sent as a .gz attachment rather than Content-Encoding so proxies and GZipMiddleware leave it alone
+        filename += ".gz"
+        response["Content-Type"] = "application/gzip"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+### --- Report Endpoints ---
+# Output column -> rollup field, per group_by option
+REPORT_GROUPS = {
+    "employee": {"employee_id": "employee_id", "username": "employee__user__username"},
+    "project": {"project_id": "project_id", "project_name": "project__name"},
+    "day": {"day": "day"},
+}
 
-    # Apply limit if specified and valid
-    if limit and limit.isdigit():
-        sessions = sessions[:int(limit)]
 
-    serializer = WorkSessionSerializer(sessions, many=True)
-    return Response(serializer.data)
+@api_view(["GET"])
+@read_from_replica
+def hours_report(request):
+    """
+    Total worked time between 'start' and 'end' (YYYY-MM-DD, inclusive), read from the
+    DailyHours rollups so the cost does not depend on how many sessions were worked.
+
+    'group_by' is a comma separated list of employee, project and day (default: employee),
+    and 'employee' / 'project' ids narrow the report. Open sessions are not counted.
+    """
+    start = parse_date(request.query_params.get("start", "") or "")
+    end = parse_date(request.query_params.get("end", "") or "")
+    if not start or not end or start > end:
+        return Response({"error": "Valid 'start' and 'end' dates (YYYY-MM-DD) are required"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    group_by = [group for group in request.query_params.get("group_by", "employee").split(",") if group]
+    if not group_by or any(group not in REPORT_GROUPS for group in group_by):
+        return Response({"error": f"group_by must be made of: {', '.join(REPORT_GROUPS)}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    rows = DailyHours.objects.filter(day__range=(start, end))
+    for param in ("employee", "project"):
+        value = request.query_params.get(param)
+        if value:
+            if not value.isdigit():
+                return Response({"error": f"'{param}' must be an id"}, status=status.HTTP_400_BAD_REQUEST)
+            rows = rows.filter(**{f"{param}_id": int(value)})
+
+    columns = {column: field for group in group_by for column, field in REPORT_GROUPS[group].items()}
+    plain = [column for column, field in columns.items() if column == field]
+    renamed = {column: F(field) for column, field in columns.items() if column != field}
+    rows = rows.values(*plain, **renamed).annotate(seconds=Sum("seconds")).order_by(*columns)
+
+    results = []
+    for row in rows:
+        row["hours"] = round(row["seconds"] / 3600, 2)
+        results.append(row)
+
+    return Response({"start": start, "end": end, "group_by": group_by, "results": results})
 
 
 ### --- Screenshot Endpoints ---
@@ -174,6 +613,10 @@ def upload_screenshot(request):
 
     work_session_id = request.data.get("work_session")
 
+    load = ingest_monitor.state()
+    if load == LOAD_FULL:
+        return storage_full_response()
+
     try:
         work_session = WorkSession.objects.get(id=work_session_id)
     except ObjectDoesNotExist:
@@ -184,23 +627,218 @@ def upload_screenshot(request):
         return Response({"error": "No image file provided"}, status=status.HTTP_400_BAD_REQUEST)
 
     uploaded_file = request.FILES["image_path"]
-    file_path = f"media/screenshots/{uploaded_file.name}"  # Save in media/screenshots/
 
-    # Save file to media folder
-    with open(file_path, "wb") as f:
-        for chunk in uploaded_file.chunks():
-            f.write(chunk)
+    # Save file into the content-addressed store (identical images are stored once)
+    content_hash, file_path = screenshots.store_uploaded_file(uploaded_file)
 
     # Save the screenshot record
-    screenshot = Screenshot.objects.create(work_session=work_session, image_path=file_path)
+    Screenshot.objects.create(work_session=work_session, image_path=file_path, content_hash=content_hash)
+
+    return add_slowdown_hint(Response({"message": "Screenshot uploaded successfully!", "file_path": file_path},
+                                      status=status.HTTP_201_CREATED), load)
+
+
+def _upload_state(upload):
+    return {
+        "upload_id": str(upload.upload_id),
+        "offset": upload.received_size,
+        "total_size": upload.total_size,
+        "chunk_size": settings.SCREENSHOT_UPLOAD_CHUNK_SIZE,
+    }
+
+
+@api_view(["POST"])
+def init_screenshot_upload(request):
+    """
+    Start a chunked screenshot upload.
+
+    Expects {"work_session": 1, "size": 123456, "sha256": "...", "filename": "shot.png"}.
+    The optional sha256 is checked at commit. Content is only deduplicated once its bytes were
+    received and hashed, so knowing the hash of a stored image gives no access to it.
+    """
+    work_session_id = request.data.get("work_session")
+    size = str(request.data.get("size", ""))
+    sha256 = str(request.data.get("sha256") or "").lower()
+    filename = str(request.data.get("filename") or "")[:255]
+
+    load = ingest_monitor.state()
+    if load == LOAD_FULL:
+        return storage_full_response()
+
+    try:
+        work_session = WorkSession.objects.get(id=work_session_id)
+    except (ObjectDoesNotExist, ValueError):
+        return Response({"error": "Invalid work session ID"}, status=status.HTTP_404_NOT_FOUND)
+
+    if not size.isdigit() or not 0 < int(size) <= settings.SCREENSHOT_MAX_SIZE:
+        return Response({"error": f"Size must be between 1 and {settings.SCREENSHOT_MAX_SIZE} bytes"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    upload = ScreenshotUpload.objects.create(
+        work_session=work_session,
+        filename=filename,
+        total_size=int(size),
+        sha256=sha256,
+    )
+    return add_slowdown_hint(Response(_upload_state(upload), status=status.HTTP_201_CREATED), load)
+
+
+@api_view(["GET"])
+def get_capture_policy(request):
+    """ Capture policy for the project of a work session ('work_session'), or the defaults without one """
+    work_session_id = request.query_params.get("work_session")
+    project_id = None
+    if work_session_id:
+        try:
+            project_id = WorkSession.objects.values_list("project_id", flat=True).get(id=work_session_id)
+        except (ObjectDoesNotExist, ValueError):
+            return Response({"error": "Invalid work session ID"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(capture_policy(project_id))
+
+
+@api_view(["GET", "PUT"])
+def screenshot_upload_chunk(request, upload_id):
+    """
+    GET returns the current offset so an interrupted upload can resume.
+    PUT appends the raw request body at the offset given by the "Upload-Offset" header.
+    """
+    if request.method == "GET":
+        try:
+            upload = ScreenshotUpload.objects.get(upload_id=upload_id)
+        except ObjectDoesNotExist:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(_upload_state(upload))
+
+    offset = request.headers.get("Upload-Offset", "")
+    if not offset.isdigit():
+        return Response({"error": "Upload-Offset header required"}, status=status.HTTP_400_BAD_REQUEST)
+    offset = int(offset)
+
+    chunk = request.body
+    if len(chunk) > settings.SCREENSHOT_UPLOAD_CHUNK_SIZE:
+        return Response({"error": f"Chunks are limited to {settings.SCREENSHOT_UPLOAD_CHUNK_SIZE} bytes"},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    if ingest_monitor.state() == LOAD_FULL:
+        return storage_full_response()
+
+    with transaction.atomic():
+        try:
+            upload = ScreenshotUpload.objects.select_for_update().get(upload_id=upload_id)
+        except ObjectDoesNotExist:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        if offset > upload.received_size:
+            # A chunk went missing, tell the client where to resume from
+            return Response(_upload_state(upload), status=status.HTTP_409_CONFLICT)
+
+        # Retried chunks may overlap bytes we already have, only keep the new part
+        chunk = chunk[upload.received_size - offset:]
+        if upload.received_size + len(chunk) > upload.total_size:
+            return Response({"error": "Chunk exceeds the announced size"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if chunk:
+            # Each chunk is its own object in the screenshot storage, so any web node can
+            # receive the next one and object stores (which cannot append) work too
+            screenshots.save_chunk(upload.upload_id, upload.received_size, chunk)
+            upload.received_size += len(chunk)
+            upload.save(update_fields=["received_size"])
+
+    return Response(_upload_state(upload))
+
+
+@api_view(["POST"])
+def commit_screenshot_upload(request, upload_id):
+    """ Verify a completed chunked upload and record it as a screenshot """
+    with transaction.atomic():
+        try:
+            upload = ScreenshotUpload.objects.select_for_update().get(upload_id=upload_id)
+        except ObjectDoesNotExist:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        if upload.received_size != upload.total_size:
+            return Response(_upload_state(upload), status=status.HTTP_409_CONFLICT)
+
+        with tempfile.TemporaryFile() as assembled:
+            content_hash = screenshots.assemble_chunks(upload.upload_id, assembled)
+            if upload.sha256 and upload.sha256 != content_hash:
+                # Corrupted upload: start over
+                screenshots.delete_chunks(upload.upload_id)
+                upload.delete()
+                return Response({"error": "Checksum mismatch"}, status=status.HTTP_400_BAD_REQUEST)
+
+            file_path = screenshots.find_blob(content_hash)
+            if not file_path:
+                file_path = screenshots.store_blob(assembled, content_hash, screenshots.image_extension(upload.filename))
+
+        screenshots.delete_chunks(upload.upload_id)
+        Screenshot.objects.create(work_session=upload.work_session, image_path=file_path, content_hash=content_hash)
+        upload.delete()
 
     return Response({"message": "Screenshot uploaded successfully!", "file_path": file_path},
                     status=status.HTTP_201_CREATED)
 
 
 @api_view(["GET"])
+@read_from_replica
 def get_screenshots(request, session_id):
-    """ Get all screenshots for a specific work session """
-    screenshots = Screenshot.objects.filter(work_session__id=session_id)
-    serializer = ScreenshotSerializer(screenshots, many=True)
-    return Response(serializer.data)
\ No newline at end of file
+    """
+    Get the screenshots of a work session in the order they were taken, one page at a time
+    (from the archive when the session was archived)
+    """
+    try:
+        shots, next_cursor = keyset_page(Screenshot.objects.filter(work_session__id=session_id),
+                                         request, ("timestamp", "id"))
+        # Only a session that is no longer live can have been archived, and then all its screenshots were
+        if not shots and archive_enabled() and not WorkSession.objects.filter(id=session_id).exists():
+            shots, next_cursor = keyset_page(ArchivedScreenshot.objects.filter(work_session__id=session_id),
+                                             request, ("timestamp", "id"))
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = ScreenshotSerializer(shots, many=True)
+    return paginated_response(Response(serializer.data), request, next_cursor)
+
+### --- Activity Endpoints ---
+@api_view(["POST"])
+def ingest_activity(request):
+    """
+    Accept a batch of activity samples for a work session (see Timetracker/activity.py for the
+    format), optionally gzip or deflate compressed. Samples are buffered and written in bulk, so
+    they may take a few seconds to show up.
+    """
+    config = settings.ACTIVITY_INGEST
+    if activity_buffer.full():
+        return activity_backlog_response()
+    try:
+        batch = json.loads(decompress(request.body, request.headers.get("Content-Encoding"), config["MAX_BODY_SIZE"]))
+    except InvalidBatch as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except ValueError:
+        return Response({"error": "Body must be a JSON object"}, status=status.HTTP_400_BAD_REQUEST)
+    if not isinstance(batch, dict):
+        return Response({"error": "Body must be a JSON object"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        work_session = WorkSession.objects.get(id=batch.get("work_session"))
+    except (ObjectDoesNotExist, ValueError, TypeError):
+        return Response({"error": "Invalid work session ID"}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        samples, rejected = decode_samples(batch, work_session, config["MAX_SAMPLES"])
+    except InvalidBatch as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    activity_buffer.add(samples)
+    if samples:
+        # Activity keeps the session from looking abandoned
+        employee_status.session_seen(work_session.id, max(sample.timestamp for sample in samples))
+    return Response({"accepted": len(samples), "rejected": rejected}, status=status.HTTP_202_ACCEPTED)
+
+
+### --- Monitoring ---
+
+@api_view(["GET"])
+def metrics_view(request):
+    """ Per-endpoint request metrics of this worker in the Prometheus text format (API token required) """
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")